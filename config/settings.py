@@ -52,6 +52,8 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "simple_history.middleware.HistoryRequestMiddleware",  # For tracking user in history
+    "samples.middleware.MetricsMiddleware",  # Request latency and DB metrics
+    "samples.middleware.ReplicaRoutingMiddleware",  # Read-only views use the replica
 ]
 
 ROOT_URLCONF = "config.urls"
@@ -60,8 +62,17 @@ TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
         "DIRS": [BASE_DIR / "samples" / "templates"],
-        "APP_DIRS": True,
         "OPTIONS": {
+            # Compiled templates are kept in memory (reloaded on change under runserver)
+            "loaders": [
+                (
+                    "django.template.loaders.cached.Loader",
+                    [
+                        "django.template.loaders.filesystem.Loader",
+                        "django.template.loaders.app_directories.Loader",
+                    ],
+                ),
+            ],
             "context_processors": [
                 "django.template.context_processors.debug",
                 "django.template.context_processors.request",
@@ -87,6 +98,33 @@ DATABASES = {
     }
 }
 
+# Optional read replica, e.g. a SQLite copy of db.sqlite3 kept fresh with
+# `python manage.py refresh_replica --interval 30`. A second local Postgres
+# works too: define DATABASES["replica"] with its connection details.
+DATABASE_REPLICA_NAME = config('DATABASE_REPLICA_NAME', default='')
+if DATABASE_REPLICA_NAME:
+    DATABASES["replica"] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": DATABASE_REPLICA_NAME,
+        "TEST": {"MIRROR": "default"},
+    }
+
+DATABASE_ROUTERS = ["samples.routers.ReadReplicaRouter"]
+
+# Views whose GET requests may read from the replica
+REPLICA_READ_VIEWS = [
+    "home", "sample_list", "sample_detail", "export_samples", "export_samples_csv",
+    "api_sample_list", "api_sample_detail", "api_sample_autocomplete",
+]
+
+# After a POST the session reads from primary for this long (seconds);
+# keep it above the replica refresh interval
+REPLICA_STICKY_SECONDS = 60
+
+# PRAGMAs applied to every new SQLite connection (see samples/db.py).
+# Left empty in development; settings_production enables the tuned profile.
+SQLITE_PRAGMAS = {}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -152,5 +190,59 @@ LOGIN_URL = "login"
 LOGIN_REDIRECT_URL = "home"
 LOGOUT_REDIRECT_URL = "login"
 
+# Cache
+# Page fragments are versioned by a counter stored in the cache itself, so
+# use a backend shared by all workers (file-based) when running several.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "stemcell-bank",
+    }
+}
+PAGE_CACHE_TIMEOUT = 300  # seconds; bounds "x minutes ago" staleness
+
+# Live dashboard (Server-Sent Events, ASGI only): how often each open
+# dashboard checks the data version, and how long one stream lasts before
+# the browser reconnects
+DASHBOARD_EVENTS_POLL_SECONDS = 2
+DASHBOARD_EVENTS_MAX_SECONDS = 300
+
+# Days of daily inventory snapshots shown on the dashboard trend chart
+# (kept up to date by the update_inventory_snapshots command)
+INVENTORY_TREND_DAYS = 730
+
+# Depletion forecasts (update_depletion_forecasts command): days of use the
+# rates are fitted on, and how far ahead the dashboard lists samples
+DEPLETION_FORECAST_WINDOW_DAYS = 180
+DEPLETION_FORECAST_HORIZON_DAYS = 90
+
+# Largest image accepted, in pixels, checked before it is decoded (a
+# 50-megapixel microscope image fits)
+IMAGE_MAX_PIXELS = 80_000_000
+
+# Worker processes compressing images in a bulk image import; 0 uses one
+# per CPU
+IMAGE_IMPORT_WORKERS = config('IMAGE_IMPORT_WORKERS', default=0, cast=int)
+
+# Largest file in an imported ZIP, uncompressed; bigger ones are refused
+# before they are extracted
+IMAGE_IMPORT_MAX_FILE_SIZE = 512 * 1024 * 1024
+
+# Sample attachments (certificates, karyotypes, sequencing reports). They
+# are stored outside MEDIA_ROOT so only staff can download them, and are
+# uploaded in chunks no larger than ATTACHMENT_CHUNK_SIZE, which keeps each
+# request under the host's request size limit
+ATTACHMENT_ROOT = config('ATTACHMENT_ROOT', default=str(BASE_DIR / 'attachments'))
+ATTACHMENT_CHUNK_SIZE = 8 * 1024 * 1024
+ATTACHMENT_MAX_SIZE = 2 * 1024 ** 3
+# Unfinished uploads untouched this long are removed by cleanup_attachments
+ATTACHMENT_UPLOAD_EXPIRY_HOURS = 48
+
 # Simple History settings
 SIMPLE_HISTORY_HISTORY_CHANGE_REASON_USE_TEXT_FIELD = True
+
+# Metrics settings
+# Directory shared by all worker processes; leave empty for single-process mode
+METRICS_DIR = config('METRICS_DIR', default='')
+METRICS_FLUSH_INTERVAL = 5  # seconds between per-process metric dumps
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
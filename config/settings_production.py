@@ -17,14 +17,67 @@ SECURE_BROWSER_XSS_FILTER = True
 SECURE_CONTENT_TYPE_NOSNIFF = True
 X_FRAME_OPTIONS = 'DENY'
 
+# Database profile for several web workers plus exports sharing one SQLite file:
+# keep connections open between requests and let writers wait for the lock
+# instead of failing with "database is locked"
+DATABASES['default']['CONN_MAX_AGE'] = 600
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+DATABASES['default']['OPTIONS'] = {'timeout': 20}
+if 'replica' in DATABASES:
+    DATABASES['replica']['CONN_MAX_AGE'] = 600
+    DATABASES['replica']['CONN_HEALTH_CHECKS'] = True
+    DATABASES['replica']['OPTIONS'] = {'timeout': 20}
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',        # readers do not block the writer (persistent)
+    'busy_timeout': 20000,        # ms to wait for a lock before erroring
+    'synchronous': 'NORMAL',      # safe with WAL, avoids an fsync per commit
+    'mmap_size': 268435456,       # 256 MB memory-mapped reads
+    'cache_size': -32000,         # 32 MB page cache (negative = KiB)
+    'temp_store': 'MEMORY',       # sorts and temp indexes in RAM
+}
+
+# Sessions and messages in signed cookies, so logging in and out and the
+# notices after saving a sample do not write to the SQLite file the
+# inventory is written to. Anyone who knows SECRET_KEY could forge these
+# sessions, so with the development default key they stay in the database
+# (read through the shared cache).
+if SECRET_KEY.startswith('django-insecure-'):
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+else:
+    SESSION_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
 # Static files configuration for PythonAnywhere
 STATIC_URL = '/static/'
 STATIC_ROOT = '/home/whitesong/StemCellResourceBank_v0/staticfiles'
 
+# Fingerprinted file names (base.3f2a9c.css) so browsers can cache static
+# assets forever; run collectstatic after every deploy
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.ManifestStaticFilesStorage',
+    },
+}
+
 # Media files configuration for PythonAnywhere
 MEDIA_URL = '/media/'
 MEDIA_ROOT = '/home/whitesong/StemCellResourceBank_v0/media'
 
+# File-based cache so all web workers share cached pages and the data version
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': '/home/whitesong/StemCellResourceBank_v0/cache',
+    }
+}
+
+# Metrics shared across web workers
+METRICS_DIR = '/home/whitesong/StemCellResourceBank_v0/metrics'
+
 # Optional: Generate a new secret key for production
 # You can generate one at: https://djecrety.ir/
 # SECRET_KEY = 'your-new-secret-key-here'
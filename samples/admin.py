@@ -1,11 +1,106 @@
+from datetime import timedelta
+
 from django.contrib import admin
+from django.db.models import F, Max, Min, Q, QuerySet
+from django.utils import timezone
 from django.utils.html import format_html
+from django.utils.translation import gettext as _
 from simple_history.admin import SimpleHistoryAdmin
-from .models import Sample, SiteSettings
+from .models import (
+    AttachmentBlob, DepletionForecast, InventorySnapshot, Sample, SampleAttachment, SampleIdSequence,
+    SampleTransaction, SiteSettings, UploadSession,
+)
+from .pagination import EstimatedCountPaginator
+from .search import SEARCH_FIELDS, normalize_search
+from .sequences import assign_sample_id
+
+
+# The folded search column's fields, plus source: the sample list does not
+# search it, so it is matched here with icontains, as typed and folded
+ADMIN_SEARCH_FIELDS = (*SEARCH_FIELDS, 'source')
+
+
+def sample_search(search_term):
+    """Q for samples whose folded search text or source contains the term"""
+    folded = normalize_search(search_term)
+    return Q(search_text__contains=folded) | Q(source__icontains=search_term) | Q(source__icontains=folded)
+
+
+def matching_sample_ids(search_term):
+    """Subquery of sample pks matching the term (see sample_search)"""
+    return Sample.objects.filter(sample_search(search_term)).values('pk')
+
+
+def next_period(start, kind):
+    if kind == 'year':
+        return start.replace(year=start.year + 1)
+    if kind == 'month':
+        return start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+    return start + timedelta(days=1)
+
+
+class DateDrilldownQuerySet(QuerySet):
+    """QuerySet that answers the admin's date_hierarchy from the date index
+
+    The drill-down lists the years, months or days that have rows with
+    ``SELECT DISTINCT trunc(date)`` and picks its starting level with
+    ``SELECT MIN(date), MAX(date)``, and both read every matching row (the
+    first one converting each date to local time). Here each period costs
+    one ``ORDER BY date LIMIT 1`` seek from the start of the next period,
+    and MIN and MAX are one seek each.
+    """
+    
+    def aggregate(self, *args, **kwargs):
+        fields = {
+            alias: aggregate.source_expressions[0].name
+            for alias, aggregate in kwargs.items()
+            if isinstance(aggregate, (Min, Max)) and not aggregate.filter
+            and isinstance(aggregate.source_expressions[0], F)
+        }
+        if args or not kwargs or len(fields) != len(kwargs):
+            return super().aggregate(*args, **kwargs)
+        return {
+            alias: self.filter(**{f'{name}__isnull': False})
+                       .order_by(name if isinstance(kwargs[alias], Min) else f'-{name}')
+                       .values_list(name, flat=True).first()
+            for alias, name in fields.items()
+        }
+    
+    def datetimes(self, field_name, kind, order='ASC', tzinfo=None, is_dst=None):
+        if kind not in ('year', 'month', 'day'):
+            return super().datetimes(field_name, kind, order, tzinfo, is_dst)
+        values = self.order_by(field_name).values_list(field_name, flat=True)
+        periods = []
+        value = values.filter(**{f'{field_name}__isnull': False}).first()
+        while value is not None:
+            if timezone.is_aware(value):
+                value = timezone.localtime(value, tzinfo)
+            start = value.replace(hour=0, minute=0, second=0, microsecond=0)
+            if kind in ('year', 'month'):
+                start = start.replace(day=1)
+            if kind == 'year':
+                start = start.replace(month=1)
+            periods.append(start)
+            value = values.filter(**{f'{field_name}__gte': next_period(start, kind)}).first()
+        return periods if order == 'ASC' else periods[::-1]
+
+
+class LargeTableAdminMixin:
+    """Admin settings for tables with millions of rows
+
+    No full COUNT(*) for the result count or pagination, and an indexed
+    date_hierarchy drill-down.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return DateDrilldownQuerySet(model=queryset.model, query=queryset.query, using=queryset._db)
 
 
 @admin.register(Sample)
-class SampleAdmin(SimpleHistoryAdmin):
+class SampleAdmin(LargeTableAdminMixin, SimpleHistoryAdmin):
     list_display = (
         'sample_id', 
         'name', 
@@ -16,8 +111,10 @@ class SampleAdmin(SimpleHistoryAdmin):
         'created_by',
         'created_at'
     )
-    list_filter = ('sample_type', 'status', 'research_use_only', 'created_at')
-    search_fields = ('sample_id', 'name', 'description', 'source', 'storage_location')
+    list_filter = ('sample_type', 'status', 'research_use_only')
+    list_select_related = ('created_by',)
+    date_hierarchy = 'created_at'
+    search_fields = ADMIN_SEARCH_FIELDS
     readonly_fields = ('created_at', 'updated_at', 'created_by')
     
     fieldsets = (
@@ -45,9 +142,25 @@ class SampleAdmin(SimpleHistoryAdmin):
         }),
     )
     
+    def get_search_results(self, request, queryset, search_term):
+        # The folded search column (see search.py) and source instead of an
+        # icontains per search field
+        if not search_term.strip():
+            return queryset, False
+        return queryset.filter(sample_search(search_term.strip())), False
+    
+    def get_form(self, request, obj=None, **kwargs):
+        form = super().get_form(request, obj, **kwargs)
+        if obj is None and 'sample_id' in form.base_fields:
+            # Left blank, save_model assigns the next ID of the type (see sequences.py)
+            form.base_fields['sample_id'].required = False
+            form.base_fields['sample_id'].help_text = _('Leave blank for the next ID, e.g., IPSC-2024-001')
+        return form
+    
     def save_model(self, request, obj, form, change):
         if not change:  # If creating a new object
             obj.created_by = request.user
+            assign_sample_id(obj)
         super().save_model(request, obj, form, change)
 
 
@@ -56,7 +169,7 @@ from samples.models import Sample
 HistoricalSample = Sample.history.model
 
 @admin.register(HistoricalSample)
-class HistoricalSampleAdmin(admin.ModelAdmin):
+class HistoricalSampleAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     """Admin view for all sample history including deleted samples"""
     list_display = (
         'sample_id',
@@ -65,11 +178,24 @@ class HistoricalSampleAdmin(admin.ModelAdmin):
         'history_user',
         'history_date',
     )
-    list_filter = ('history_type', 'sample_type', 'status', 'history_date')
-    search_fields = ('sample_id', 'name', 'description')
+    list_filter = ('history_type', 'sample_type', 'status')
+    list_select_related = ('history_user',)
+    date_hierarchy = 'history_date'
+    search_fields = ADMIN_SEARCH_FIELDS
     readonly_fields = [field.name for field in HistoricalSample._meta.fields]
     ordering = ('-history_date',)
     
+    def get_search_results(self, request, queryset, search_term):
+        # History rows have no search column: match live samples on theirs,
+        # plus deleted ones by sample ID prefix (an index range scan)
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        return queryset.filter(
+            Q(id__in=matching_sample_ids(term))
+            | Q(sample_id__gte=term.upper(), sample_id__lt=term.upper() + '\U0010ffff')
+        ), False
+    
     def history_type_display(self, obj):
         """Display history type with color coding"""
         type_map = {
@@ -95,6 +221,118 @@ class HistoricalSampleAdmin(admin.ModelAdmin):
         return False  # Cannot delete history (audit trail!)
 
 
+@admin.register(SampleTransaction)
+class SampleTransactionAdmin(admin.ModelAdmin):
+    """Read-only view of the withdrawal/deposit ledger"""
+    list_display = ('sample', 'kind', 'amount', 'quantity_after', 'performed_by', 'created_at', 'note')
+    list_filter = ('kind', 'created_at')
+    list_select_related = ('sample', 'performed_by')
+    search_fields = ('sample__sample_id', 'note')
+    ordering = ('-created_at',)
+    
+    def has_add_permission(self, request):
+        return False  # Use withdraw/deposit so quantity and ledger stay in step
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(SampleIdSequence)
+class SampleIdSequenceAdmin(admin.ModelAdmin):
+    list_display = ('sample_type', 'year', 'last_value')
+    list_filter = ('sample_type', 'year')
+    ordering = ('-year', 'sample_type')
+
+
+@admin.register(InventorySnapshot)
+class InventorySnapshotAdmin(admin.ModelAdmin):
+    """Read-only view of the daily inventory rollup"""
+    list_display = ('date', 'status', 'sample_type', 'sample_count', 'total_quantity')
+    list_filter = ('status', 'sample_type')
+    date_hierarchy = 'date'
+    ordering = ('-date', 'status', 'sample_type')
+    
+    def has_add_permission(self, request):
+        return False  # Written by the update_inventory_snapshots command
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(DepletionForecast)
+class DepletionForecastAdmin(admin.ModelAdmin):
+    """Read-only view of the projected depletion dates"""
+    list_display = ('sample', 'depletion_date', 'daily_usage', 'computed_at')
+    list_select_related = ('sample',)
+    search_fields = ('sample__sample_id',)
+    ordering = ('depletion_date',)
+    
+    def has_add_permission(self, request):
+        return False  # Written by the update_depletion_forecasts command
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(SampleAttachment)
+class SampleAttachmentAdmin(admin.ModelAdmin):
+    """Read-only list of attachments; they are uploaded and removed on the sample page"""
+    list_display = ('filename', 'sample', 'kind', 'content_type', 'uploaded_by', 'uploaded_at')
+    list_filter = ('kind', 'uploaded_at')
+    list_select_related = ('sample', 'uploaded_by')
+    search_fields = ('sample__sample_id', 'filename', 'blob__sha256')
+    ordering = ('-uploaded_at',)
+    
+    def has_add_permission(self, request):
+        return False  # Uploaded in chunks through the API (see attachments.py)
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False  # The sample page also removes unused content
+
+
+@admin.register(AttachmentBlob)
+class AttachmentBlobAdmin(admin.ModelAdmin):
+    """Read-only view of stored attachment content"""
+    list_display = ('sha256', 'size', 'file', 'created_at')
+    search_fields = ('sha256',)
+    ordering = ('-created_at',)
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False  # cleanup_attachments removes content no attachment uses
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    """Uploads in progress; deleting one does not remove its partial file until cleanup_attachments runs"""
+    list_display = ('filename', 'sample', 'received', 'size', 'created_by', 'updated_at')
+    list_select_related = ('sample', 'created_by')
+    ordering = ('-updated_at',)
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(SiteSettings)
 class SiteSettingsAdmin(admin.ModelAdmin):
     list_display = ('__str__', 'updated_at')
@@ -0,0 +1,545 @@
+"""
+JSON API (v1) for LIMS and freezer-robot integrations.
+
+Rows are serialized straight from ``.values()`` without building model
+instances. Lists use keyset ("cursor") pagination on the primary key, so
+deep pages cost the same as the first one. Authentication is the normal
+session login; write requests need the CSRF token like any form post.
+"""
+
+import base64
+import binascii
+import hashlib
+import json
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from django.urls import reverse
+from django.middleware.gzip import GZipMiddleware
+from django.utils.translation import gettext as _
+from django.views.decorators.gzip import gzip_page
+
+from . import attachments, inventory, metrics
+from .cache import get_data_version
+from .concurrency import VersionConflict, save_if_unchanged
+from .forms import AttachmentUploadForm, SampleForm, SampleTransactionForm
+from .lookup import afetch_by_sample_id
+from .sequences import allocate_sample_ids, assign_sample_id
+from .search import normalize_search
+from .models import Sample, SampleAttachment, SampleTransaction, UploadSession
+from .views import filter_samples, is_staff_or_admin
+
+
+API_FIELDS = [
+    'id', 'sample_id', 'name', 'sample_type', 'description', 'source',
+    'donor_info', 'storage_location', 'status', 'quantity', 'passage_number',
+    'collection_date', 'storage_date', 'expiration_date', 'viability',
+    'quality_control_notes', 'research_use_only', 'image', 'created_by',
+    'created_at', 'updated_at', 'version',
+]
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 10000
+
+AUTOCOMPLETE_FIELDS = ['id', 'sample_id', 'name', 'status']
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_TIMEOUT = 300
+
+LOOKUP_FIELDS = ['id', 'sample_id', 'name', 'status', 'storage_location', 'quantity']
+MAX_LOOKUP_IDS = 5000
+MAX_RESERVED_IDS = 10000
+
+TRANSACTION_FIELDS = ['id', 'kind', 'amount', 'quantity_after', 'note', 'performed_by', 'created_at']
+
+ATTACHMENT_FIELDS = ['id', 'kind', 'filename', 'content_type', 'blob__size', 'blob__sha256',
+                     'uploaded_by', 'uploaded_at']
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400, **extra):
+        super().__init__(message)
+        self.status = status
+        self.extra = extra
+
+
+def api_response(data, status=200):
+    return JsonResponse(data, status=status, encoder=DjangoJSONEncoder,
+                        json_dumps_params={'ensure_ascii': False})
+
+
+def check_api_request(request, methods):
+    """Error response for anonymous, non-staff or wrong-method requests, else None"""
+    if not request.user.is_authenticated:
+        return api_response({'error': _('Authentication required.')}, status=401)
+    if not is_staff_or_admin(request.user):
+        return api_response({'error': _('Permission denied.')}, status=403)
+    if request.method not in methods:
+        response = api_response({'error': _('Method not allowed.')}, status=405)
+        response['Allow'] = ', '.join(methods)
+        return response
+    return None
+
+
+def api_view(methods):
+    """Require a staff session, restrict methods and render ApiErrors as JSON
+
+    Works on both sync and async views.
+    """
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            # gzip_page only wraps sync views in Django 4.2
+            gzip = GZipMiddleware(view_func)
+
+            @wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                # request.user is loaded lazily from the session, which is sync-only
+                error = await sync_to_async(check_api_request)(request, methods)
+                if error is not None:
+                    return error
+                try:
+                    response = await view_func(request, *args, **kwargs)
+                except ApiError as exc:
+                    response = api_response({'error': str(exc), **exc.extra}, status=exc.status)
+                return gzip.process_response(request, response)
+            return async_wrapper
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            error = check_api_request(request, methods)
+            if error is not None:
+                return error
+            try:
+                return view_func(request, *args, **kwargs)
+            except ApiError as exc:
+                return api_response({'error': str(exc), **exc.extra}, status=exc.status)
+        return gzip_page(wrapper)
+    return decorator
+
+
+def parse_fields(request):
+    """Sparse fieldset from ?fields=a,b,c (defaults to every API field)"""
+    raw = request.GET.get('fields', '')
+    if not raw:
+        return API_FIELDS
+    fields = [field.strip() for field in raw.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in API_FIELDS]
+    if unknown:
+        raise ApiError(_('Unknown fields: %(fields)s') % {'fields': ', '.join(unknown)},
+                       allowed=API_FIELDS)
+    return fields
+
+
+def encode_cursor(last_id):
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        raise ApiError(_('Invalid cursor.'))
+
+
+def parse_limit(request):
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ApiError(_('limit must be an integer.'))
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def parse_json_body(request):
+    try:
+        data = json.loads(request.body or b'{}')
+    except (ValueError, UnicodeDecodeError):
+        raise ApiError(_('Request body must be valid JSON.'))
+    if not isinstance(data, dict):
+        raise ApiError(_('Request body must be a JSON object.'))
+    return data
+
+
+def serialize_sample(pk, fields):
+    return Sample.objects.filter(pk=pk).values(*fields).first()
+
+
+def save_sample(request, data, instance=None):
+    """Validate with SampleForm so the API enforces the same rules as the UI
+
+    Updates that include "version" are only applied if the sample is still
+    at that version.
+    """
+    form = SampleForm(data, instance=instance)
+    if not form.is_valid():
+        raise ApiError(_('Validation failed.'), errors=form.errors.get_json_data())
+    sample = form.save(commit=False)
+    if instance is None:
+        sample.created_by = request.user
+        assign_sample_id(sample)
+    expected_version = form.cleaned_data['version']
+    if instance is None or expected_version is None:
+        sample.save()
+        return sample
+    try:
+        save_if_unchanged(sample, expected_version)
+    except VersionConflict:
+        current = Sample.objects.filter(pk=sample.pk).values_list('version', flat=True).first()
+        raise ApiError(_('The sample was changed by someone else.'), status=409, version=current)
+    return sample
+
+
+def form_initial(sample):
+    """Current values of a sample in SampleForm's data format (for PATCH)"""
+    values = Sample.objects.filter(pk=sample.pk).values(*SampleForm.Meta.fields).get()
+    values.pop('image', None)  # Files are not accepted through the JSON API
+    return {key: value for key, value in values.items() if value is not None}
+
+
+@api_view(['GET', 'POST'])
+def sample_collection(request):
+    """GET: list samples with filters, sparse fields and cursor pagination.
+    POST: create a sample from a JSON object."""
+    if request.method == 'POST':
+        sample = save_sample(request, parse_json_body(request))
+        return api_response(serialize_sample(sample.pk, API_FIELDS), status=201)
+
+    fields = parse_fields(request)
+    limit = parse_limit(request)
+
+    samples = filter_samples(Sample.objects.all(), request.GET).order_by('id')
+    cursor = request.GET.get('cursor')
+    if cursor:
+        samples = samples.filter(id__gt=decode_cursor(cursor))
+
+    # Always select id so the next cursor can be built, even if not requested
+    select = fields if 'id' in fields else ['id', *fields]
+    rows = list(samples.values(*select)[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_cursor = encode_cursor(rows[-1]['id']) if has_more else None
+    if 'id' not in fields:
+        for row in rows:
+            del row['id']
+
+    next_url = None
+    if next_cursor:
+        params = request.GET.copy()
+        params['cursor'] = next_cursor
+        next_url = request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+
+    return api_response({
+        'count': len(rows),
+        'next_cursor': next_cursor,
+        'next': next_url,
+        'results': rows,
+    })
+
+
+@api_view(['GET', 'PUT', 'PATCH'])
+def sample_resource(request, pk):
+    """GET: one sample (supports ?fields=). PUT: replace. PATCH: partial update."""
+    if request.method == 'GET':
+        row = serialize_sample(pk, parse_fields(request))
+        if row is None:
+            raise ApiError(_('Sample not found.'), status=404)
+        return api_response(row)
+
+    sample = Sample.objects.filter(pk=pk).first()
+    if sample is None:
+        raise ApiError(_('Sample not found.'), status=404)
+    data = parse_json_body(request)
+    if request.method == 'PATCH':
+        data = {**form_initial(sample), **data}
+    sample = save_sample(request, data, instance=sample)
+    return api_response(serialize_sample(sample.pk, API_FIELDS))
+
+
+@api_view(['GET', 'POST'])
+def sample_transactions(request, pk):
+    """GET: the sample's withdrawal/deposit ledger, newest first (cursor paginated).
+    POST {"kind": "WITHDRAWAL"|"DEPOSIT", "amount": n, "note": ""}: move vials.
+
+    A withdrawal larger than the stock is refused with 409 and the
+    available quantity; the sample is never driven below zero.
+    """
+    if not Sample.objects.filter(pk=pk).exists():
+        raise ApiError(_('Sample not found.'), status=404)
+
+    if request.method == 'POST':
+        form = SampleTransactionForm(parse_json_body(request))
+        if not form.is_valid():
+            raise ApiError(_('Validation failed.'), errors=form.errors.get_json_data())
+        apply = inventory.withdraw if form.cleaned_data['kind'] == SampleTransaction.WITHDRAWAL else inventory.deposit
+        try:
+            entry, status = apply(pk, form.cleaned_data['amount'], user=request.user,
+                                  note=form.cleaned_data['note'])
+        except inventory.InsufficientQuantity as exc:
+            raise ApiError(str(exc), status=409, available=exc.available)
+        except Sample.DoesNotExist:
+            raise ApiError(_('Sample not found.'), status=404)
+        row = SampleTransaction.objects.filter(pk=entry.pk).values(*TRANSACTION_FIELDS).get()
+        return api_response({**row, 'status': status}, status=201)
+
+    limit = parse_limit(request)
+    entries = SampleTransaction.objects.filter(sample_id=pk).order_by('-id')
+    cursor = request.GET.get('cursor')
+    if cursor:
+        entries = entries.filter(id__lt=decode_cursor(cursor))
+    rows = list(entries.values(*TRANSACTION_FIELDS)[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return api_response({
+        'count': len(rows),
+        'next_cursor': encode_cursor(rows[-1]['id']) if has_more else None,
+        'results': rows,
+    })
+
+
+@api_view(['POST'])
+def reserve_sample_ids(request):
+    """POST {"sample_type": "IPSC", "count": 500}: reserve consecutive sample IDs,
+    e.g. to print labels or prepare a bulk import.
+
+    The whole range is taken with one counter update; reserved IDs are never
+    handed out again, whether or not samples are created with them.
+    """
+    data = parse_json_body(request)
+    sample_type = data.get('sample_type')
+    if sample_type not in dict(Sample.SAMPLE_TYPE_CHOICES):
+        raise ApiError(_('Unknown sample type.'), allowed=[value for value, label in Sample.SAMPLE_TYPE_CHOICES])
+    count = data.get('count', 1)
+    if not isinstance(count, int) or not 1 <= count <= MAX_RESERVED_IDS:
+        raise ApiError(_('count must be an integer from 1 to %(max)d.') % {'max': MAX_RESERVED_IDS})
+    sample_ids = allocate_sample_ids(sample_type, count)
+    return api_response({
+        'first': sample_ids[0],
+        'last': sample_ids[-1],
+        'sample_ids': sample_ids,
+    }, status=201)
+
+
+@api_view(['POST'])
+async def sample_lookup(request):
+    """POST {"sample_ids": [...]} (or "barcodes"): status, location and quantity
+    for a whole rack in one indexed query per 900 IDs.
+
+    Barcode labels encode the sample_id, so both keys are matched against it.
+    Returns found rows in request order, plus missing and duplicated IDs.
+    """
+    data = parse_json_body(request)
+    sample_ids = data.get('sample_ids', data.get('barcodes'))
+    if not isinstance(sample_ids, list):
+        raise ApiError(_('Provide a list of IDs in "sample_ids" or "barcodes".'))
+    if len(sample_ids) > MAX_LOOKUP_IDS:
+        raise ApiError(_('At most %(max)d IDs per request.') % {'max': MAX_LOOKUP_IDS})
+    if not all(isinstance(value, str) for value in sample_ids):
+        raise ApiError(_('Every ID must be a string.'))
+    sample_ids = [value.strip() for value in sample_ids]
+
+    seen = set()
+    duplicates = []
+    for sample_id in sample_ids:
+        if sample_id in seen and sample_id not in duplicates:
+            duplicates.append(sample_id)
+        seen.add(sample_id)
+
+    rows = await afetch_by_sample_id(sample_ids, LOOKUP_FIELDS)
+    ordered_ids = list(dict.fromkeys(sample_ids))
+    return api_response({
+        'found': [rows[sample_id] for sample_id in ordered_ids if sample_id in rows],
+        'missing': [sample_id for sample_id in ordered_ids if sample_id not in rows],
+        'duplicates': duplicates,
+    })
+
+
+def serialize_attachment(row, request):
+    row['size'] = row.pop('blob__size')
+    row['sha256'] = row.pop('blob__sha256')
+    row['url'] = request.build_absolute_uri(reverse('attachment_download', args=[row.pop('sample_id'), row['id']]))
+    return row
+
+
+def attachment_row(attachment, request):
+    row = SampleAttachment.objects.filter(pk=attachment.pk).values('sample_id', *ATTACHMENT_FIELDS).get()
+    return serialize_attachment(row, request)
+
+
+def upload_row(session, request):
+    return {
+        'id': session.pk,
+        'url': request.build_absolute_uri(reverse('api_attachment_upload', args=[session.pk])),
+        'filename': session.filename,
+        'size': session.size,
+        'offset': session.received,
+        'chunk_size': settings.ATTACHMENT_CHUNK_SIZE,
+    }
+
+
+@api_view(['GET', 'POST'])
+def sample_attachments(request, pk):
+    """GET: the sample's attachments, newest first.
+    POST {"filename", "size", "sha256", "content_type", "kind"}: start an upload.
+
+    Returns {"attachment": ..., "upload": null} if content with that
+    SHA-256 is already stored, so nothing needs to be sent; otherwise
+    {"attachment": null, "upload": ...} to PUT the chunks to (see
+    attachment_upload). sha256 is optional but makes the server verify the
+    finished file.
+    """
+    sample = Sample.objects.filter(pk=pk).first()
+    if sample is None:
+        raise ApiError(_('Sample not found.'), status=404)
+
+    if request.method == 'POST':
+        form = AttachmentUploadForm(parse_json_body(request))
+        if not form.is_valid():
+            raise ApiError(_('Validation failed.'), errors=form.errors.get_json_data())
+        attachment, session = attachments.start_upload(sample, request.user, **form.cleaned_data)
+        return api_response({
+            'attachment': attachment and attachment_row(attachment, request),
+            'upload': session and upload_row(session, request),
+        }, status=201)
+
+    rows = SampleAttachment.objects.filter(sample_id=pk).values('sample_id', *ATTACHMENT_FIELDS)
+    return api_response({'results': [serialize_attachment(row, request) for row in rows]})
+
+
+def parse_content_digest(header):
+    """The SHA-256 in an RFC 9530 Content-Digest header (``sha-256=:base64:``), or None"""
+    for member in header.split(','):
+        algorithm, _sep, value = member.strip().partition('=')
+        if algorithm.strip().lower() == 'sha-256':
+            try:
+                return base64.b64decode(value.strip().strip(':'), validate=True)
+            except binascii.Error:
+                raise ApiError(_('Content-Digest is not valid base64.'))
+    return None
+
+
+@api_view(['GET', 'PUT', 'POST', 'DELETE'])
+def attachment_upload(request, upload_id):
+    """One upload in progress.
+
+    GET: the upload, with "offset", the number of bytes received so far;
+    a client that lost its connection resumes from there.
+    PUT: the next chunk as the raw request body, with
+    ``Content-Range: bytes <start>-<end>/<size>`` and optionally
+    ``Content-Digest: sha-256=:<base64>:``. A chunk that does not start at
+    the offset is refused with 409 and the offset. The last chunk finishes
+    the upload and returns 201 with the attachment.
+    POST: finish an upload whose last chunk was received but not finished.
+    DELETE: cancel the upload.
+    """
+    session = UploadSession.objects.filter(pk=upload_id).first()
+    if session is None:
+        raise ApiError(_('Upload not found.'), status=404)
+
+    if request.method == 'DELETE':
+        attachments.cancel_upload(session)
+        return HttpResponse(status=204)
+    if request.method == 'GET':
+        return api_response({'attachment': None, 'upload': upload_row(session, request)})
+
+    if request.method == 'PUT':
+        try:
+            start, end, total = attachments.parse_content_range(request.headers.get('Content-Range', ''))
+        except attachments.InvalidChunk as exc:
+            raise ApiError(str(exc))
+        if total != session.size:
+            raise ApiError(_('Content-Range gives a size of %(total)d bytes, but the upload is %(size)d bytes.') % {
+                'total': total, 'size': session.size})
+        if end - start > settings.ATTACHMENT_CHUNK_SIZE:
+            raise ApiError(_('Chunks can be at most %(size)d bytes.') % {'size': settings.ATTACHMENT_CHUNK_SIZE},
+                           status=413, chunk_size=settings.ATTACHMENT_CHUNK_SIZE)
+        if request.META.get('CONTENT_LENGTH') != str(end - start):
+            raise ApiError(_('Content-Length must match Content-Range.'))
+        digest = parse_content_digest(request.headers.get('Content-Digest', ''))
+        try:
+            # The request itself is the stream: the body is never read into memory
+            session = attachments.receive_chunk(session, start, end, request, digest)
+        except attachments.OffsetMismatch as exc:
+            raise ApiError(str(exc), status=409, offset=exc.offset)
+        except attachments.InvalidChunk as exc:
+            raise ApiError(str(exc))
+        except UploadSession.DoesNotExist:
+            raise ApiError(_('Upload not found.'), status=404)
+        if session.received < session.size:
+            return api_response({'attachment': None, 'upload': upload_row(session, request)})
+    elif session.received < session.size:
+        raise ApiError(_('The upload continues at byte %(offset)d.') % {'offset': session.received},
+                       status=409, offset=session.received)
+
+    try:
+        attachment = attachments.complete_upload(session)
+    except attachments.ChecksumMismatch as exc:
+        raise ApiError(str(exc), status=422, expected=exc.expected, actual=exc.actual)
+    except UploadSession.DoesNotExist:
+        raise ApiError(_('Upload not found.'), status=404)
+    return api_response({'attachment': attachment_row(attachment, request), 'upload': None}, status=201)
+
+
+def prefix_upper_bound(prefix):
+    """The smallest string greater than every string starting with prefix, or None
+
+    The last character that is not U+10FFFF is incremented and anything
+    after it dropped; surrogates, which cannot be stored, are skipped.
+    """
+    stem = prefix.rstrip('\U0010ffff')
+    if not stem:
+        return None
+    following = ord(stem[-1]) + 1
+    if 0xD800 <= following <= 0xDFFF:
+        following = 0xE000
+    return stem[:-1] + chr(following)
+
+
+def prefix_range(queryset, field, prefix, limit):
+    """Rows whose field starts with prefix, as a range scan on the field's index
+
+    ``field >= prefix AND field < prefix_upper_bound(prefix)`` is answered by
+    walking the B-tree from the first match, unlike LIKE '%x%' which scans
+    the table.
+    """
+    bounds = {f'{field}__gte': prefix}
+    upper = prefix_upper_bound(prefix)
+    if upper is not None:
+        bounds[f'{field}__lt'] = upper
+    return list(queryset.filter(**bounds).order_by(field).values(*AUTOCOMPLETE_FIELDS)[:limit])
+
+
+def autocomplete_suggestions(query):
+    # Sample IDs are conventionally upper case; names are matched on the
+    # folded search_name column so case and Chinese script do not matter
+    id_prefixes = dict.fromkeys([query, query.upper()])
+
+    suggestions = {}
+    for prefix in id_prefixes:
+        for row in prefix_range(Sample.objects.all(), 'sample_id', prefix, AUTOCOMPLETE_LIMIT):
+            suggestions.setdefault(row['id'], row)
+    if len(suggestions) < AUTOCOMPLETE_LIMIT:
+        name_prefix = normalize_search(query)
+        for row in prefix_range(Sample.objects.all(), 'search_name', name_prefix, AUTOCOMPLETE_LIMIT):
+            suggestions.setdefault(row['id'], row)
+    return list(suggestions.values())[:AUTOCOMPLETE_LIMIT]
+
+
+@api_view(['GET'])
+def sample_autocomplete(request):
+    """GET ?q=prefix: up to 10 samples whose sample_id or name starts with q"""
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return api_response({'results': []})
+
+    digest = hashlib.md5(query.encode()).hexdigest()
+    key = f'autocomplete:{get_data_version()}:{digest}'
+    results = cache.get(key)
+    metrics.record_cache('autocomplete', results is not None)
+    if results is None:
+        results = autocomplete_suggestions(query)
+        cache.set(key, results, AUTOCOMPLETE_TIMEOUT)
+    return api_response({'results': results})
@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class SamplesConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "samples"
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .db import configure_sqlite_connection
+        from .middleware import install_query_counter
+        connection_created.connect(configure_sqlite_connection)
+        connection_created.connect(install_query_counter)
@@ -0,0 +1,197 @@
+"""
+Async views for the dashboard, its live event stream and the streaming CSV
+export.
+
+Under ASGI (``uvicorn config.asgi:application``) an async view gives its
+worker back to the event loop while it waits on the database or on a slow
+client, so one process can hold many more requests in flight than it has
+threads. Under WSGI the same views still work; Django runs each one in its
+own event loop.
+
+Django 4.2's ``login_required``/``user_passes_test`` and the session are
+sync-only, so the user is checked in a thread (``async_user_passes_test``).
+"""
+
+import asyncio
+import csv
+import io
+import time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections
+from django.http import HttpResponse, StreamingHttpResponse
+from django.shortcuts import render
+from django.utils import timezone, translation
+
+from . import metrics
+from .cache import get_data_version, page_cache_key
+from .live import dashboard_snapshot, format_event, snapshot_changes, wait_for_change
+from .views import (
+    dashboard_context, export_column_names, export_labels, export_request, export_value,
+    is_staff_or_admin,
+)
+
+
+EXPORT_CHUNK_SIZE = 2000
+
+# Comment line sent on idle event streams so proxies keep them open
+EVENTS_KEEPALIVE_SECONDS = 15
+# How long EventSource waits before reconnecting a closed stream
+EVENTS_RETRY_MILLISECONDS = 5000
+
+
+def async_user_passes_test(test_func, login_url=None):
+    """user_passes_test for async views"""
+    def decorator(view_func):
+        @wraps(view_func)
+        async def wrapper(request, *args, **kwargs):
+            # request.user is loaded lazily from the session, which is sync-only
+            if await sync_to_async(test_func)(request.user):
+                return await view_func(request, *args, **kwargs)
+            return redirect_to_login(request.get_full_path(), login_url)
+        return wrapper
+    return decorator
+
+
+async def run_query(func, *args):
+    """Run a read-only ORM call on a thread of its own
+
+    The async ORM sends every query through one shared thread, so queries
+    of concurrent requests (and of one request) run one after another.
+    Reads that need no transaction can use the default executor instead;
+    connections are recycled by CONN_MAX_AGE like at request boundaries.
+    """
+    def call():
+        close_old_connections()
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+    return await sync_to_async(call, thread_sensitive=False)()
+
+
+@async_user_passes_test(lambda user: user.is_authenticated)
+async def home(request):
+    """Dashboard home page - shows summary statistics"""
+    today = timezone.now().date()
+    context = dashboard_context(today)
+
+    key = await sync_to_async(page_cache_key)(request, 'home', today)
+    if not await cache.ahas_key(key):
+        # Cache miss: run the seven independent queries concurrently instead
+        # of one by one as the template reaches them. If the fragment is
+        # cached after all, the template never looks at these values.
+        loaders = {'stats': dict, 'samples_by_type': list, 'recent_samples': list,
+                   'expiring_soon': list, 'low_stock': list, 'running_out': list,
+                   'inventory_trend': dict}
+        results = await asyncio.gather(*(
+            run_query(loader, context[name]) for name, loader in loaders.items()
+        ))
+        context.update(zip(loaders, results))
+
+    # The page subscribes to changes made after this version
+    context['data_version'] = await sync_to_async(get_data_version)()
+
+    # Rendering touches the session, messages and site settings
+    return await sync_to_async(render)(request, 'samples/home.html', context)
+
+
+@async_user_passes_test(lambda user: user.is_authenticated)
+async def dashboard_events(request):
+    """Server-Sent Events stream of dashboard changes
+
+    Sends a "dashboard" event with changed counters, their deltas and
+    re-rendered panels whenever the data version moves (see live.py). The
+    stream ends after DASHBOARD_EVENTS_MAX_SECONDS and EventSource
+    reconnects with Last-Event-ID, which bounds how long a stream outlives
+    a closed tab (Django 4.2 does not report client disconnects).
+    """
+    if not isinstance(request, ASGIRequest):
+        # Under WSGI every open dashboard would hold a worker thread. 204
+        # tells EventSource not to reconnect; the page just stays static.
+        return HttpResponse(status=204)
+
+    version = request.headers.get('Last-Event-ID') or request.GET.get('version', '')
+    language = translation.get_language()
+    today = timezone.now().date()
+    build_snapshot = sync_to_async(dashboard_snapshot)
+
+    async def events():
+        nonlocal version
+        yield f'retry: {EVENTS_RETRY_MILLISECONDS}\n\n'
+        with translation.override(language):
+            current = str(await sync_to_async(get_data_version)())
+            # Baseline for deltas; built once per version for all dashboards
+            snapshot = await build_snapshot(current, today) if current == version else None
+            if snapshot is None:
+                version = ''  # Send the full state right away
+            deadline = time.monotonic() + settings.DASHBOARD_EVENTS_MAX_SECONDS
+            while (remaining := deadline - time.monotonic()) > 0:
+                current = await wait_for_change(version, min(remaining, EVENTS_KEEPALIVE_SECONDS))
+                if current is None:
+                    yield ': keepalive\n\n'
+                    continue
+                new_snapshot = await build_snapshot(current, today)
+                payload = snapshot_changes(snapshot, new_snapshot)
+                snapshot, version = new_snapshot, current
+                if payload['stats'] or payload['panels']:
+                    yield format_event('dashboard', payload, event_id=version)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Stop nginx from buffering the stream
+    return response
+
+
+def csv_chunks(columns, samples, language):
+    """Yield the export as CSV text, one string per EXPORT_CHUNK_SIZE rows"""
+    # The body is produced after the view returns; use the request's language
+    with translation.override(language):
+        column_names = export_column_names()
+        labels = export_labels()
+
+    start = time.perf_counter()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM so Excel opens the UTF-8 (Chinese) text correctly
+    buffer.write('\ufeff')
+    writer.writerow([str(column_names.get(key, key)) for key in columns])
+    row_count = 0
+    for sample in samples.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        writer.writerow([export_value(sample, key, labels) for key in columns])
+        row_count += 1
+        if row_count % EXPORT_CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+    metrics.observe('export_duration_seconds', time.perf_counter() - start, format='csv')
+    metrics.inc('export_rows_total', row_count, format='csv')
+
+
+@async_user_passes_test(is_staff_or_admin, login_url='login')
+async def export_samples_csv(request):
+    """Stream the export as CSV while the client downloads it"""
+    columns, samples = export_request(request.GET)
+    chunks = csv_chunks(columns, samples, translation.get_language())
+
+    async def content():
+        # Fetching and formatting run in the request's worker thread (it
+        # holds the cursor), one chunk at a time, so the event loop only
+        # passes text to the client and stays free for other requests
+        next_chunk = sync_to_async(next)
+        while (chunk := await next_chunk(chunks, None)) is not None:
+            yield chunk
+
+    # Django 4.2 buffers the whole body when a WSGI server is handed an
+    # async iterator, so WSGI gets the plain generator
+    streaming_content = content() if isinstance(request, ASGIRequest) else chunks
+    response = StreamingHttpResponse(streaming_content, content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename=samples_export_{timezone.now().strftime("%Y%m%d_%H%M%S")}.csv'
+    response['Cache-Control'] = 'private, no-cache'
+    return response
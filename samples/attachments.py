@@ -0,0 +1,337 @@
+"""
+Chunked, resumable uploads of sample attachments.
+
+Certificates of analysis, karyotypes and sequencing reports can be
+hundreds of megabytes, more than the host accepts in one request and far
+more than should be buffered through ``request.FILES``. Instead a client:
+
+1. Starts an upload with the file's name, size and, if it knows it, its
+   SHA-256 (``start_upload``). If that content is already stored, the
+   sample is given the existing copy at once and nothing is sent.
+2. Sends the file in chunks of at most ATTACHMENT_CHUNK_SIZE, each with
+   its offset (``receive_chunk``). A chunk is streamed from the request to
+   a spooled temporary file, checked against its length and optional
+   digest, and only then appended to the partial file under
+   ATTACHMENT_ROOT/partial/, so a slow client never holds a database lock
+   while its data arrives. The offset is claimed with a conditional UPDATE
+   (``received = end WHERE received = start``), so two requests can never
+   write the same bytes, and a client whose connection dropped asks for
+   ``received`` and resumes from there.
+3. After the last chunk the partial file is hashed (``complete_upload``).
+   If the upload declared a SHA-256 that does not match, it is discarded.
+   Otherwise the file is moved, not copied, to ``blobs/<sha256>``, or
+   dropped if that content is already stored.
+
+Each content is stored once as an AttachmentBlob however many samples it
+is attached to; the blob and its file go when the last attachment does.
+"""
+
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import IntegrityError, router, transaction
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+from . import metrics
+from .models import AttachmentBlob, SampleAttachment, UploadSession
+
+
+# Requests are read and files hashed in blocks of these sizes
+READ_SIZE = 64 * 1024
+HASH_BLOCK_SIZE = 1024 * 1024
+# Chunks up to this size are spooled in memory, larger ones on disk
+SPOOL_MAX_BYTES = 1024 * 1024
+
+CONTENT_RANGE_RE = re.compile(r'bytes (\d+)-(\d+)/(\d+)')
+RANGE_RE = re.compile(r'bytes=(\d*)-(\d*)')
+
+
+class InvalidChunk(ValueError):
+    """The chunk does not fit the upload or does not match its digest"""
+
+
+class OffsetMismatch(Exception):
+    """The chunk does not start where the upload left off"""
+
+    def __init__(self, offset):
+        super().__init__(_('The upload continues at byte %(offset)d.') % {'offset': offset})
+        self.offset = offset
+
+
+class ChecksumMismatch(ValueError):
+    """The uploaded file's SHA-256 is not the one declared when it started"""
+
+    def __init__(self, expected, actual):
+        super().__init__(_('The uploaded file does not match its SHA-256 checksum and was discarded.'))
+        self.expected = expected
+        self.actual = actual
+
+
+class RangeNotSatisfiable(ValueError):
+    """The requested byte range starts beyond the end of the file"""
+
+
+class PartialFile(File):
+    """A finished partial file, which FileSystemStorage moves into place instead of copying"""
+
+    def temporary_file_path(self):
+        return self.name
+
+
+def partial_path(session):
+    return os.path.join(settings.ATTACHMENT_ROOT, 'partial', str(session.pk))
+
+
+def blob_name(sha256):
+    # Two-character subdirectories keep any one directory small
+    return f'blobs/{sha256[:2]}/{sha256}'
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        while block := file.read(HASH_BLOCK_SIZE):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def parse_content_range(header):
+    """(start, end, total) of a ``bytes start-end/total`` header, end exclusive"""
+    match = CONTENT_RANGE_RE.fullmatch(header.strip())
+    if match is None:
+        raise InvalidChunk(_('Content-Range must look like "bytes 0-8388607/104857600".'))
+    first, last, total = (int(value) for value in match.groups())
+    if last < first or last >= total:
+        raise InvalidChunk(_('Content-Range is not a valid byte range.'))
+    return first, last + 1, total
+
+
+def parse_range(header, size):
+    """(start, end) of a single-range Range header, end exclusive
+
+    None means the whole file should be sent: the header is malformed,
+    uses another unit or asks for several ranges, which RFC 9110 lets a
+    server ignore. Raises RangeNotSatisfiable for ranges past the end.
+    """
+    match = RANGE_RE.fullmatch(header.strip())
+    if match is None or match.group() == 'bytes=-':
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last n bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable
+        return max(0, size - length), size
+    start = int(first)
+    end = int(last) + 1 if last else size
+    if start >= size:
+        raise RangeNotSatisfiable
+    if end <= start:
+        return None
+    return start, min(end, size)
+
+
+def read_range(file, start, end):
+    """Yield bytes start to end of an open file, then close it"""
+    try:
+        file.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            data = file.read(min(HASH_BLOCK_SIZE, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+    finally:
+        file.close()
+
+
+def _attach(blob, sample_id, user, filename, content_type, kind):
+    return SampleAttachment.objects.create(
+        sample_id=sample_id, blob=blob, filename=filename, content_type=content_type,
+        kind=kind, uploaded_by=user,
+    )
+
+
+def start_upload(sample, user, filename, size, sha256='', content_type='', kind='OTHER'):
+    """Begin uploading a file to a sample; returns (attachment, session), one of them None
+
+    With the SHA-256 of content that is already stored, the attachment is
+    created straight away and there is no session.
+    """
+    if sha256:
+        blob = AttachmentBlob.objects.filter(sha256=sha256).first()
+        if blob is not None and blob.size == size:
+            metrics.inc('attachment_uploads_total', outcome='deduplicated')
+            return _attach(blob, sample.pk, user, filename, content_type, kind), None
+    session = UploadSession.objects.create(
+        sample=sample, filename=filename, content_type=content_type, kind=kind,
+        size=size, sha256=sha256, created_by=user,
+    )
+    os.makedirs(os.path.dirname(partial_path(session)), exist_ok=True)
+    # Created empty now so a session always has its file
+    open(partial_path(session), 'wb').close()
+    return None, session
+
+
+def receive_chunk(session, start, end, stream, digest=None):
+    """Append bytes start to end (exclusive) read from stream to the upload
+
+    digest is the chunk's expected SHA-256 (raw bytes), if the client sent
+    one. Returns the session with its new ``received``. Raises
+    OffsetMismatch if the upload is not at start, InvalidChunk if the
+    chunk runs past the declared size, arrives short or fails its digest.
+    """
+    if end > session.size:
+        raise InvalidChunk(_('The chunk runs past the end of the file.'))
+    if start != session.received:
+        raise OffsetMismatch(session.received)
+
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES, dir=os.path.dirname(partial_path(session))) as spool:
+        hasher = hashlib.sha256()
+        remaining = end - start
+        while remaining > 0:
+            data = stream.read(min(READ_SIZE, remaining))
+            if not data:
+                break
+            spool.write(data)
+            hasher.update(data)
+            remaining -= len(data)
+        if remaining:
+            raise InvalidChunk(_('The request body is shorter than its Content-Range.'))
+        if digest is not None and hasher.digest() != digest:
+            raise InvalidChunk(_('The chunk does not match its Content-Digest.'))
+        spool.seek(0)
+
+        db = router.db_for_write(UploadSession)
+        with transaction.atomic(using=db):
+            # Holds the row (SQLite: the database) until the bytes are written,
+            # so a concurrent request for the same offset waits and then fails
+            claimed = UploadSession.objects.using(db).filter(pk=session.pk, received=start).update(
+                received=end, updated_at=timezone.now())
+            if not claimed:
+                current = UploadSession.objects.using(db).filter(pk=session.pk).values_list(
+                    'received', flat=True).first()
+                if current is None:
+                    raise UploadSession.DoesNotExist
+                raise OffsetMismatch(current)
+            with open(partial_path(session), 'r+b') as partial:
+                # Drop anything a failed earlier write left past the offset
+                partial.truncate(start)
+                partial.seek(start)
+                shutil.copyfileobj(spool, partial, READ_SIZE)
+    metrics.inc('attachment_upload_bytes_total', end - start)
+    session.received = end
+    return session
+
+
+def _store_blob(path, sha256, size):
+    """The blob for this content, moving the partial file into storage if it is new"""
+    blob = AttachmentBlob.objects.filter(sha256=sha256).first()
+    if blob is not None:
+        return blob, False
+    blob = AttachmentBlob(sha256=sha256, size=size)
+    blob.file.save(blob_name(sha256), PartialFile(None, name=path), save=False)
+    try:
+        with transaction.atomic():
+            blob.save()
+    except IntegrityError:
+        # Someone stored the same content a moment ago
+        blob.file.delete(save=False)
+        return AttachmentBlob.objects.get(sha256=sha256), False
+    return blob, True
+
+
+def complete_upload(session):
+    """Verify a fully received upload and attach it to its sample; returns the attachment
+
+    Raises ChecksumMismatch, after discarding the upload, if it does not
+    match the SHA-256 declared when it started, and
+    UploadSession.DoesNotExist if another request completed it first.
+    """
+    path = partial_path(session)
+    try:
+        sha256 = file_sha256(path)
+    except FileNotFoundError:
+        raise UploadSession.DoesNotExist
+    if session.sha256 and sha256 != session.sha256:
+        cancel_upload(session)
+        metrics.inc('attachment_uploads_total', outcome='checksum_mismatch')
+        raise ChecksumMismatch(session.sha256, sha256)
+
+    blob, created = _store_blob(path, sha256, session.size)
+    with transaction.atomic():
+        if not UploadSession.objects.filter(pk=session.pk).delete()[0]:
+            raise UploadSession.DoesNotExist
+        attachment = _attach(blob, session.sample_id, session.created_by, session.filename,
+                             session.content_type, session.kind)
+    if not created:
+        _remove_file(path)
+    metrics.inc('attachment_uploads_total', outcome='stored' if created else 'deduplicated')
+    return attachment
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def cancel_upload(session):
+    """Delete an unfinished upload and its partial file"""
+    UploadSession.objects.filter(pk=session.pk).delete()
+    _remove_file(partial_path(session))
+
+
+def delete_unreferenced_blobs(blob_ids=None):
+    """Delete blobs no attachment uses any more, and their files; returns how many
+
+    A blob attached again in the meantime is kept: the DELETE only matches
+    blobs that still have no attachments.
+    """
+    blobs = AttachmentBlob.objects.filter(attachments__isnull=True)
+    if blob_ids is not None:
+        blobs = blobs.filter(pk__in=blob_ids)
+    deleted = 0
+    for blob in blobs:
+        with transaction.atomic():
+            if AttachmentBlob.objects.filter(pk=blob.pk, attachments__isnull=True).delete()[0]:
+                transaction.on_commit(lambda file=blob.file: file.delete(save=False))
+                deleted += 1
+    return deleted
+
+
+def remove_attachment(attachment):
+    """Detach a file from its sample, deleting its content if nothing else uses it"""
+    attachment.delete()
+    delete_unreferenced_blobs([attachment.blob_id])
+
+
+def expire_uploads(now=None):
+    """Cancel uploads untouched for ATTACHMENT_UPLOAD_EXPIRY_HOURS and remove
+    partial files with no upload; returns (uploads, files) removed"""
+    now = now or timezone.now()
+    cutoff = now - timedelta(hours=settings.ATTACHMENT_UPLOAD_EXPIRY_HOURS)
+    expired = list(UploadSession.objects.filter(updated_at__lt=cutoff))
+    for session in expired:
+        cancel_upload(session)
+
+    directory = os.path.join(settings.ATTACHMENT_ROOT, 'partial')
+    orphans = 0
+    if os.path.isdir(directory):
+        active = {str(pk) for pk in UploadSession.objects.values_list('pk', flat=True)}
+        for entry in os.scandir(directory):
+            # A recent file may belong to an upload started after active was read
+            if entry.name not in active and entry.stat().st_mtime < cutoff.timestamp():
+                _remove_file(entry.path)
+                orphans += 1
+    return len(expired), orphans
@@ -0,0 +1,77 @@
+"""
+Versioned page caching.
+
+A single data-version counter lives in the Django cache. Saving or deleting
+a Sample or SiteSettings bumps it once the change commits (see signals.py),
+and every cached page fragment includes the current version in its key, so
+one increment makes all stale fragments unreachable. Because the counter is stored in the cache
+backend itself, a file-based cache shares invalidation across processes.
+"""
+
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import get_language
+
+from . import metrics
+
+
+DATA_VERSION_KEY = 'samples:data_version'
+
+
+def _initial_version():
+    # Start from the clock so a lost counter (eviction, locmem restart)
+    # never reuses a version number that old fragments were stored under
+    return int(time.time() * 1000)
+
+
+def get_data_version():
+    """Return the current data version, initialising it if needed"""
+    version = cache.get(DATA_VERSION_KEY)
+    if version is None:
+        cache.add(DATA_VERSION_KEY, _initial_version(), timeout=None)
+        version = cache.get(DATA_VERSION_KEY)
+    return version
+
+
+def bump_data_version():
+    """Invalidate every versioned fragment in O(1)"""
+    try:
+        return cache.incr(DATA_VERSION_KEY)
+    except ValueError:
+        version = _initial_version()
+        cache.set(DATA_VERSION_KEY, version, timeout=None)
+        return version
+
+
+def user_role(user):
+    """Coarse role used to vary cached pages"""
+    if not user.is_authenticated:
+        return 'anonymous'
+    if user.is_superuser:
+        return 'admin'
+    if user.groups.filter(name='Lab Staff').exists():
+        return 'staff'
+    return 'user'
+
+
+def page_cache_key(request, fragment, *vary_on):
+    """Key a fragment by URL, query string, language, role and data version"""
+    query = sorted(request.GET.lists())
+    variant = '|'.join(str(part) for part in (
+        request.path, query, get_language(), user_role(request.user), *vary_on,
+    ))
+    digest = hashlib.md5(variant.encode()).hexdigest()
+    return f'page:{fragment}:{get_data_version()}:{digest}'
+
+
+def get_cached_page(key):
+    html = cache.get(key)
+    metrics.record_cache('page', html is not None)
+    return html
+
+
+def set_cached_page(key, html):
+    cache.set(key, html, settings.PAGE_CACHE_TIMEOUT)
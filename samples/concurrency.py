@@ -0,0 +1,84 @@
+"""
+Optimistic concurrency for sample edits.
+
+The edit form carries the sample's ``version``. Saving first runs
+``UPDATE ... SET version = version WHERE id = %s AND version = %s``: if the
+row has moved on, nothing matches and the edit is refused with a conflict
+instead of overwriting the other change. Otherwise that statement holds the
+row (SQLite: the database) for the few milliseconds of the save, and no lock
+is held while the user is typing.
+
+On a conflict the user's values are merged three ways with the history
+record of the version they started from and the current row: fields only
+one side changed are taken from that side, and fields both changed are
+shown side by side to resolve.
+"""
+
+from django.db import router, transaction
+from django.db.models import F
+
+from .models import Sample
+
+
+class VersionConflict(Exception):
+    """The sample was saved by someone else since expected_version"""
+
+
+def save_if_unchanged(sample, expected_version):
+    """Save sample only if the stored row is still at expected_version
+
+    Raises VersionConflict otherwise. The saved row (and its history
+    record) gets version expected_version + 1.
+    """
+    db = router.db_for_write(Sample)
+    with transaction.atomic(using=db):
+        claimed = Sample.objects.using(db).filter(
+            pk=sample.pk, version=expected_version).update(version=F('version'))
+        if not claimed:
+            raise VersionConflict
+        sample.version = expected_version
+        sample.save(using=db)
+
+
+def base_record(sample_pk, version):
+    """History record the user started editing from, or None
+
+    Withdrawals and deposits made before they wrote history moved the
+    version without a record, so this falls back to the newest record
+    before it. Quantity and status may then show as conflicts even if the
+    user left them alone, which errs on the side of asking.
+    """
+    return (Sample.history.filter(id=sample_pk, version__lte=version)
+            .order_by('-version', '-history_id').first())
+
+
+def three_way_merge(base, mine, theirs, fields):
+    """Merge field values of the user's edit (mine) with the current row (theirs)
+
+    base, mine and theirs map field names to values. Returns the merged
+    values and, for each field either side changed, a dict with all four
+    values and whether it is a conflict.
+    """
+    merged = {}
+    changes = []
+    for name in fields:
+        old, ours, current = base.get(name), mine.get(name), theirs.get(name)
+        if ours == current:
+            value = ours
+        elif ours == old:
+            value = current
+        else:
+            # Our change wins unless the other side changed it too; the
+            # user then decides (the form is prefilled with their value)
+            value = ours
+        merged[name] = value
+        if ours != old or current != old:
+            changes.append({
+                'field': name,
+                'base': old,
+                'mine': ours,
+                'theirs': current,
+                'merged': value,
+                'conflict': ours != current and ours != old and current != old,
+            })
+    return merged, changes
@@ -0,0 +1,51 @@
+"""
+SQLite connection tuning, and scratch databases for the benchmark commands.
+
+``SQLITE_PRAGMAS`` in settings is applied to every new SQLite connection
+through the ``connection_created`` signal. The production profile enables
+WAL so readers never block the single writer, and a busy timeout so
+writers queue instead of failing with "database is locked".
+"""
+
+import os
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+def apply_sqlite_pragmas(cursor, pragmas):
+    """Run ``PRAGMA name = value`` for each entry on a DB-API cursor"""
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """connection_created receiver that applies SQLITE_PRAGMAS"""
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', None)
+    if connection.vendor != 'sqlite' or not pragmas:
+        return
+    with connection.cursor() as cursor:
+        apply_sqlite_pragmas(cursor, pragmas)
+
+
+@contextmanager
+def scratch_database():
+    """Point the default connection at a throwaway, migrated test database
+
+    Used by the stress and benchmark commands so they never touch real
+    data. SQLite gets a file rather than the test runner's shared
+    in-memory database, so that concurrent threads wait on the busy
+    timeout instead of failing with "table is locked".
+    """
+    connection = connections[DEFAULT_DB_ALIAS]
+    with tempfile.TemporaryDirectory() as tmp:
+        if connection.vendor == 'sqlite':
+            connection.settings_dict['TEST']['NAME'] = os.path.join(tmp, 'scratch.sqlite3')
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            yield connection
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
@@ -0,0 +1,176 @@
+"""
+Projected depletion dates from each sample's quantity over time.
+
+A sample's quantity changes through edits (one history record each) and
+through withdrawals and deposits (one SampleTransaction each, see
+inventory.py). ``load_quantity_series`` reads both for the last
+DEPLETION_FORECAST_WINDOW_DAYS in a single UNION ALL query into NumPy
+arrays. Withdrawals and deposits also write a history record with the
+same time and quantity, and such identical points are kept once.
+``fit_depletion`` then estimates every sample's rate at once:
+
+1. Points are sorted by (sample, time) and each sample's current quantity
+   is appended as its last point, so a line that has stopped being used
+   flattens out.
+2. Decreases between consecutive points of a sample are vials used;
+   deposits and restocking edits count as zero use. Their running total
+   per sample is the cumulative consumption curve.
+3. The least-squares slope of that curve (vials per day) comes from
+   per-sample sums gathered with ``np.bincount``, with no Python loop over
+   samples.
+
+The forecast is the current quantity divided by that rate. Results replace
+the DepletionForecast table; ``update_forecasts`` is run by the
+update_depletion_forecasts command.
+"""
+
+import math
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import F, FloatField, Func
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .cache import bump_data_version
+from .models import DepletionForecast, Sample, SampleTransaction
+
+
+HistoricalSample = Sample.history.model
+
+# Points per sample (including its current quantity) needed for a rate
+MIN_POINTS = 3
+# Depletion further out than this is left without a date
+MAX_FORECAST_DAYS = 3650
+WRITE_BATCH_SIZE = 5000
+
+SECONDS_PER_DAY = 86400.0
+
+
+class EpochDays(Func):
+    """Days since 1970-01-01 UTC of a datetime column, as a float
+
+    Lets the database hand over plain numbers; converting millions of
+    values to aware datetimes in Python costs more than the whole fit.
+    """
+    output_field = FloatField()
+    template = 'EXTRACT(EPOCH FROM %(expressions)s) / 86400.0'
+
+    # The database already returns a float; skipping the per-row float()
+    # leaves Django no converter to apply to the rows at all
+    @cached_property
+    def convert_value(self):
+        return self._convert_value_noop
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # Datetimes are stored as UTC text; 2440587.5 is the Julian day of the epoch
+        return self.as_sql(compiler, connection, template='(julianday(%(expressions)s) - 2440587.5)',
+                           **extra_context)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='UNIX_TIMESTAMP(%(expressions)s) / 86400.0',
+                           **extra_context)
+
+
+def load_quantity_series(now, window_days):
+    """Quantity points of the last window_days as (sample pks, days before now, quantities)"""
+    since = now - timedelta(days=window_days)
+    edits = (HistoricalSample.objects.filter(history_date__gte=since).exclude(history_type='-')
+             .order_by().annotate(day=EpochDays('history_date')).values_list('id', 'day', 'quantity'))
+    moves = (SampleTransaction.objects.filter(created_at__gte=since)
+             .order_by().annotate(day=EpochDays('created_at'))
+             .values_list('sample_id', 'day', 'quantity_after'))
+    points = np.array(list(edits.union(moves, all=True)), dtype=np.float64).reshape(-1, 3)
+    # A withdrawal appears in both the ledger and the history
+    points = np.unique(points, axis=0)
+    return (points[:, 0].astype(np.int64),
+            points[:, 1] - now.timestamp() / SECONDS_PER_DAY,
+            np.nan_to_num(points[:, 2]))
+
+
+def fit_depletion(pks, days, quantities, current_pks, current_quantities):
+    """Consumption rate (vials per day) and days left for each current sample
+
+    Returns (pks, rates, days_left) for the samples with a positive rate;
+    days_left is inf where the rate is too low to matter.
+    """
+    # Current quantities close every series at day 0
+    pks = np.concatenate([pks, current_pks])
+    days = np.concatenate([days, np.zeros(len(current_pks))])
+    quantities = np.concatenate([quantities, current_quantities])
+    order = np.lexsort((days, pks))
+    pks, days, quantities = pks[order], days[order], quantities[order]
+
+    # Vials used since the previous point of the same sample
+    same_sample = pks[1:] == pks[:-1]
+    used = np.zeros(len(pks))
+    used[1:] = np.where(same_sample, np.maximum(quantities[:-1] - quantities[1:], 0.0), 0.0)
+
+    groups, starts, group_of = np.unique(pks, return_index=True, return_inverse=True)
+    consumed = np.cumsum(used)
+    consumed -= consumed[starts][group_of]
+
+    # Least-squares slope of consumed against days, per sample
+    count = np.bincount(group_of).astype(np.float64)
+    sum_x = np.bincount(group_of, weights=days)
+    sum_y = np.bincount(group_of, weights=consumed)
+    sum_xx = np.bincount(group_of, weights=days * days)
+    sum_xy = np.bincount(group_of, weights=days * consumed)
+    denominator = count * sum_xx - sum_x * sum_x
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rates = (count * sum_xy - sum_x * sum_y) / denominator
+
+    # Only samples that exist now, have enough points and were used
+    current = np.zeros(len(groups), dtype=bool)
+    current[np.searchsorted(groups, current_pks)] = True
+    keep = current & (count >= MIN_POINTS) & (denominator > 0) & (rates > 0)
+    quantity_now = np.zeros(len(groups))
+    quantity_now[np.searchsorted(groups, current_pks)] = current_quantities
+    days_left = quantity_now[keep] / rates[keep]
+    days_left[days_left > MAX_FORECAST_DAYS] = np.inf
+    return groups[keep], rates[keep], days_left
+
+
+def update_forecasts(now=None):
+    """Recompute every forecast; returns the number of samples with one"""
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    pks, days, quantities = load_quantity_series(now, settings.DEPLETION_FORECAST_WINDOW_DAYS)
+    current = list(Sample.objects.filter(quantity__gt=0).order_by().values_list('pk', 'quantity'))
+    current_pks = np.array([pk for pk, quantity in current], dtype=np.int64)
+    current_quantities = np.array([quantity for pk, quantity in current], dtype=np.float64)
+    sample_pks, rates, days_left = fit_depletion(pks, days, quantities, current_pks, current_quantities)
+
+    # 100k forecasts through bulk_create would spend longer preparing each
+    # field of each instance than the whole fit; the rows are plain values
+    connection = connections[router.db_for_write(DepletionForecast)]
+    computed_at = connection.ops.adapt_datetimefield_value(now)
+    dates = {}
+    forecasts = []
+    for pk, rate, left in zip(sample_pks.tolist(), rates.tolist(), days_left.tolist()):
+        ahead = math.ceil(left) if math.isfinite(left) else None
+        if ahead not in dates:
+            dates[ahead] = (connection.ops.adapt_datefield_value(today + timedelta(days=ahead))
+                            if ahead is not None else None)
+        forecasts.append((pk, round(rate, 4), dates[ahead], computed_at))
+    table = DepletionForecast._meta.db_table
+    columns = [DepletionForecast._meta.get_field(name).column
+               for name in ('sample', 'daily_usage', 'depletion_date', 'computed_at')]
+    sql = (f'INSERT INTO {connection.ops.quote_name(table)} '
+           f'({", ".join(connection.ops.quote_name(column) for column in columns)}) '
+           f'VALUES ({", ".join(["%s"] * len(columns))})')
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        DepletionForecast.objects.using(connection.alias).all().delete()
+        for offset in range(0, len(forecasts), WRITE_BATCH_SIZE):
+            cursor.executemany(sql, forecasts[offset:offset + WRITE_BATCH_SIZE])
+    bump_data_version()
+    return len(forecasts)
+
+
+def running_out(today, days):
+    """Forecasts of samples projected to run out within days, soonest first"""
+    return (DepletionForecast.objects.select_related('sample')
+            .filter(depletion_date__lte=today + timedelta(days=days))
+            .order_by('depletion_date', F('daily_usage').desc()))
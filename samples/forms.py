@@ -1,11 +1,19 @@
+import mimetypes
+import os
+import zipfile
+
 from django import forms
+from django.conf import settings
 from django.utils.translation import gettext_lazy as _
-from .models import Sample, SiteSettings
+from .models import Sample, SampleAttachment, SampleTransaction, SiteSettings
 
 
 class SampleForm(forms.ModelForm):
     """Form for creating and editing samples"""
     
+    # Version of the sample the form was loaded from (see concurrency.py)
+    version = forms.IntegerField(widget=forms.HiddenInput, required=False)
+    
     class Meta:
         model = Sample
         fields = [
@@ -85,6 +93,15 @@ class SampleForm(forms.ModelForm):
             }),
         }
     
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.fields['version'].initial = self.instance.version
+        else:
+            # Left blank, the next ID of the type is assigned (see sequences.py)
+            self.fields['sample_id'].required = False
+            self.fields['sample_id'].widget.attrs['placeholder'] = _('Leave blank for the next ID, e.g., IPSC-2024-001')
+    
     def clean_viability(self):
         viability = self.cleaned_data.get('viability')
         if viability is not None:
@@ -119,6 +136,93 @@ class SampleForm(forms.ModelForm):
         return cleaned_data
 
 
+class SampleTransactionForm(forms.Form):
+    """Form for withdrawing vials from or depositing vials into a sample"""
+    
+    kind = forms.ChoiceField(
+        choices=SampleTransaction.KIND_CHOICES,
+        initial=SampleTransaction.WITHDRAWAL,
+        label=_('Type'),
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    amount = forms.FloatField(
+        min_value=0.1,
+        initial=1,
+        label=_('Amount (vials)'),
+        widget=forms.NumberInput(attrs={
+            'class': 'form-control',
+            'step': '0.1',
+            'min': '0.1'
+        })
+    )
+    note = forms.CharField(
+        max_length=200,
+        required=False,
+        label=_('Note'),
+        widget=forms.TextInput(attrs={
+            'class': 'form-control',
+            'placeholder': _('e.g., Thawed for differentiation')
+        })
+    )
+
+
+class AttachmentUploadForm(forms.Form):
+    """Form for starting a chunked attachment upload (see attachments.py)
+
+    The page only shows the type; the uploader sends the rest from the file.
+    """
+    
+    kind = forms.ChoiceField(
+        choices=SampleAttachment.KIND_CHOICES,
+        required=False,
+        label=_('Type'),
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    filename = forms.CharField(
+        max_length=255
+    )
+    size = forms.IntegerField(
+        min_value=1
+    )
+    sha256 = forms.RegexField(
+        regex=r'^[0-9a-fA-F]{64}$',
+        required=False
+    )
+    content_type = forms.CharField(
+        max_length=100,
+        required=False
+    )
+    
+    def clean_kind(self):
+        return self.cleaned_data['kind'] or 'OTHER'
+    
+    def clean_filename(self):
+        # Browsers on Windows used to send the full path
+        filename = os.path.basename(self.cleaned_data['filename'].replace('\\', '/')).strip()
+        if not filename:
+            raise forms.ValidationError(_('A file name is required.'))
+        return filename
+    
+    def clean_size(self):
+        size = self.cleaned_data['size']
+        if size > settings.ATTACHMENT_MAX_SIZE:
+            raise forms.ValidationError(_('Attachments can be at most %(size)d MB.') % {
+                'size': settings.ATTACHMENT_MAX_SIZE // 2**20})
+        return size
+    
+    def clean_sha256(self):
+        return self.cleaned_data['sha256'].lower()
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        content_type = cleaned_data.get('content_type', '')
+        # Sent back in the download's Content-Type header
+        if not content_type or '/' not in content_type or any(char in content_type for char in '\r\n'):
+            guessed = mimetypes.guess_type(cleaned_data.get('filename', ''))[0]
+            cleaned_data['content_type'] = guessed or 'application/octet-stream'
+        return cleaned_data
+
+
 class SiteSettingsForm(forms.ModelForm):
     """Form for editing site settings"""
     
@@ -176,3 +280,39 @@ class ExportForm(forms.Form):
         initial=['sample_id', 'name', 'sample_type', 'status', 'quantity', 'storage_location'],
         required=False
     )
+
+
+class QCImportForm(forms.Form):
+    """Form for uploading a cell counter export (see qc_import.py)"""
+    
+    file = forms.FileField(
+        label=_('Results file'),
+        widget=forms.FileInput(attrs={
+            'class': 'form-control',
+            'accept': '.csv,.tsv,.txt,text/csv,text/plain'
+        })
+    )
+    dry_run = forms.BooleanField(
+        label=_('Check only, do not update samples'),
+        required=False,
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'})
+    )
+
+
+class ImageImportForm(forms.Form):
+    """Form for uploading a ZIP of images named by sample ID (see image_import.py)"""
+    
+    archive = forms.FileField(
+        label=_('ZIP archive'),
+        widget=forms.FileInput(attrs={
+            'class': 'form-control',
+            'accept': '.zip,application/zip'
+        })
+    )
+    
+    def clean_archive(self):
+        archive = self.cleaned_data['archive']
+        if not zipfile.is_zipfile(archive):
+            raise forms.ValidationError(_('This is not a ZIP file.'))
+        archive.seek(0)
+        return archive
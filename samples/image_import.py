@@ -0,0 +1,192 @@
+"""
+Bulk import of sample images from a ZIP archive.
+
+After an imaging session the micrographs are named by sample ID
+(``IPSC-2024-001.tif``). ``import_image_archive`` attaches each one to its
+sample instead of one upload and ``sample_update`` per image:
+
+1. Only the archive's directory is read here, never the image data. Member
+   names without their extension are matched to sample IDs in a few
+   ``IN (...)`` queries (lookup.py). Members whose header gives an
+   uncompressed size over IMAGE_IMPORT_MAX_FILE_SIZE are refused here, and
+   the workers stop extracting at that size whatever the header says.
+2. A process pool compresses the matched images (images.py). Each worker
+   opens the archive on disk and reads only its own member.
+3. As JPEGs come back they are saved to storage, and the samples are
+   updated ATTACH_BATCH_SIZE at a time, each batch with one UPDATE and one
+   bulk insert of history records. The data version is bumped once
+   at the end.
+
+Names with no sample, a second image for the same sample, and files that
+cannot be decoded are reported, not attached.
+"""
+
+import os
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Case, CharField, F, Value, When
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+from . import images, metrics
+from .cache import bump_data_version
+from .lookup import fetch_samples_by_sample_id
+from .models import Sample
+
+
+ATTACH_BATCH_SIZE = 50
+
+
+class ImageImportResult:
+    """What an import attached and what it could not"""
+
+    def __init__(self):
+        self.attached = []     # sample IDs
+        self.unmatched = []    # member names
+        self.errors = []       # (member name, message)
+        self.duration = 0.0
+
+    @property
+    def images_per_second(self):
+        return len(self.attached) / self.duration if self.duration else 0.0
+
+
+@contextmanager
+def uploaded_archive(upload):
+    """A path on disk for an uploaded ZIP, which worker processes can open
+
+    Large uploads already are temporary files; small ones, kept in memory
+    by Django, are written out.
+    """
+    if hasattr(upload, 'temporary_file_path'):
+        yield upload.temporary_file_path()
+        return
+    with tempfile.NamedTemporaryFile(suffix='.zip') as archive:
+        for chunk in upload.chunks():
+            archive.write(chunk)
+        archive.flush()
+        yield archive.name
+
+
+def match_archive(archive_path, result):
+    """{member name: Sample} for the images in an archive named after a sample ID
+
+    Names are tried as written, then in upper case. Members that match no
+    sample go to result.unmatched, second images for a sample and files
+    over IMAGE_IMPORT_MAX_FILE_SIZE uncompressed to result.errors.
+    """
+    max_size = settings.IMAGE_IMPORT_MAX_FILE_SIZE
+    with zipfile.ZipFile(archive_path) as archive:
+        members = [info for info in archive.infolist() if images.is_image_name(info.filename)]
+    names = []
+    for info in members:
+        if info.file_size > max_size:
+            result.errors.append((info.filename, _('The file is larger than %(size)d MB uncompressed.')
+                                  % {'size': max_size // 2**20}))
+        else:
+            names.append(info.filename)
+    stems = {name: os.path.splitext(os.path.basename(name))[0].strip() for name in names}
+    samples = fetch_samples_by_sample_id([*stems.values(), *(stem.upper() for stem in stems.values())])
+
+    matched = {}
+    seen = {}
+    for name in names:
+        stem = stems[name]
+        sample = samples.get(stem) or samples.get(stem.upper())
+        if sample is None:
+            result.unmatched.append(name)
+        elif sample.pk in seen:
+            result.errors.append((name, _('Another image for %(sample_id)s (%(name)s) is in the archive.')
+                                  % {'sample_id': sample.sample_id, 'name': seen[sample.pk]}))
+        else:
+            seen[sample.pk] = name
+            matched[name] = sample
+    return matched
+
+
+def _attach(saved, user, source, now):
+    """Point samples at their saved images ({pk: storage name}); returns their sample IDs
+
+    One UPDATE sets the images and increments the version from the rows as
+    they are when written, so an edit committed since the archive was
+    matched is kept, and the history is built from the rows as the UPDATE
+    left them. Images of samples deleted in the meantime are removed.
+    """
+    reason = _('Image import') + (f': {source}' if source else '')
+    with transaction.atomic():
+        Sample.objects.filter(pk__in=saved).update(
+            image=Case(*(When(pk=pk, then=Value(name)) for pk, name in saved.items()),
+                       output_field=CharField()),
+            updated_at=now, version=F('version') + 1,
+        )
+        # The rows as the UPDATE left them; written, they stay locked
+        # (SQLite: the database) until commit
+        samples = list(Sample.objects.filter(pk__in=saved))
+        Sample.history.bulk_history_create(
+            samples, default_user=user, default_change_reason=reason, default_date=now,
+        )
+    storage = Sample._meta.get_field('image').storage
+    for pk in saved.keys() - {sample.pk for sample in samples}:
+        storage.delete(saved[pk])
+    return [sample.sample_id for sample in samples]
+
+
+def _compressed(archive_path, names, workers, max_dimension, max_size_kb, max_pixels, max_bytes):
+    """(name, JPEG bytes or None, error, seconds) per member, in completion order"""
+    if workers <= 1:
+        for name in names:
+            yield images.compress_archive_member(archive_path, name, max_dimension, max_size_kb, max_pixels,
+                                                 max_bytes)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(images.compress_archive_member, archive_path, name, max_dimension,
+                                   max_size_kb, max_pixels, max_bytes)
+                   for name in names]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def import_image_archive(archive_path, user=None, source='', workers=None, max_dimension=1200,
+                         max_size_kb=500):
+    """Attach the images of a ZIP file on disk to their samples; returns an ImageImportResult
+
+    workers defaults to IMAGE_IMPORT_WORKERS, or one per CPU.
+    """
+    start = time.perf_counter()
+    result = ImageImportResult()
+    matched = match_archive(archive_path, result)
+    workers = workers or settings.IMAGE_IMPORT_WORKERS or os.cpu_count() or 1
+    field = Sample._meta.get_field('image')
+
+    now = timezone.now()
+    pending = {}
+    compressed = _compressed(archive_path, list(matched), min(workers, len(matched)),
+                             max_dimension, max_size_kb, settings.IMAGE_MAX_PIXELS,
+                             settings.IMAGE_IMPORT_MAX_FILE_SIZE)
+    for name, data, error, seconds in compressed:
+        metrics.observe('image_processing_duration_seconds', seconds)
+        if data is None:
+            result.errors.append((name, _('Could not read the image: %(error)s') % {'error': error}
+                                  if error else _('Not an image file.')))
+            continue
+        sample = matched[name]
+        filename = field.generate_filename(sample, f'{sample.sample_id}.jpg')
+        pending[sample.pk] = field.storage.save(filename, ContentFile(data), max_length=field.max_length)
+        if len(pending) >= ATTACH_BATCH_SIZE:
+            result.attached += _attach(pending, user, source, now)
+            pending = {}
+    if pending:
+        result.attached += _attach(pending, user, source, now)
+    if result.attached:
+        # The UPDATE sends no post_save
+        bump_data_version()
+    result.duration = time.perf_counter() - start
+    return result
+
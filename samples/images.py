@@ -0,0 +1,202 @@
+"""
+Compression of sample images.
+
+``compress_image`` turns any image Pillow can read into a JPEG that fits
+max_dimension and, where possible, max_size_kb. Microscope images can be
+50 megapixels or more, so it avoids holding them at full size:
+
+* Opening an image reads only its header. Images over max_pixels are
+  rejected before any pixel is decoded.
+* JPEGs are decoded straight at 1/2, 1/4 or 1/8 scale (Pillow's ``draft``),
+  never smaller than max_dimension. Other formats are decoded once and
+  shrunk in integer steps (``reduce``) before the final resampling.
+  Alpha is dropped before resizing, other conversions for JPEG (16-bit,
+  CMYK) happen after it.
+* The JPEG is written to a spooled temporary file. When it is over
+  max_size_kb, a binary search finds the highest quality that fits. If
+  even MIN_QUALITY is too large, the image is scaled down further.
+
+This module only needs Pillow and the standard library, not Django, so the
+bulk import (image_import.py) can run it in worker processes.
+``compress_archive_member`` is the function those workers run: it opens the
+ZIP itself and reads only its own member, so image data is never passed
+between processes, only the small JPEG that comes back.
+"""
+
+import os
+import tempfile
+import time
+import zipfile
+
+from PIL import Image, UnidentifiedImageError
+
+
+JPEG_QUALITY = 85
+# Lowest quality tried to meet max_size_kb before scaling down instead
+MIN_QUALITY = 40
+# Scaling down below this longest side is not worth it to meet max_size_kb
+MIN_DIMENSION = 400
+# Resize in integer reduce() steps down to this multiple of the target size
+REDUCING_GAP = 2.0
+# Below Pillow's own decompression bomb warning (about 89 megapixels)
+MAX_PIXELS = 80_000_000
+# Files larger than this are spooled to disk instead of memory
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+# Largest archive member extracted, uncompressed (a 50-megapixel 16-bit
+# RGB TIFF is 300 MB)
+MAX_MEMBER_BYTES = 512 * 1024 * 1024
+COPY_BLOCK_SIZE = 1024 * 1024
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.tif', '.tiff', '.bmp', '.gif', '.webp'}
+
+
+class ImageTooLarge(ValueError):
+    """The image has more pixels than allowed"""
+
+
+class MemberTooLarge(ValueError):
+    """An archive member is larger than allowed once decompressed"""
+
+    def __init__(self, max_bytes):
+        super().__init__(f'the file is over the limit of {max_bytes / 2**20:g} MB uncompressed')
+        self.max_bytes = max_bytes
+
+
+def _jpeg_mode(img):
+    """img in a mode JPEG can store (RGB or L)"""
+    if img.mode in ('RGB', 'L'):
+        return img
+    if img.mode in ('I', 'F') or img.mode.startswith('I;16'):
+        # 16-bit and float camera data: stretch the recorded range over 0-255,
+        # which plain conversion would clip to white
+        img = img.convert('F')
+        low, high = img.getextrema()
+        scale = 255 / (high - low) if high > low else 0
+        return img.point(lambda value: (value - low) * scale).convert('L')
+    # CMYK and other colour spaces
+    return img.convert('RGB')
+
+
+def _encode(img, output, quality):
+    output.seek(0)
+    output.truncate()
+    img.save(output, format='JPEG', quality=quality, optimize=True)
+    return output.tell()
+
+
+def _encode_within(img, output, max_bytes):
+    """Encode img into output at the highest quality that fits max_bytes
+
+    Scales img down by a quarter at a time when even MIN_QUALITY does not
+    fit, and keeps the MIN_QUALITY result once it is MIN_DIMENSION wide.
+    """
+    while True:
+        if _encode(img, output, JPEG_QUALITY) <= max_bytes:
+            return
+        low, high, best = MIN_QUALITY, JPEG_QUALITY - 1, None
+        while low <= high:
+            quality = (low + high) // 2
+            if _encode(img, output, quality) <= max_bytes:
+                best, low = quality, quality + 1
+            else:
+                high = quality - 1
+        if best is not None:
+            if best != quality:
+                _encode(img, output, best)
+            return
+        if max(img.size) * 3 // 4 < MIN_DIMENSION:
+            _encode(img, output, MIN_QUALITY)
+            return
+        img = img.resize((img.width * 3 // 4, img.height * 3 // 4), Image.Resampling.LANCZOS)
+
+
+def load_scaled(source, max_dimension=1200, max_pixels=MAX_PIXELS):
+    """Open an image (a path or a file object) scaled to fit max_dimension, in a JPEG mode
+
+    Each full-size step is released once the next one exists, which a
+    ``with Image.open()`` block would prevent. Raises ImageTooLarge for
+    images over max_pixels, and Pillow's errors for files it cannot read.
+    """
+    img = Image.open(source)
+    try:
+        if img.width * img.height > max_pixels:
+            raise ImageTooLarge(f'{img.width}x{img.height} pixels is over the limit of '
+                                f'{max_pixels / 1e6:g} megapixels')
+        # JPEG only: decode at the smallest 1/2^n scale still max_dimension wide
+        img.draft(None, (max_dimension, max_dimension))
+        # JPEG drops alpha anyway, and resampling with it makes a full-size
+        # premultiplied copy; palette images resample by nearest neighbour
+        if img.mode in ('RGBA', 'LA', 'P', 'PA', '1'):
+            img = img.convert('L' if img.mode in ('LA', '1') else 'RGB')
+        if img.width > max_dimension or img.height > max_dimension:
+            # reduce() has no 16-bit support; those resample in one step
+            reducing_gap = None if img.mode.startswith('I;16') else REDUCING_GAP
+            img.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS, reducing_gap=reducing_gap)
+        return _jpeg_mode(img)
+    except BaseException:
+        img.close()
+        raise
+
+
+def compress_image(source, max_dimension=1200, max_size_kb=500, max_pixels=MAX_PIXELS):
+    """Compress an image (a path or a file object) to a JPEG
+
+    Returns a temporary file holding the JPEG, positioned at its start;
+    the caller closes it. Raises like load_scaled.
+    """
+    img = load_scaled(source, max_dimension, max_pixels)
+    output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    try:
+        if max_size_kb:
+            _encode_within(img, output, max_size_kb * 1024)
+        else:
+            _encode(img, output, JPEG_QUALITY)
+    except BaseException:
+        output.close()
+        raise
+    finally:
+        img.close()
+    output.seek(0)
+    return output
+
+
+def is_image_name(name):
+    """Whether an archive member looks like an image, skipping folders and OS metadata"""
+    base = os.path.basename(name)
+    return (not name.endswith('/') and not base.startswith('.') and '__MACOSX' not in name
+            and os.path.splitext(base)[1].lower() in IMAGE_EXTENSIONS)
+
+
+def _copy_member(member, target, max_bytes):
+    """Copy an open archive member, stopping past max_bytes whatever its header claims"""
+    copied = 0
+    while block := member.read(COPY_BLOCK_SIZE):
+        copied += len(block)
+        if copied > max_bytes:
+            raise MemberTooLarge(max_bytes)
+        target.write(block)
+
+
+def compress_archive_member(archive_path, name, max_dimension=1200, max_size_kb=500, max_pixels=MAX_PIXELS,
+                            max_bytes=MAX_MEMBER_BYTES):
+    """Compress one member of a ZIP file; returns (name, JPEG bytes or None, error, seconds)
+
+    error is empty when the member is not in a format Pillow knows. Runs in
+    a worker process. The member is copied to a spooled temporary file
+    first because Pillow seeks while decoding, and seeking backwards in a
+    compressed ZIP member restarts its decompression. The copy stops at
+    max_bytes, so a member that inflates far beyond its size in the
+    archive (a ZIP bomb) never fills the disk.
+    """
+    start = time.perf_counter()
+    try:
+        with zipfile.ZipFile(archive_path) as archive, archive.open(name) as member, \
+                tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES) as spool:
+            _copy_member(member, spool, max_bytes)
+            spool.seek(0)
+            with compress_image(spool, max_dimension, max_size_kb, max_pixels) as output:
+                data = output.read()
+    except UnidentifiedImageError:
+        return name, None, '', time.perf_counter() - start
+    except Exception as e:
+        return name, None, str(e) or e.__class__.__name__, time.perf_counter() - start
+    return name, data, '', time.perf_counter() - start
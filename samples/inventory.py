@@ -0,0 +1,117 @@
+"""
+Vial withdrawals and deposits.
+
+Quantities are changed with a single conditional UPDATE
+(``quantity = quantity - n WHERE quantity >= n``) instead of a read-modify-
+save of the whole sample, so concurrent withdrawals never overwrite each
+other and the balance can never go negative. The same statement marks a
+sample DEPLETED when the withdrawal empties it. Each change writes one
+SampleTransaction row and one history record of the sample as the change
+left it, dated the same moment, so the history admin, the inventory as of
+a date and the daily snapshots all see it. It also moves the sample's
+version on, so an edit form opened before the withdrawal cannot save a
+stale quantity over it (see concurrency.py).
+
+Quantities are floats, so 0.3 - 0.1 - 0.1 is 0.09999999999999998, not 0.1.
+Amounts and the balances the UPDATE writes are rounded to
+QUANTITY_DECIMALS, and the guard and the DEPLETED check allow half a unit
+of that precision, so a vial can always be withdrawn down to exactly zero.
+"""
+
+from django.db import router, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Greatest, Round
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+from .cache import bump_data_version
+from .models import Sample, SampleTransaction
+
+
+# Vial amounts are recorded to a thousandth
+QUANTITY_DECIMALS = 3
+QUANTITY_TOLERANCE = 0.5 * 10 ** -QUANTITY_DECIMALS
+
+
+class InsufficientQuantity(Exception):
+    """The sample holds fewer vials than the requested withdrawal"""
+
+    def __init__(self, available):
+        super().__init__(_('Only %(quantity)s vials available.') % {'quantity': f'{available:g}'})
+        self.available = available
+
+
+def _rounded(expression):
+    return Round(expression, QUANTITY_DECIMALS)
+
+
+def _apply(sample_pk, kind, amount, user, note, guard, changes):
+    # Read back from the database written to, never from a replica
+    db = router.db_for_write(Sample)
+    with transaction.atomic(using=db):
+        # UPDATE evaluates every expression against the row as it was
+        # before the statement, so the status check sees the old quantity
+        updated = Sample.objects.using(db).filter(pk=sample_pk, **guard).update(
+            updated_at=timezone.now(), version=F('version') + 1, **changes)
+        if not updated:
+            available = Sample.objects.using(db).filter(pk=sample_pk).values_list('quantity', flat=True).first()
+            if available is None:
+                raise Sample.DoesNotExist
+            raise InsufficientQuantity(available)
+        # The row stays locked by our UPDATE until commit, so this is the
+        # sample as our change left it
+        sample = Sample.objects.using(db).get(pk=sample_pk)
+        entry = SampleTransaction.objects.using(db).create(
+            sample_id=sample_pk, kind=kind, amount=amount, quantity_after=sample.quantity,
+            note=note, performed_by=user,
+        )
+        Sample.history.bulk_history_create(
+            [sample], update=True, default_user=user, default_change_reason=str(entry),
+            default_date=entry.created_at,
+        )
+    # update() sends no post_save, so invalidate cached pages here
+    bump_data_version()
+    return entry, sample.status
+
+
+def status_after(kind, status, quantity_after):
+    """The status a withdrawal or deposit leaving quantity_after gives a sample in status"""
+    if kind == SampleTransaction.WITHDRAWAL and quantity_after <= QUANTITY_TOLERANCE:
+        return 'DEPLETED'
+    if kind == SampleTransaction.DEPOSIT and status == 'DEPLETED':
+        return 'AVAILABLE'
+    return status
+
+
+def _checked_amount(amount):
+    amount = round(amount, QUANTITY_DECIMALS)
+    if not amount > 0:
+        raise ValueError('amount must be positive')
+    return amount
+
+
+def withdraw(sample_pk, amount, user=None, note=''):
+    """Take amount vials out of a sample; returns (SampleTransaction, status)
+
+    Raises InsufficientQuantity if that would leave a negative balance.
+    """
+    amount = _checked_amount(amount)
+    return _apply(sample_pk, SampleTransaction.WITHDRAWAL, amount, user, note,
+                  {'quantity__gte': amount - QUANTITY_TOLERANCE}, {
+        # Never below zero, even by the tolerance the guard allows
+        'quantity': Greatest(_rounded(F('quantity') - amount), Value(0.0)),
+        'status': Case(When(quantity__lte=amount + QUANTITY_TOLERANCE, then=Value('DEPLETED')),
+                       default=F('status')),
+    })
+
+
+def deposit(sample_pk, amount, user=None, note=''):
+    """Put amount vials back into a sample; returns (SampleTransaction, status)
+
+    A DEPLETED sample becomes AVAILABLE again.
+    """
+    amount = _checked_amount(amount)
+    return _apply(sample_pk, SampleTransaction.DEPOSIT, amount, user, note, {}, {
+        'quantity': _rounded(F('quantity') + amount),
+        'status': Case(When(status='DEPLETED', then=Value('AVAILABLE')), default=F('status')),
+    })
@@ -0,0 +1,122 @@
+"""
+Live dashboard updates (Server-Sent Events).
+
+The change feed is the data-version counter from cache.py: every Sample or
+SiteSettings save bumps it. One VersionWatcher per process reads that single
+cache key every DASHBOARD_EVENTS_POLL_SECONDS and wakes the open streams
+when it changes, so idle dashboards cost one cache read per interval in
+total, not per connection. The new dashboard state is then built once per
+version and language and shared through the cache; each stream sends only
+what differs from the state it last sent.
+"""
+
+import asyncio
+import json
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.translation import get_language
+
+from .cache import get_data_version
+from .views import dashboard_context
+
+
+STAT_KEYS = ['total', 'available', 'in_use', 'depleted', 'reserved', 'quarantine']
+
+# Panels of home.html that are re-rendered and pushed when they change
+PANELS = ['recent_samples', 'samples_by_type', 'expiring_soon', 'low_stock', 'running_out']
+
+
+def dashboard_snapshot(version, today):
+    """Statistics and rendered panels of the dashboard at a data version"""
+    key = f'dashboard:snapshot:{version}:{get_language()}:{today}'
+    snapshot = cache.get(key)
+    if snapshot is None:
+        context = dashboard_context(today)
+        snapshot = {
+            'stats': {name: context['stats'][name] for name in STAT_KEYS},
+            'panels': {
+                name: render_to_string(f'samples/dashboard/{name}.html', context)
+                for name in PANELS
+            },
+        }
+        cache.set(key, snapshot, settings.PAGE_CACHE_TIMEOUT)
+    return snapshot
+
+
+def snapshot_changes(old, new):
+    """Event payload with the counters and panels that differ from old
+
+    With no previous snapshot (first event of a connection that missed a
+    change) everything is sent, without deltas.
+    """
+    if old is None:
+        return {'stats': new['stats'], 'deltas': {}, 'panels': new['panels']}
+    stats = {name: value for name, value in new['stats'].items() if value != old['stats'].get(name)}
+    return {
+        'stats': stats,
+        'deltas': {name: value - old['stats'].get(name, 0) for name, value in stats.items()},
+        'panels': {name: html for name, html in new['panels'].items() if html != old['panels'].get(name)},
+    }
+
+
+def format_event(event, data, event_id=None):
+    """One text/event-stream message"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    # json.dumps escapes newlines, so the payload is always one data line
+    lines.append(f'data: {json.dumps(data, ensure_ascii=False)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+class VersionWatcher:
+    """Polls the data version on behalf of every stream of an event loop"""
+
+    def __init__(self):
+        self.version = None
+        self.changed = asyncio.Event()
+        self.listeners = 0
+        self.task = None
+
+    async def wait(self, version, timeout):
+        """The current version once it differs from version, or None on timeout"""
+        self.listeners += 1
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self.poll())
+        try:
+            while self.version is None or self.version == version:
+                try:
+                    await asyncio.wait_for(self.changed.wait(), timeout)
+                except asyncio.TimeoutError:
+                    return None
+            return self.version
+        finally:
+            self.listeners -= 1
+
+    async def poll(self):
+        # Stops when no stream is waiting; the next wait() restarts it.
+        # A cache read needs no particular thread, so use the shared pool.
+        read_version = sync_to_async(get_data_version, thread_sensitive=False)
+        while self.listeners:
+            version = str(await read_version())
+            if version != self.version:
+                self.version = version
+                self.changed.set()
+                self.changed = asyncio.Event()
+            await asyncio.sleep(settings.DASHBOARD_EVENTS_POLL_SECONDS)
+
+
+_watchers = weakref.WeakKeyDictionary()
+
+
+async def wait_for_change(version, timeout):
+    """Wait until the data version differs from version; None on timeout"""
+    loop = asyncio.get_running_loop()
+    if loop not in _watchers:
+        _watchers[loop] = VersionWatcher()
+    return await _watchers[loop].wait(version, timeout)
@@ -0,0 +1,54 @@
+"""
+Bulk lookups of samples by their human-readable ``sample_id``.
+
+Large ID lists are split into chunks so each ``IN (...)`` query stays under
+SQLite's bound-parameter limit (999 on older builds); every chunk is a
+single range of probes on the unique ``sample_id`` index.
+"""
+
+from .models import Sample
+
+
+# Stay below SQLite's historical SQLITE_MAX_VARIABLE_NUMBER of 999
+IN_QUERY_CHUNK_SIZE = 900
+
+
+def chunked(values, size=IN_QUERY_CHUNK_SIZE):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _lookup_queries(sample_ids, fields):
+    fields = list(fields)
+    if 'sample_id' not in fields:
+        fields.append('sample_id')
+    unique_ids = list(dict.fromkeys(sample_ids))
+    for chunk in chunked(unique_ids):
+        yield Sample.objects.filter(sample_id__in=chunk).values(*fields)
+
+
+def fetch_by_sample_id(sample_ids, fields=('id', 'sample_id')):
+    """Return {sample_id: row dict} for the IDs that exist"""
+    rows = {}
+    for queryset in _lookup_queries(sample_ids, fields):
+        for row in queryset:
+            rows[row['sample_id']] = row
+    return rows
+
+
+def fetch_samples_by_sample_id(sample_ids):
+    """Return {sample_id: Sample} for the IDs that exist, for bulk updates"""
+    samples = {}
+    for chunk in chunked(list(dict.fromkeys(sample_ids))):
+        for sample in Sample.objects.filter(sample_id__in=chunk).order_by():
+            samples[sample.sample_id] = sample
+    return samples
+
+
+async def afetch_by_sample_id(sample_ids, fields=('id', 'sample_id')):
+    """Async version of fetch_by_sample_id, for async views"""
+    rows = {}
+    for queryset in _lookup_queries(sample_ids, fields):
+        async for row in queryset:
+            rows[row['sample_id']] = row
+    return rows
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from samples.models import Sample
+from samples.quality import quality_report
+
+
+class Command(BaseCommand):
+    help = ('Compute the viability and passage analytics, store them for the quality page '
+            '(until samples change) and print declining lines and outliers')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        report = quality_report(refresh=True)
+        elapsed = time.perf_counter() - start
+
+        sample_types = dict(Sample.SAMPLE_TYPE_CHOICES)
+        self.stdout.write(f"{report['sample_count']} samples, {report['fitted_lines']} lines fitted "
+                          f"in {elapsed:.2f}s\n")
+        self.stdout.write(f"{'type':<8}{'samples':>9}{'mean':>8}{'median':>8}{'p10':>8}{'p90':>8}{'/passage':>10}")
+        for row in report['types']:
+            slope = '-' if row['slope'] is None else f"{row['slope']:.2f}"
+            self.stdout.write(f"{row['sample_type']:<8}{row['count']:>9}{row['mean']:>8.1f}{row['median']:>8.1f}"
+                              f"{row['p10']:>8.1f}{row['p90']:>8.1f}{slope:>10}")
+        self.stdout.write(f"\n{report['declining_count']} lines losing viability with passage")
+        for line in report['declining_lines'][:20]:
+            self.stdout.write(f"  {line['name']:<40} {line['slope']:6.2f}/passage over "
+                              f"P{line['first_passage']}-P{line['last_passage']} ({line['samples']} samples)")
+        self.stdout.write(f"\n{report['outlier_count']} viability outliers")
+        for sample in report['outliers'][:20]:
+            self.stdout.write(f"  {sample['sample_id']:<20} {sample_types.get(sample['sample_type'], sample['sample_type'])}: "
+                              f"{sample['viability']:.1f}% (type median {sample['type_median']:.1f}%)")
@@ -0,0 +1,139 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.contrib.sessions.backends.base import SessionBase
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from samples.admin import HistoricalSampleAdmin, SampleAdmin
+from samples.db import scratch_database
+from samples.models import Sample
+
+
+HistoricalSample = Sample.history.model
+
+STATUSES = [value for value, label in Sample.STATUS_CHOICES]
+SAMPLE_TYPES = [value for value, label in Sample.SAMPLE_TYPE_CHOICES]
+BATCH_SIZE = 5000
+
+
+class StockSampleAdmin(SampleAdmin):
+    """SampleAdmin as it was before the large-table settings"""
+    paginator = Paginator
+    show_full_result_count = True
+    list_select_related = False
+    date_hierarchy = None
+    list_filter = ('sample_type', 'status', 'research_use_only', 'created_at')
+    get_search_results = admin.ModelAdmin.get_search_results
+
+
+class StockHistoricalSampleAdmin(HistoricalSampleAdmin):
+    paginator = Paginator
+    show_full_result_count = True
+    list_select_related = False
+    date_hierarchy = None
+    list_filter = ('history_type', 'sample_type', 'status', 'history_date')
+    get_search_results = admin.ModelAdmin.get_search_results
+
+
+class Command(BaseCommand):
+    help = ('Time the Sample and Sample history admin change lists on a throwaway database '
+            'filled with generated rows, with the stock and the large-table admin settings')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--samples', type=int, default=50000)
+        parser.add_argument('--history', type=int, default=4, help='History records per sample')
+        parser.add_argument('--requests', type=int, default=5, help='Requests per page and profile')
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            user = User.objects.create_superuser('bench', 'bench@example.com', 'bench')
+            start = time.perf_counter()
+            self._populate(options['samples'], options['history'], user)
+            self.stdout.write(f"{options['samples']} samples, {options['samples'] * options['history']} "
+                              f"history records generated in {time.perf_counter() - start:.1f}s\n")
+
+            pages = [
+                ('first page', {}),
+                ('page 50', {'p': '49'}),
+                ('search', {'q': 'ipsc-2024-01'}),
+                ('filter status', {'status__exact': 'DEPLETED'}),
+            ]
+            self.stdout.write(f"{'admin':<10}{'page':<16}{'profile':<8}{'mean ms':>10}{'queries':>9}")
+            for label, model, profiles in (
+                ('sample', Sample, [('stock', StockSampleAdmin), ('tuned', SampleAdmin)]),
+                ('history', HistoricalSample,
+                 [('stock', StockHistoricalSampleAdmin), ('tuned', HistoricalSampleAdmin)]),
+            ):
+                for page, params in pages:
+                    for profile, admin_class in profiles:
+                        model_admin = admin_class(model, admin.site)
+                        timings, queries = self._measure(model_admin, user, params, options['requests'])
+                        self.stdout.write(f'{label:<10}{page:<16}{profile:<8}'
+                                          f'{statistics.mean(timings):>10.1f}{queries:>9}')
+
+    def _populate(self, count, history_per_sample, user):
+        rng = random.Random(0)
+        now = timezone.now()
+        samples = []
+        for number in range(1, count + 1):
+            sample_type = rng.choice(SAMPLE_TYPES)
+            sample = Sample(
+                sample_id=f'{sample_type}-{2020 + number % 6}-{number:06d}',
+                name=f'Line {number}', sample_type=sample_type, status=rng.choice(STATUSES),
+                storage_location=f'Freezer {number % 12}, Rack {number % 40}',
+                quantity=rng.randint(0, 20), created_by=user,
+                # Spread over the last few years so the date drill-down has levels
+                created_at=now - timedelta(hours=number),
+            )
+            sample.refresh_search_fields()
+            samples.append(sample)
+        # auto_now_add would overwrite the generated dates on insert
+        created_at = Sample._meta.get_field('created_at')
+        created_at.auto_now_add = False
+        try:
+            Sample.objects.bulk_create(samples, batch_size=BATCH_SIZE)
+        finally:
+            created_at.auto_now_add = True
+
+        history = []
+        fields = [field.attname for field in Sample._meta.fields
+                  if field.attname not in ('search_text', 'search_name')]
+        for sample in Sample.objects.order_by('id').iterator(chunk_size=BATCH_SIZE):
+            for version in range(history_per_sample):
+                history.append(HistoricalSample(
+                    **{name: getattr(sample, name) for name in fields},
+                    history_date=sample.created_at + timedelta(days=version),
+                    history_type='+' if version == 0 else '~',
+                    history_user=user,
+                ))
+            if len(history) >= BATCH_SIZE:
+                HistoricalSample.objects.bulk_create(history)
+                history = []
+        HistoricalSample.objects.bulk_create(history)
+
+    def _measure(self, model_admin, user, params, count):
+        factory = RequestFactory()
+        timings = []
+        for _ in range(count + 1):
+            request = factory.get('/admin/', params)
+            request.user = user
+            request.session = SessionBase()
+            request._messages = FallbackStorage(request)
+            connection.queries_log.clear()
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                model_admin.changelist_view(request).render()
+                elapsed = (time.perf_counter() - start) * 1000
+            timings.append(elapsed)
+        # The first request warms up templates and is left out
+        return timings[1:], len(context.captured_queries)
@@ -0,0 +1,128 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from samples.db import scratch_database
+from samples.history import inventory_as_of
+from samples.models import Sample
+
+
+HistoricalSample = Sample.history.model
+
+STATUSES = [value for value, label in Sample.STATUS_CHOICES]
+SAMPLE_TYPES = [value for value, label in Sample.SAMPLE_TYPE_CHOICES]
+BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = ('Time the "inventory as of" query on a throwaway database filled with generated '
+            'history records, against simple_history\'s as_of() and a per-sample walk, and '
+            'with and without the (id, history_date) index')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--samples', type=int, default=200000)
+        parser.add_argument('--history', type=int, default=10, help='History records per sample')
+        parser.add_argument('--walk', type=int, default=2000,
+                            help='Samples to time the per-sample walk on (extrapolated)')
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            start = time.perf_counter()
+            first, last = self._populate(options['samples'], options['history'])
+            total = HistoricalSample.objects.count()
+            self.stdout.write(f'{total} history records of {options["samples"]} samples generated '
+                              f'in {time.perf_counter() - start:.1f}s\n')
+
+            when = first + (last - first) * 3 / 4
+            self.stdout.write(f'Inventory as of {when:%Y-%m-%d %H:%M} (3/4 through the history)')
+            expected = self._walk(when, options['walk'])
+
+            rows, elapsed = self._time(inventory_as_of(when))
+            found = dict(rows)
+            if any(found.get(pk) != history_id for pk, history_id in expected.items()):
+                raise CommandError('inventory_as_of disagrees with the per-sample walk')
+            self._report('inventory_as_of', elapsed, f'{len(rows)} samples')
+            rows, elapsed = self._time(Sample.history.as_of(when))
+            self._report('simple_history as_of()', elapsed, f'{len(rows)} samples')
+
+            index = HistoricalSample._meta.indexes[-1]
+            with connection.schema_editor() as editor:
+                editor.remove_index(HistoricalSample, index)
+            rows, elapsed = self._time(inventory_as_of(when))
+            self._report('inventory_as_of, no (id, date) index', elapsed)
+            with connection.schema_editor() as editor:
+                editor.add_index(HistoricalSample, index)
+
+    def _populate(self, count, per_sample):
+        """Samples created over three years, each edited per_sample - 1 times
+
+        One in ten samples is deleted as its last change. Rows are inserted
+        with executemany; building millions of model instances for
+        bulk_create would take longer than the benchmark itself.
+        """
+        rng = random.Random(0)
+        now = timezone.now()
+        first = now - timedelta(days=4 * 365)
+        columns = ['id', 'sample_id', 'name', 'sample_type', 'description', 'source', 'donor_info',
+                   'storage_location', 'status', 'quantity', 'quality_control_notes',
+                   'research_use_only', 'image', 'storage_date', 'created_at', 'updated_at',
+                   'version', 'history_date', 'history_type']
+        sql = (f'INSERT INTO {connection.ops.quote_name(HistoricalSample._meta.db_table)} '
+               f'({", ".join(connection.ops.quote_name(column) for column in columns)}) '
+               f'VALUES ({", ".join(["%s"] * len(columns))})')
+        adapt = connection.ops.adapt_datetimefield_value
+        rows = []
+        with transaction.atomic(), connection.cursor() as cursor:
+            for number in range(1, count + 1):
+                sample_type = rng.choice(SAMPLE_TYPES)
+                created_at = first + timedelta(seconds=rng.randrange(3 * 365 * 86400))
+                date = created_at
+                quantity = rng.randint(5, 50)
+                for version in range(1, per_sample + 1):
+                    deleted = version == per_sample and number % 10 == 0
+                    rows.append((
+                        number, f'{sample_type}-{created_at.year}-{number:06d}', f'Line {number}',
+                        sample_type, '', '', '', f'Freezer {number % 12}', rng.choice(STATUSES),
+                        quantity, '', True, '', connection.ops.adapt_datefield_value(created_at.date()),
+                        adapt(created_at), adapt(date), version, adapt(date),
+                        '+' if version == 1 else '-' if deleted else '~',
+                    ))
+                    date += timedelta(seconds=rng.randrange(1, 60 * 86400))
+                    quantity = max(0, quantity - rng.randint(0, 3))
+                if len(rows) >= BATCH_SIZE:
+                    cursor.executemany(sql, rows)
+                    rows = []
+            cursor.executemany(sql, rows)
+        return first, now
+
+    def _walk(self, when, count):
+        """Latest record before when, one query per sample, for the first count samples
+
+        Returns {sample pk: history_id}, with None for samples that did not
+        exist at when. The time is extrapolated to all samples.
+        """
+        ids = list(HistoricalSample.objects.order_by('id').values_list('id', flat=True).distinct()[:count])
+        start = time.perf_counter()
+        expected = {}
+        for pk in ids:
+            record = (HistoricalSample.objects.filter(id=pk, history_date__lte=when)
+                      .order_by('-history_date', '-history_id').first())
+            exists = record is not None and record.history_type != '-'
+            expected[pk] = record.history_id if exists else None
+        elapsed = time.perf_counter() - start
+        total = HistoricalSample.objects.order_by().values('id').distinct().count()
+        self._report('per-sample walk (extrapolated)', elapsed * total / len(ids),
+                     f'{len(ids)} samples in {elapsed:.2f}s')
+        return expected
+
+    def _time(self, queryset):
+        start = time.perf_counter()
+        rows = list(queryset.values_list('id', 'history_id'))
+        return rows, time.perf_counter() - start
+
+    def _report(self, label, elapsed, note=''):
+        self.stdout.write(f'  {label:<38}{elapsed:8.2f}s  {note}'.rstrip())
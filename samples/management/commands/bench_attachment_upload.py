@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+
+from samples import attachments
+from samples.db import scratch_database
+from samples.models import AttachmentBlob, Sample
+
+
+class Command(BaseCommand):
+    help = ('Upload a generated file through the chunked attachment API on a throwaway database '
+            'and attachment directory: throughput per chunk size, the server memory one chunk '
+            'needs, and a second upload of the same content')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--megabytes', type=int, default=256)
+        parser.add_argument('--chunk-sizes', default='1,8', help='Chunk sizes in MB, comma separated')
+
+    def handle(self, *args, **options):
+        size = options['megabytes'] * 2**20
+        chunk_sizes = [int(value) * 2**20 for value in options['chunk_sizes'].split(',')]
+        with tempfile.TemporaryDirectory() as root, scratch_database(), \
+                override_settings(ATTACHMENT_ROOT=root, ATTACHMENT_CHUNK_SIZE=max(chunk_sizes)):
+            user = User.objects.create_user('bench', password='bench')
+            user.groups.add(Group.objects.get_or_create(name='Lab Staff')[0])
+            host = settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else 'localhost'
+            client = Client(HTTP_HOST=host)
+            client.force_login(user)
+
+            path = os.path.join(root, 'report.bin')
+            with open(path, 'wb') as file:
+                for _ in range(size // 2**20):
+                    file.write(os.urandom(2**20))
+            self.stdout.write(f'{options["megabytes"]} MB file\n')
+
+            for number, chunk_size in enumerate(chunk_sizes):
+                sample = Sample.objects.create(sample_id=f'IPSC-2024-{number:06d}', name='Line', sample_type='IPSC',
+                                               storage_location='Freezer 1', quantity=5, created_by=user)
+                # A different last byte each run, so every run stores new content
+                with open(path, 'r+b') as file:
+                    file.seek(size - 1)
+                    file.write(bytes([number]))
+                start = time.perf_counter()
+                upload_path = self._start(client, sample, size)
+                with open(path, 'rb') as file:
+                    for offset in range(0, size, chunk_size):
+                        end = min(offset + chunk_size, size)
+                        response = client.put(upload_path, file.read(end - offset),
+                                              content_type='application/octet-stream',
+                                              HTTP_CONTENT_RANGE=f'bytes {offset}-{end - 1}/{size}')
+                        if response.status_code not in (200, 201):
+                            raise CommandError(response.content.decode())
+                elapsed = time.perf_counter() - start
+                self.stdout.write(f'  {f"{chunk_size // 2**20} MB chunks":<24}{elapsed:7.2f}s  '
+                                  f'{size / 2**20 / elapsed:7.1f} MB/s')
+
+            with open(path, 'rb') as file:
+                sha256 = hashlib.file_digest(file, 'sha256').hexdigest()
+            start = time.perf_counter()
+            response = client.post(f'/api/v1/samples/{sample.pk}/attachments/', json.dumps({
+                'filename': 'copy.bin', 'size': size, 'sha256': sha256,
+            }), content_type='application/json')
+            elapsed = time.perf_counter() - start
+            if response.json()['upload'] is not None:
+                raise CommandError('The second upload was not deduplicated')
+            self.stdout.write(f'  {"same content again":<24}{elapsed:7.2f}s  ({AttachmentBlob.objects.count()} '
+                              f'stored files for {len(chunk_sizes) + 1} attachments)')
+
+            self._chunk_memory(sample, user, path, max(chunk_sizes))
+
+    def _start(self, client, sample, size):
+        response = client.post(f'/api/v1/samples/{sample.pk}/attachments/', json.dumps({
+            'filename': 'report.bin', 'size': size,
+        }), content_type='application/json')
+        if response.status_code != 201:
+            raise CommandError(response.content.decode())
+        return urlparse(response.json()['upload']['url']).path
+
+    def _chunk_memory(self, sample, user, path, chunk_size):
+        """Peak Python memory while receive_chunk streams one chunk from a file, as from a request"""
+        _attachment, session = attachments.start_upload(sample, user, 'memory.bin', chunk_size)
+        with open(path, 'rb', buffering=0) as stream:
+            tracemalloc.start()
+            attachments.receive_chunk(session, 0, chunk_size, stream)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        attachments.cancel_upload(session)
+        self.stdout.write(f'  server memory for one {chunk_size // 2**20} MB chunk: {peak / 2**20:.1f} MB '
+                          f'(reading request.body: {chunk_size // 2**20} MB)')
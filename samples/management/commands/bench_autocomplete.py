@@ -0,0 +1,125 @@
+import gc
+import random
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.test import Client
+
+from samples.api import AUTOCOMPLETE_FIELDS, AUTOCOMPLETE_LIMIT, autocomplete_suggestions
+from samples.cache import bump_data_version
+from samples.db import scratch_database
+from samples.models import Sample
+
+
+SAMPLE_TYPES = [value for value, label in Sample.SAMPLE_TYPE_CHOICES]
+# Traditional name stems; each is also typed in Simplified below
+NAME_STEMS = ['Line', 'HEK293 clone', '幹細胞株', '臍帶血', '纖維母細胞']
+BATCH_SIZE = 5000
+
+
+def icontains_suggestions(query):
+    """What autocomplete would cost as a substring match, without the prefix indexes"""
+    return list(Sample.objects.filter(Q(sample_id__icontains=query) | Q(name__icontains=query))
+                .values(*AUTOCOMPLETE_FIELDS)[:AUTOCOMPLETE_LIMIT])
+
+
+class Command(BaseCommand):
+    help = ('Time sample autocomplete on a throwaway database filled with generated samples: '
+            'p50, p95 and p99 latency of the prefix lookup, of a substring match for comparison, '
+            'and of the API with and without its cache')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--samples', type=int, default=100000)
+        parser.add_argument('--requests', type=int, default=2000, help='Lookups per profile')
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            user = User.objects.create_user('bench', password='bench')
+            user.groups.add(Group.objects.get_or_create(name='Lab Staff')[0])
+            start = time.perf_counter()
+            sample_ids = self._populate(options['samples'], user)
+            self.stdout.write(f'{options["samples"]} samples generated in {time.perf_counter() - start:.1f}s\n')
+
+            # Collect the generated instances now rather than during a timed lookup
+            gc.collect()
+            queries = self._queries(sample_ids, options['requests'])
+            host = settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else 'localhost'
+            client = Client(HTTP_HOST=host)
+            client.force_login(user)
+
+            def api(query, cached):
+                if not cached:
+                    # A new data version, so the lookup misses the cache
+                    bump_data_version()
+                    start = time.perf_counter()
+                else:
+                    client.get('/api/v1/samples/autocomplete/', {'q': query})
+                    start = time.perf_counter()
+                response = client.get('/api/v1/samples/autocomplete/', {'q': query})
+                elapsed = time.perf_counter() - start
+                if response.status_code != 200:
+                    raise CommandError(response.content.decode())
+                return elapsed
+
+            self.stdout.write(f"{'profile':<22}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+            self._report('prefix lookup', self._measure(autocomplete_suggestions, queries))
+            self._report('icontains', self._measure(icontains_suggestions, queries[:max(1, len(queries) // 20)]))
+            api(queries[0], cached=False)
+            self._report('API, cache miss', [api(query, cached=False) for query in queries])
+            self._report('API, cache hit', [api(query, cached=True) for query in queries])
+
+    def _populate(self, count, user):
+        rng = random.Random(0)
+        samples = []
+        for number in range(1, count + 1):
+            sample_type = rng.choice(SAMPLE_TYPES)
+            sample = Sample(
+                sample_id=f'{sample_type}-{2020 + number % 6}-{number:06d}',
+                name=f'{rng.choice(NAME_STEMS)} {number}', sample_type=sample_type,
+                storage_location=f'Freezer {number % 12}', quantity=rng.randint(0, 20), created_by=user,
+            )
+            sample.refresh_search_fields()
+            samples.append(sample)
+        Sample.objects.bulk_create(samples, batch_size=BATCH_SIZE)
+        return [sample.sample_id for sample in samples]
+
+    def _queries(self, sample_ids, count):
+        """Prefixes as people type them: IDs in either case, names in either script, and misses"""
+        rng = random.Random(1)
+        queries = []
+        for number in range(count):
+            kind = number % 4
+            if kind == 0:
+                sample_id = rng.choice(sample_ids)
+                query = sample_id[:rng.randint(3, len(sample_id))]
+                queries.append(query.lower() if rng.random() < 0.5 else query)
+            elif kind == 1:
+                stem = rng.choice(NAME_STEMS)
+                queries.append(stem[:rng.randint(1, len(stem))])
+            elif kind == 2:
+                queries.append(rng.choice(['干细胞', '脐带', '纤维母', 'hek', 'line 1']))
+            else:
+                queries.append(rng.choice(['zz', 'XYZ-1', '骨髓']))
+        return queries
+
+    def _measure(self, lookup, queries):
+        # The first lookup warms up the connection and is left out
+        lookup(queries[0])
+        timings = []
+        for query in queries:
+            start = time.perf_counter()
+            lookup(query)
+            timings.append(time.perf_counter() - start)
+        return timings
+
+    def _report(self, label, timings):
+        timings = sorted(timings)
+
+        def percentile(p):
+            return timings[min(len(timings) - 1, int(len(timings) * p))] * 1000
+
+        self.stdout.write(f'{label:<22}{percentile(0.5):>9.2f}{percentile(0.95):>9.2f}'
+                          f'{percentile(0.99):>9.2f}{timings[-1] * 1000:>9.2f}')
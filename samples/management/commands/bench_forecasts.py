@@ -0,0 +1,152 @@
+import random
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from samples.db import scratch_database
+from samples.forecasting import MIN_POINTS, fit_depletion, load_quantity_series, update_forecasts
+from samples.models import DepletionForecast, Sample, SampleTransaction
+
+
+HistoricalSample = Sample.history.model
+
+SAMPLE_TYPES = [value for value, label in Sample.SAMPLE_TYPE_CHOICES]
+BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = ('Time the depletion forecast on a throwaway database filled with generated samples, '
+            'edits and withdrawals, against fitting one sample at a time')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--samples', type=int, default=100000)
+        parser.add_argument('--withdrawals', type=int, default=20, help='Withdrawals per sample')
+        parser.add_argument('--walk', type=int, default=1000,
+                            help='Samples to time the per-sample fit on (extrapolated)')
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            start = time.perf_counter()
+            self._populate(options['samples'], options['withdrawals'])
+            self.stdout.write(f'{options["samples"]} samples, {SampleTransaction.objects.count()} withdrawals '
+                              f'and deposits generated in {time.perf_counter() - start:.1f}s\n')
+
+            now = timezone.now()
+            start = time.perf_counter()
+            series = load_quantity_series(now, settings.DEPLETION_FORECAST_WINDOW_DAYS)
+            loaded = time.perf_counter()
+            current = list(Sample.objects.filter(quantity__gt=0).order_by().values_list('pk', 'quantity'))
+            current_pks = np.array([pk for pk, quantity in current], dtype=np.int64)
+            current_quantities = np.array([quantity for pk, quantity in current], dtype=np.float64)
+            fit_start = time.perf_counter()
+            pks, rates, days_left = fit_depletion(*series, current_pks, current_quantities)
+            fitted = time.perf_counter()
+            self._report('load (one query)', loaded - start, f'{len(series[0])} points')
+            self._report('fit (vectorized)', fitted - fit_start, f'{len(pks)} samples with a rate')
+
+            expected = self._walk(now, options['walk'])
+            found = dict(zip(pks.tolist(), rates.tolist()))
+            for pk, rate in expected.items():
+                if rate is None and pk in found or rate is not None and not np.isclose(found.get(pk, 0), rate):
+                    raise CommandError(f'Vectorized fit disagrees with the per-sample fit for sample {pk}')
+
+            start = time.perf_counter()
+            count = update_forecasts(now)
+            self._report('update_forecasts (load, fit, write)', time.perf_counter() - start,
+                         f'{count} forecasts, {DepletionForecast.objects.filter(depletion_date__isnull=False).count()} '
+                         f'with a date')
+
+    def _populate(self, count, withdrawals):
+        """Samples created before the forecast window, then used at their own pace
+
+        Each sample gets an edit inside the window and withdrawals spread
+        over it, with an occasional deposit. One in five is not used.
+        """
+        rng = random.Random(0)
+        now = timezone.now()
+        window = settings.DEPLETION_FORECAST_WINDOW_DAYS * 86400
+        user = User.objects.create_user('bench')
+        samples = []
+        moves = []
+        for number in range(1, count + 1):
+            sample_type = rng.choice(SAMPLE_TYPES)
+            quantity = float(rng.randint(20, 200))
+            if number % 5:
+                times = sorted(rng.randrange(window) for _ in range(withdrawals))
+                for offset in times:
+                    if quantity < 10 and rng.random() < 0.5:
+                        amount, kind = float(rng.randint(10, 30)), SampleTransaction.DEPOSIT
+                        quantity += amount
+                    else:
+                        amount, kind = float(min(quantity, rng.randint(0, 3))), SampleTransaction.WITHDRAWAL
+                        quantity -= amount
+                    moves.append((number, kind, amount, quantity, now - timedelta(seconds=window - offset)))
+            sample = Sample(
+                sample_id=f'{sample_type}-2024-{number:06d}', name=f'Line {number}',
+                sample_type=sample_type, status='AVAILABLE' if quantity else 'DEPLETED',
+                storage_location=f'Freezer {number % 12}', quantity=quantity, created_by=user,
+            )
+            sample.refresh_search_fields()
+            samples.append(sample)
+        Sample.objects.bulk_create(samples, batch_size=BATCH_SIZE)
+
+        history = []
+        fields = [field.attname for field in Sample._meta.fields
+                  if field.attname not in ('search_text', 'search_name')]
+        for sample in Sample.objects.order_by('id').iterator(chunk_size=BATCH_SIZE):
+            values = {name: getattr(sample, name) for name in fields}
+            history.append(HistoricalSample(**values, history_date=now - timedelta(days=400),
+                                            history_type='+', history_user=user))
+            history.append(HistoricalSample(**values, history_date=now - timedelta(days=90),
+                                            history_type='~', history_user=user))
+            if len(history) >= BATCH_SIZE:
+                HistoricalSample.objects.bulk_create(history)
+                history = []
+        HistoricalSample.objects.bulk_create(history)
+
+        # Raw inserts: created_at is auto_now_add
+        columns = ['sample_id', 'kind', 'amount', 'quantity_after', 'note', 'created_at']
+        sql = (f'INSERT INTO {connection.ops.quote_name(SampleTransaction._meta.db_table)} '
+               f'({", ".join(connection.ops.quote_name(column) for column in columns)}) '
+               f'VALUES ({", ".join(["%s"] * len(columns))})')
+        adapt = connection.ops.adapt_datetimefield_value
+        with transaction.atomic(), connection.cursor() as cursor:
+            for offset in range(0, len(moves), BATCH_SIZE):
+                cursor.executemany(sql, [(pk, kind, amount, after, '', adapt(moment))
+                                         for pk, kind, amount, after, moment in moves[offset:offset + BATCH_SIZE]])
+
+    def _walk(self, now, count):
+        """Fit the first count samples one at a time, two queries and a polyfit each
+
+        Returns {sample pk: rate or None}. The time is extrapolated to all samples.
+        """
+        since = now - timedelta(days=settings.DEPLETION_FORECAST_WINDOW_DAYS)
+        samples = list(Sample.objects.filter(quantity__gt=0).order_by('pk').values_list('pk', 'quantity')[:count])
+        start = time.perf_counter()
+        expected = {}
+        for pk, quantity in samples:
+            points = [*HistoricalSample.objects.filter(id=pk, history_date__gte=since)
+                      .exclude(history_type='-').values_list('history_date', 'quantity'),
+                      *SampleTransaction.objects.filter(sample_id=pk, created_at__gte=since)
+                      .values_list('created_at', 'quantity_after')]
+            points = sorted(((moment - now).total_seconds() / 86400, value) for moment, value in points)
+            points.append((0.0, quantity))
+            days = np.array([day for day, value in points])
+            values = np.array([value for day, value in points])
+            consumed = np.concatenate([[0.0], np.cumsum(np.maximum(values[:-1] - values[1:], 0))])
+            rate = np.polyfit(days, consumed, 1)[0] if len(points) >= MIN_POINTS and np.ptp(days) else 0
+            expected[pk] = rate if rate > 0 else None
+        elapsed = time.perf_counter() - start
+        total = Sample.objects.filter(quantity__gt=0).count()
+        self._report('per-sample fit (extrapolated)', elapsed * total / len(samples),
+                     f'{len(samples)} samples in {elapsed:.2f}s')
+        return expected
+
+    def _report(self, label, elapsed, note=''):
+        self.stdout.write(f'  {label:<38}{elapsed:8.2f}s  {note}'.rstrip())
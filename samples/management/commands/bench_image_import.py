@@ -0,0 +1,92 @@
+import os
+import tempfile
+import time
+import zipfile
+from io import BytesIO
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from PIL import Image
+
+from samples.db import scratch_database
+from samples.image_import import import_image_archive
+from samples.models import Sample
+
+
+SAMPLE_TYPES = [value for value, label in Sample.SAMPLE_TYPE_CHOICES]
+
+
+class Command(BaseCommand):
+    help = ('Time attaching a ZIP of generated micrographs on a throwaway database and media '
+            'directory, with one and several worker processes, against saving one sample per image')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--images', type=int, default=100, help='Images per run (three runs)')
+        parser.add_argument('--width', type=int, default=2400)
+        parser.add_argument('--height', type=int, default=1800)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+
+    def handle(self, *args, **options):
+        count = options['images']
+        with tempfile.TemporaryDirectory() as media, scratch_database(), override_settings(MEDIA_ROOT=media):
+            user = User.objects.create_user('bench')
+            for number in range(count * 3):
+                sample_type = SAMPLE_TYPES[number % len(SAMPLE_TYPES)]
+                Sample.objects.create(
+                    sample_id=f'{sample_type}-2024-{number:06d}', name=f'Line {number}', sample_type=sample_type,
+                    storage_location='Freezer 1', quantity=5, created_by=user,
+                )
+            sample_ids = list(Sample.objects.order_by('pk').values_list('sample_id', flat=True))
+
+            start = time.perf_counter()
+            archive_path = os.path.join(media, 'session.zip')
+            noise = self._noise(options['width'], options['height'])
+            with zipfile.ZipFile(archive_path, 'w') as archive:
+                for index, sample_id in enumerate(sample_ids):
+                    archive.writestr(f'session/{sample_id}.jpg', self._micrograph(noise, index))
+            self.stdout.write(f'{len(sample_ids)} {options["width"]}x{options["height"]} images '
+                              f'({os.path.getsize(archive_path) / 2**20:.0f} MB) generated in '
+                              f'{time.perf_counter() - start:.1f}s\n')
+
+            serial = sample_ids[:count]
+            with zipfile.ZipFile(archive_path) as archive:
+                start = time.perf_counter()
+                for sample_id in serial:
+                    sample = Sample.objects.get(sample_id=sample_id)
+                    sample.image = ContentFile(archive.read(f'session/{sample_id}.jpg'), name=f'{sample_id}.jpg')
+                    sample.save()
+                self._report('one save per image', count, time.perf_counter() - start)
+
+            for label, workers, chunk in (('import, 1 worker', 1, sample_ids[count:count * 2]),
+                                          (f'import, {options["workers"]} workers', options['workers'],
+                                           sample_ids[count * 2:])):
+                part_path = os.path.join(media, f'part-{workers}.zip')
+                with zipfile.ZipFile(archive_path) as archive, zipfile.ZipFile(part_path, 'w') as part:
+                    for sample_id in chunk:
+                        part.writestr(f'{sample_id}.jpg', archive.read(f'session/{sample_id}.jpg'))
+                result = import_image_archive(part_path, user=user, source='bench', workers=workers)
+                if result.unmatched or result.errors or len(result.attached) != len(chunk):
+                    raise CommandError(f'{label}: {result.unmatched} {result.errors}')
+                self._report(label, len(result.attached), result.duration)
+
+            attached = Sample.objects.exclude(image='').count()
+            if attached != len(sample_ids):
+                raise CommandError(f'{attached} of {len(sample_ids)} samples have an image')
+
+    def _noise(self, width, height):
+        """A noisy colour gradient, which compresses about as poorly as a real micrograph"""
+        gradient = np.linspace(0, 200, width, dtype=np.float32)[None, :, None]
+        noise = gradient + np.random.default_rng(0).normal(0, 20, (height, width, 3)).astype(np.float32)
+        return np.clip(noise, 0, 255).astype(np.uint8)
+
+    def _micrograph(self, noise, index):
+        output = BytesIO()
+        # Shifted so that no two images are the same
+        Image.fromarray(np.roll(noise, index * 7, axis=0)).save(output, format='JPEG', quality=90)
+        return output.getvalue()
+
+    def _report(self, label, count, elapsed):
+        self.stdout.write(f'  {label:<30}{elapsed:8.2f}s  {count / elapsed:6.1f} images/s')
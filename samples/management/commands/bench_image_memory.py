@@ -0,0 +1,107 @@
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from samples import images
+
+
+def compress_previous(path, max_size_kb=500, max_dimension=1200):
+    """compress_image as it was: convert, thumbnail, one encode into memory, size ignored"""
+    img = Image.open(path)
+    if img.mode in ('RGBA', 'P'):
+        img = img.convert('RGB')
+    if img.width > max_dimension or img.height > max_dimension:
+        img.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+    output = BytesIO()
+    img.save(output, format='JPEG', quality=85, optimize=True)
+    return len(output.getvalue())
+
+
+def compress_current(path, max_size_kb=500, max_dimension=1200):
+    with images.compress_image(path, max_dimension, max_size_kb) as output:
+        return output.seek(0, os.SEEK_END)
+
+
+def peak_rss_kb():
+    """Peak resident memory of this process in KB
+
+    Linux's VmHWM, because ru_maxrss carries the parent's peak over into a
+    spawned process. ru_maxrss is the fallback on other systems.
+    """
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure(function, path):
+    """Run in a fresh process: (peak memory increase in MB, seconds, output bytes or error)"""
+    before = peak_rss_kb()
+    start = time.perf_counter()
+    try:
+        result = function(path)
+    except Exception as e:
+        result = f'{e.__class__.__name__}: {e}'
+    elapsed = time.perf_counter() - start
+    return (peak_rss_kb() - before) / 1024, elapsed, result
+
+
+class Command(BaseCommand):
+    help = ('Measure the peak memory and time of compressing large generated images (JPEG, '
+            '16-bit TIFF, RGBA PNG), each in a fresh process, with compress_image as it was '
+            'and as it is')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--megapixels', type=float, default=50)
+
+    def handle(self, *args, **options):
+        width = int((options['megapixels'] * 1e6 * 4 / 3) ** 0.5)
+        height = width * 3 // 4
+        # Pillow allocates pixels outside Python's allocator, so tracemalloc
+        # does not see them; each run gets a fresh process and its peak RSS
+        context = multiprocessing.get_context('spawn')
+        with tempfile.TemporaryDirectory() as tmp:
+            inputs = self._inputs(tmp, width, height)
+            self.stdout.write(f'{width}x{height} ({width * height / 1e6:.0f} megapixels)\n')
+            self.stdout.write(f'  {"input":<32}{"version":<10}{"peak MB":>9}{"time":>8}  output')
+            for label, path in inputs:
+                for version, function in (('previous', compress_previous), ('current', compress_current)):
+                    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                        peak, elapsed, result = executor.submit(measure, function, path).result()
+                    output = f'{result / 1024:.0f} KB' if isinstance(result, int) else result
+                    self.stdout.write(f'  {label:<32}{version:<10}{peak:9.0f}{elapsed:7.2f}s  {output}')
+
+    def _inputs(self, tmp, width, height):
+        """Noisy test images as cameras produce them, and their file sizes"""
+        rng = np.random.default_rng(0)
+        gradient = np.linspace(0, 1, width, dtype=np.float32)[None, :]
+        inputs = []
+
+        rgb = (gradient[..., None] * 200 + rng.normal(0, 20, (height, width, 3)).astype(np.float32))
+        rgb = np.clip(rgb, 0, 255).astype(np.uint8)
+        path = os.path.join(tmp, 'photo.jpg')
+        Image.fromarray(rgb).save(path, quality=90)
+        inputs.append(('RGB JPEG', path))
+
+        path = os.path.join(tmp, 'alpha.png')
+        Image.fromarray(np.dstack([rgb, np.full((height, width), 255, np.uint8)]), 'RGBA').save(path, compress_level=1)
+        inputs.append(('RGBA PNG', path))
+        del rgb
+
+        gray = gradient * 3000 + rng.normal(0, 100, (height, width)).astype(np.float32)
+        path = os.path.join(tmp, 'camera.tif')
+        Image.fromarray(np.clip(gray, 0, 4095).astype(np.uint16)).save(path)
+        inputs.append(('16-bit grayscale TIFF', path))
+        return [(f'{label} ({os.path.getsize(path) / 2**20:.0f} MB)', path) for label, path in inputs]
@@ -0,0 +1,90 @@
+import io
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from samples.db import scratch_database
+from samples.models import Sample
+from samples.qc_import import import_qc_results, read_qc_rows
+
+
+HistoricalSample = Sample.history.model
+
+SAMPLE_TYPES = [value for value, label in Sample.SAMPLE_TYPE_CHOICES]
+BATCH_SIZE = 5000
+PLATE_WELLS = 384
+
+
+class Command(BaseCommand):
+    help = ('Time importing a cell counter export on a throwaway database, against looking up '
+            'and saving one sample per row')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--samples', type=int, default=100000)
+        parser.add_argument('--rows', type=int, default=PLATE_WELLS, help='Rows per export (one plate)')
+        parser.add_argument('--unmatched', type=int, default=4, help='Rows naming no sample')
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            user = User.objects.create_user('bench')
+            start = time.perf_counter()
+            self._populate(options['samples'], user)
+            self.stdout.write(f'{options["samples"]} samples generated in {time.perf_counter() - start:.1f}s\n')
+
+            rng = random.Random(0)
+            sample_ids = list(Sample.objects.order_by('?').values_list('sample_id', flat=True)[:options['rows'] * 2])
+            bulk_ids, single_ids = sample_ids[:options['rows']], sample_ids[options['rows']:]
+            unmatched = [f'UNKNOWN-{number}' for number in range(options['unmatched'])]
+
+            export = self._export(bulk_ids[:len(bulk_ids) - len(unmatched)] + unmatched, rng)
+            history_before = HistoricalSample.objects.count()
+            result = import_qc_results(io.StringIO(export), user=user, source='plate.csv')
+            self._report('import_qc_results', result.duration,
+                         f'{len(result.updated)} updated, {len(result.unmatched)} unmatched')
+            expected = {row.sample_id: row.viability
+                        for row in read_qc_rows(io.StringIO(export), []) if row.sample_id not in unmatched}
+            found = dict(Sample.objects.filter(sample_id__in=expected).values_list('sample_id', 'viability'))
+            if (found != expected or [sample_id for line, sample_id in result.unmatched] != unmatched
+                    or HistoricalSample.objects.count() - history_before != len(expected)):
+                raise CommandError('Import did not apply the export as expected')
+
+            rows = list(read_qc_rows(io.StringIO(self._export(single_ids, rng)), []))
+            start = time.perf_counter()
+            for row in rows:
+                try:
+                    sample = Sample.objects.get(sample_id=row.sample_id)
+                except Sample.DoesNotExist:
+                    continue
+                sample.viability = row.viability
+                sample.quality_control_notes = f'{sample.quality_control_notes}\n{row.note}'.strip()
+                sample._change_reason = 'QC import'
+                sample.save()
+            self._report('one lookup and save per row', time.perf_counter() - start, f'{len(rows)} rows')
+
+    def _populate(self, count, user):
+        samples = []
+        for number in range(1, count + 1):
+            sample_type = SAMPLE_TYPES[number % len(SAMPLE_TYPES)]
+            sample = Sample(
+                sample_id=f'{sample_type}-2024-{number:06d}', name=f'Line {number}', sample_type=sample_type,
+                storage_location=f'Freezer {number % 12}', quantity=5, created_by=user,
+            )
+            sample.refresh_search_fields()
+            samples.append(sample)
+        Sample.objects.bulk_create(samples, batch_size=BATCH_SIZE)
+
+    def _export(self, sample_ids, rng):
+        """A plate export as a counter writes it: metadata lines, a header, one row per well"""
+        lines = ['Instrument,Cell Counter', 'Protocol,Trypan blue', 'Operator,bench', '',
+                 'Well,Sample ID,Total Cells (cells/mL),Live Cells (cells/mL),Viability (%),Comment']
+        for index, sample_id in enumerate(sample_ids):
+            well = f'{"ABCDEFGHIJKLMNOP"[index // 24 % 16]}{index % 24 + 1}'
+            total = rng.randint(500000, 3000000)
+            viability = round(rng.uniform(60, 99), 1)
+            lines.append(f'{well},{sample_id},{total},{int(total * viability / 100)},{viability},')
+        return '\r\n'.join(lines) + '\r\n'
+
+    def _report(self, label, elapsed, note=''):
+        self.stdout.write(f'  {label:<38}{elapsed * 1000:8.1f}ms  {note}'.rstrip())
@@ -0,0 +1,120 @@
+import random
+import statistics
+import time
+from collections import defaultdict
+
+from django.contrib.auth.models import Group, User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+
+from samples.cache import bump_data_version
+from samples.db import scratch_database
+from samples.models import Sample
+from samples.quality import DECLINE_PER_PASSAGE, MIN_LINE_SAMPLES, analyze_quality, load_quality_columns
+
+
+SAMPLE_TYPES = [value for value, label in Sample.SAMPLE_TYPE_CHOICES]
+BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = ('Time the quality analytics on a throwaway database filled with generated lines, '
+            'against the same per-line fits in plain Python, and the quality page with and '
+            'without its cached result')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--samples', type=int, default=100000)
+        parser.add_argument('--per-line', type=int, default=10, help='Samples per line')
+        parser.add_argument('--requests', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with scratch_database(), override_settings(ALLOWED_HOSTS=['testserver']):
+            user = User.objects.create_user('bench', password='bench')
+            user.groups.add(Group.objects.get_or_create(name='Lab Staff')[0])
+            start = time.perf_counter()
+            declining = self._populate(options['samples'], options['per_line'], user)
+            self.stdout.write(f'{options["samples"]} samples in lines of {options["per_line"]} '
+                              f'generated in {time.perf_counter() - start:.1f}s\n')
+
+            start = time.perf_counter()
+            columns = load_quality_columns()
+            loaded = time.perf_counter()
+            report = analyze_quality(columns)
+            analyzed = time.perf_counter()
+            self._report('load (one values_list query)', loaded - start)
+            self._report('analyze (vectorized)', analyzed - loaded,
+                         f'{report["declining_count"]} declining lines, {report["outlier_count"]} outliers')
+            found = {line['name'] for line in report['declining_lines']}
+            if report['declining_count'] != len(declining) or not found <= declining:
+                raise CommandError(f'Expected {len(declining)} declining lines, found {report["declining_count"]}')
+
+            start = time.perf_counter()
+            self._python_fits(columns)
+            self._report('per-line fits in plain Python', time.perf_counter() - start)
+
+            client = Client()
+            client.login(username='bench', password='bench')
+            for label, prepare in (('page, data just changed', bump_data_version),
+                                   ('page, cached', lambda: None)):
+                timings = []
+                for _ in range(options['requests']):
+                    prepare()
+                    start = time.perf_counter()
+                    response = client.get('/analytics/quality/')
+                    timings.append(time.perf_counter() - start)
+                    if response.status_code != 200:
+                        raise CommandError(f'Quality page returned {response.status_code}')
+                self._report(label, statistics.mean(timings), 'mean per request')
+
+    def _populate(self, count, per_line, user):
+        """Lines frozen at rising passages; one in ten loses a point per passage
+
+        One sample in a thousand, the first of a steady line, has a failed
+        thaw count far below its type. Returns the names of the declining
+        lines.
+        """
+        rng = random.Random(0)
+        samples = []
+        declining = set()
+        for number in range(count):
+            line = number // per_line
+            name = f'Line {line}'
+            sample_type = SAMPLE_TYPES[line % len(SAMPLE_TYPES)]
+            passage = 5 + (number % per_line) * 3
+            slope = -1.0 if line % 10 == 0 else 0.0
+            if slope <= -DECLINE_PER_PASSAGE and per_line >= MIN_LINE_SAMPLES:
+                declining.add(name)
+            viability = 92 + slope * (passage - 5) + rng.gauss(0, 2)
+            if number % 1000 == 510:
+                viability = 40 + rng.random() * 10
+            sample = Sample(
+                sample_id=f'{sample_type}-2024-{number:06d}', name=name, sample_type=sample_type,
+                storage_location=f'Freezer {number % 12}', quantity=5, created_by=user,
+                passage_number=passage, viability=round(max(0, min(100, viability)), 1),
+            )
+            sample.refresh_search_fields()
+            samples.append(sample)
+        Sample.objects.bulk_create(samples, batch_size=BATCH_SIZE)
+        return declining
+
+    def _python_fits(self, columns):
+        """Per-line slopes and per-type medians with dicts and the statistics module"""
+        by_line = defaultdict(list)
+        by_type = defaultdict(list)
+        for line, sample_type, passage, viability in zip(
+                columns['line'].tolist(), columns['sample_type'].tolist(),
+                columns['passage'].tolist(), columns['viability'].tolist()):
+            by_type[sample_type].append(viability)
+            if passage == passage:
+                by_line[line].append((passage, viability))
+        for values in by_type.values():
+            statistics.quantiles(values, n=10)
+            median = statistics.median(values)
+            statistics.median(abs(value - median) for value in values)
+        for points in by_line.values():
+            if len(points) >= MIN_LINE_SAMPLES:
+                statistics.linear_regression(*zip(*points))
+
+    def _report(self, label, elapsed, note=''):
+        self.stdout.write(f'  {label:<38}{elapsed * 1000:8.1f}ms  {note}'.rstrip())
@@ -0,0 +1,55 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+
+class Command(BaseCommand):
+    help = ('Measure server render time and HTML payload of the main pages, '
+            'with a cold cache and with warm fragment caches')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help='User to render pages as (default: first superuser)')
+        parser.add_argument('--requests', type=int, default=50, help='Requests per page and mode')
+        parser.add_argument('--language', default='en', choices=[code for code, name in settings.LANGUAGES])
+        parser.add_argument('urls', nargs='*', default=['/dashboard/', '/samples/'])
+
+    def handle(self, *args, **options):
+        if options['username']:
+            user = User.objects.filter(username=options['username']).first()
+        else:
+            user = User.objects.filter(is_superuser=True).first()
+        if user is None:
+            raise CommandError('No user to render as; run create_demo_data or pass --username.')
+
+        host = settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else 'localhost'
+        client = Client(HTTP_HOST=host, HTTP_ACCEPT_LANGUAGE=options['language'])
+        client.force_login(user)
+
+        self.stdout.write(f"{'page':<24}{'mode':<8}{'mean ms':>10}{'p95 ms':>10}{'HTML KB':>10}")
+        for url in options['urls']:
+            for mode in ('cold', 'warm'):
+                timings, size = self._measure(client, url, options['requests'], cold=(mode == 'cold'))
+                p95 = sorted(timings)[int(len(timings) * 0.95) - 1]
+                self.stdout.write(
+                    f'{url:<24}{mode:<8}{statistics.mean(timings):>10.2f}{p95:>10.2f}{size / 1024:>10.1f}'
+                )
+
+    def _measure(self, client, url, count, cold):
+        timings = []
+        size = 0
+        client.get(url)  # Warm up imports and the template loader
+        for _ in range(count):
+            if cold:
+                cache.clear()
+            start = time.perf_counter()
+            response = client.get(url)
+            timings.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                raise CommandError(f'{url} returned HTTP {response.status_code}')
+            size = len(response.content)
+        return timings, size
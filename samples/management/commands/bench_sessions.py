@@ -0,0 +1,101 @@
+import re
+
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from samples.db import scratch_database
+from samples.models import Sample
+
+
+PROFILES = {
+    'db + session messages': {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+        'MESSAGE_STORAGE': 'django.contrib.messages.storage.session.SessionStorage',
+    },
+    'db (development)': {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+        'MESSAGE_STORAGE': 'django.contrib.messages.storage.fallback.FallbackStorage',
+    },
+    'cached_db + cookie messages': {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.cached_db',
+        'MESSAGE_STORAGE': 'django.contrib.messages.storage.cookie.CookieStorage',
+    },
+    'signed cookies (production)': {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.signed_cookies',
+        'MESSAGE_STORAGE': 'django.contrib.messages.storage.cookie.CookieStorage',
+    },
+}
+
+WRITE = re.compile(r'^\s*(INSERT|UPDATE|DELETE)\b', re.IGNORECASE)
+SESSION_TABLE = re.compile(r'\bdjango_session\b')
+
+
+class Command(BaseCommand):
+    help = ('Run a typical user session (log in, switch language, create, edit and delete '
+            'a sample, log out) on a throwaway database with each session and message '
+            'storage, and count the session reads and writes it causes')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, default=3, help='Workflows per profile')
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            user = User.objects.create_user('bench', password='bench')
+            user.groups.add(Group.objects.get_or_create(name='Lab Staff')[0])
+            self.stdout.write(f"{'profile':<30}{'session reads':>14}{'session writes':>15}"
+                              f"{'other writes':>13}{'cookie bytes':>13}")
+            for name, profile in PROFILES.items():
+                # The test client sends Host: testserver
+                with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], **profile):
+                    totals = self._measure(options['rounds'])
+                self.stdout.write(f"{name:<30}{totals['reads']:>14.1f}{totals['writes']:>15.1f}"
+                                  f"{totals['other']:>13.1f}{totals['cookie']:>13}")
+            self.stdout.write(f"Counts are per workflow, averaged over {options['rounds']}; "
+                              'cookie bytes is the largest Cookie header sent.')
+
+    def _measure(self, rounds):
+        totals = {'reads': 0, 'writes': 0, 'other': 0, 'cookie': 0}
+        for _ in range(rounds):
+            # A new client loads the middleware, and so the session engine, afresh
+            client = Client()
+            connection.queries_log.clear()
+            with CaptureQueriesContext(connection) as queries:
+                for response in self._workflow(client):
+                    if response.status_code != 200:
+                        raise CommandError(f'{response.request["PATH_INFO"]} answered {response.status_code}')
+                    cookie = '; '.join(f'{key}={morsel.value}' for key, morsel in client.cookies.items())
+                    totals['cookie'] = max(totals['cookie'], len(cookie))
+            for query in queries.captured_queries:
+                is_write = bool(WRITE.match(query['sql']))
+                if SESSION_TABLE.search(query['sql']):
+                    totals['writes' if is_write else 'reads'] += 1
+                elif is_write:
+                    totals['other'] += 1
+        for key in ('reads', 'writes', 'other'):
+            totals[key] /= rounds
+        return totals
+
+    def _workflow(self, client):
+        """The requests of one user session, with redirects followed"""
+        yield client.post(reverse('login'), {'username': 'bench', 'password': 'bench'}, follow=True)
+        yield client.post(reverse('set_language'), {'language': 'zh-hans', 'next': reverse('home')},
+                          follow=True)
+        yield client.get(reverse('sample_list'))
+
+        data = {
+            'name': 'Session benchmark', 'sample_type': 'IPSC', 'storage_location': 'Tank A',
+            'status': 'AVAILABLE', 'quantity': 10, 'storage_date': timezone.localdate(),
+        }
+        yield client.post(reverse('sample_create'), data, follow=True)
+        sample = Sample.objects.latest('pk')
+        yield client.post(reverse('sample_update', args=[sample.pk]),
+                          dict(data, sample_id=sample.sample_id, quantity=8, version=sample.version),
+                          follow=True)
+        yield client.post(reverse('sample_delete', args=[sample.pk]), follow=True)
+        yield client.get(reverse('logout'), follow=True)
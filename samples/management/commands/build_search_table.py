@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from samples.search import TRADITIONAL_SIMPLIFIED_FILE
+
+
+PAIRS_PER_LINE = 16
+HEADER = """\
+# Traditional -> Simplified characters folded by search (samples/search.py),
+# written by `python manage.py build_search_table` from OpenCC's
+# data/dictionary/TSCharacters.txt{version}: the first candidate of every
+# entry, followed through the table so that folding twice changes nothing.
+# OpenCC (https://github.com/BYVoid/OpenCC) is licensed under the Apache
+# License 2.0. After replacing this file, add a migration that recomputes
+# the stored search columns, as 0016_refold_search_columns does.
+"""
+
+
+def read_opencc_characters(path):
+    """{traditional: simplified} from an OpenCC character dictionary"""
+    table = {}
+    with open(path, encoding='utf-8') as file:
+        for number, line in enumerate(file, start=1):
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            key, _tab, values = line.partition('\t')
+            candidates = values.split()
+            if len(key) != 1 or not candidates or len(candidates[0]) != 1:
+                raise CommandError(f'{path}:{number}: expected a character and its candidates')
+            if key in table:
+                raise CommandError(f'{path}:{number}: {key} is listed twice')
+            table[key] = candidates[0]
+    return table
+
+
+def resolve(table):
+    """The table with every target followed to a character that does not map further"""
+    resolved = {}
+    for key in table:
+        seen = {key}
+        value = table[key]
+        while value in table and value not in seen:
+            seen.add(value)
+            value = table[value]
+        if value != key:
+            resolved[key] = value
+    return resolved
+
+
+class Command(BaseCommand):
+    help = ('Write the Traditional -> Simplified table that search folds with, from a copy of '
+            "OpenCC's TSCharacters.txt")
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='Path to data/dictionary/TSCharacters.txt of an OpenCC checkout')
+        parser.add_argument('--opencc-version', default='', help='Recorded in the header, e.g. 1.4.2')
+        parser.add_argument('--output', default=TRADITIONAL_SIMPLIFIED_FILE)
+
+    def handle(self, *args, **options):
+        table = resolve(read_opencc_characters(options['source']))
+        pairs = [key + table[key] for key in sorted(table)]
+        version = f' (OpenCC {options["opencc_version"]})' if options['opencc_version'] else ''
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            file.write(HEADER.format(version=version))
+            for offset in range(0, len(pairs), PAIRS_PER_LINE):
+                file.write(' '.join(pairs[offset:offset + PAIRS_PER_LINE]) + '\n')
+        self.stdout.write(self.style.SUCCESS(f'Wrote {len(pairs)} characters to {options["output"]}'))
@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from samples.attachments import delete_unreferenced_blobs, expire_uploads
+
+
+class Command(BaseCommand):
+    help = ('Cancel attachment uploads untouched for ATTACHMENT_UPLOAD_EXPIRY_HOURS, remove '
+            'partial files with no upload, and delete stored content that no attachment uses '
+            '(left behind by deleted samples). Schedule daily.')
+
+    def handle(self, *args, **options):
+        uploads, files = expire_uploads()
+        blobs = delete_unreferenced_blobs()
+        self.stdout.write(self.style.SUCCESS(
+            f'Cancelled {uploads} uploads idle for over {settings.ATTACHMENT_UPLOAD_EXPIRY_HOURS} hours, '
+            f'removed {files} orphaned partial files and {blobs} unused attachment files.'))
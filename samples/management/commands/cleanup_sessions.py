@@ -0,0 +1,32 @@
+import time
+
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = ('Delete expired rows from the django_session table in small batches. Unlike '
+            'clearsessions (one DELETE of every expired row), each batch holds the SQLite '
+            'write lock only briefly, so inventory writes are not held up. Schedule daily.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--pause', type=float, default=0.1,
+                            help='Seconds to wait between batches so other writers get the lock')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        expired = Session.objects.filter(expire_date__lt=now).order_by('expire_date')
+        deleted = 0
+        while True:
+            with transaction.atomic():
+                keys = list(expired.values_list('pk', flat=True)[:options['batch_size']])
+                if keys:
+                    Session.objects.filter(pk__in=keys).delete()
+            deleted += len(keys)
+            if len(keys) < options['batch_size']:
+                break
+            time.sleep(options['pause'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired sessions.'))
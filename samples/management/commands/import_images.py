@@ -0,0 +1,35 @@
+import os
+import zipfile
+
+from django.core.management.base import BaseCommand, CommandError
+
+from samples.image_import import import_image_archive
+
+
+class Command(BaseCommand):
+    help = ('Attach the images in ZIP archives to the samples they are named after '
+            '(IPSC-2024-001.jpg), compressing them in parallel')
+
+    def add_arguments(self, parser):
+        parser.add_argument('archives', nargs='+')
+        parser.add_argument('--workers', type=int, default=0,
+                            help='Worker processes (default: IMAGE_IMPORT_WORKERS, or one per CPU)')
+
+    def handle(self, *args, **options):
+        failed = False
+        for path in options['archives']:
+            source = os.path.basename(path)
+            try:
+                result = import_image_archive(path, source=source, workers=options['workers'])
+            except (OSError, zipfile.BadZipFile) as e:
+                raise CommandError(f'{path}: {e}')
+
+            self.stdout.write(f'{source}: attached {len(result.attached)} images in {result.duration:.2f}s '
+                              f'({result.images_per_second:.1f} images/s)')
+            for name in result.unmatched:
+                self.stdout.write(self.style.WARNING(f'  {name}: no sample with this ID'))
+            for name, message in result.errors:
+                self.stdout.write(self.style.ERROR(f'  {name}: {message}'))
+            failed = failed or result.unmatched or result.errors
+        if failed:
+            raise CommandError('Some images were not attached')
@@ -0,0 +1,35 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from samples.qc_import import QCFileError, import_qc_results
+
+
+class Command(BaseCommand):
+    help = ('Apply viability results from cell counter CSV exports to the samples they name, '
+            'and list IDs with no sample and rows that could not be read')
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+')
+        parser.add_argument('--dry-run', action='store_true', help='Match and report without updating samples')
+        parser.add_argument('--encoding', default='utf-8-sig')
+
+    def handle(self, *args, **options):
+        failed = False
+        for path in options['files']:
+            source = os.path.basename(path)
+            try:
+                with open(path, encoding=options['encoding'], newline='') as lines:
+                    result = import_qc_results(lines, source=source, dry_run=options['dry_run'])
+            except (OSError, QCFileError) as e:
+                raise CommandError(f'{path}: {e}')
+
+            verb = 'would update' if options['dry_run'] else 'updated'
+            self.stdout.write(f'{source}: {verb} {len(result.updated)} samples in {result.duration:.2f}s')
+            for line, sample_id in result.unmatched:
+                self.stdout.write(self.style.WARNING(f'  line {line}: no sample {sample_id}'))
+            for line, message in result.errors:
+                self.stdout.write(self.style.ERROR(f'  line {line}: {message}'))
+            failed = failed or not result.ok
+        if failed:
+            raise CommandError('Some rows were not applied')
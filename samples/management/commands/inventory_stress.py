@@ -0,0 +1,141 @@
+import random
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections
+
+from samples import inventory
+from samples.db import scratch_database
+from samples.models import Sample, SampleTransaction
+
+
+class Command(BaseCommand):
+    help = ('Withdraw and deposit vials of one sample from many threads at once and check '
+            'that the final quantity, status and ledger add up. Runs on a throwaway test '
+            'database, like manage.py test.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--operations', type=int, default=200, help='Operations per thread')
+        parser.add_argument('--initial', type=float, default=1000, help='Starting quantity (vials)')
+        parser.add_argument('--deposit-ratio', type=float, default=0.2,
+                            help='Share of operations that are deposits')
+        parser.add_argument('--mode', choices=['atomic', 'naive', 'both'], default='both',
+                            help='naive = load the sample, change quantity, save() (the form behaviour)')
+
+    def handle(self, *args, **options):
+        modes = ['naive', 'atomic'] if options['mode'] == 'both' else [options['mode']]
+        with scratch_database() as connection:
+            for mode in modes:
+                sample = Sample.objects.create(
+                    sample_id=f'STRESS-{mode.upper()}', name='Stress test',
+                    storage_location='-', quantity=options['initial'],
+                )
+                # Threads open their own connections; release this one
+                # so SQLite does not see it as a concurrent writer
+                connection.close()
+                start = time.perf_counter()
+                counts = self._run(sample.pk, mode, options)
+                elapsed = time.perf_counter() - start
+                self._report(mode, sample.pk, counts, elapsed, options)
+
+    def _run(self, sample_pk, mode, options):
+        lock = threading.Lock()
+        counts = {'withdrawn': 0.0, 'deposited': 0.0, 'ok': 0, 'refused': 0, 'errors': 0}
+
+        def worker(seed):
+            rng = random.Random(seed)
+            local = dict.fromkeys(counts, 0)
+            for _ in range(options['operations']):
+                amount = float(rng.randint(1, 3))
+                is_deposit = rng.random() < options['deposit_ratio']
+                try:
+                    if mode == 'naive':
+                        done = self._naive(sample_pk, amount, is_deposit)
+                    else:
+                        done = self._atomic(sample_pk, amount, is_deposit)
+                except OperationalError:
+                    local['errors'] += 1
+                    continue
+                if not done:
+                    local['refused'] += 1
+                    continue
+                local['ok'] += 1
+                local['deposited' if is_deposit else 'withdrawn'] += amount
+            connections.close_all()
+            with lock:
+                for key, value in local.items():
+                    counts[key] += value
+
+        threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return counts
+
+    def _atomic(self, sample_pk, amount, is_deposit):
+        try:
+            if is_deposit:
+                inventory.deposit(sample_pk, amount, note='stress')
+            else:
+                inventory.withdraw(sample_pk, amount, note='stress')
+        except inventory.InsufficientQuantity:
+            return False
+        return True
+
+    def _naive(self, sample_pk, amount, is_deposit):
+        sample = Sample.objects.get(pk=sample_pk)
+        if not is_deposit and sample.quantity < amount:
+            return False
+        sample.quantity += amount if is_deposit else -amount
+        if sample.quantity == 0:
+            sample.status = 'DEPLETED'
+        sample.save()
+        return True
+
+    def _report(self, mode, sample_pk, counts, elapsed, options):
+        sample = Sample.objects.get(pk=sample_pk)
+        expected = options['initial'] - counts['withdrawn'] + counts['deposited']
+        total_ops = options['threads'] * options['operations']
+
+        self.stdout.write(self.style.SUCCESS(f'[{mode}]'))
+        self.stdout.write(f"  operations:        {counts['ok']} applied, {counts['refused']} refused "
+                          f"(insufficient stock), {counts['errors']} database errors "
+                          f"of {total_ops} in {elapsed:.2f}s")
+        self.stdout.write(f"  expected quantity: {expected:g}")
+        self.stdout.write(f"  final quantity:    {sample.quantity:g}  (status {sample.status})")
+
+        problems = []
+        if sample.quantity != expected:
+            problems.append(f'final quantity is off by {abs(expected - sample.quantity):g} vials (lost updates)')
+        if sample.quantity < 0:
+            problems.append('quantity went negative')
+        if (sample.quantity == 0) != (sample.status == 'DEPLETED'):
+            problems.append('status does not match the quantity')
+
+        if mode == 'atomic':
+            ledger = list(SampleTransaction.objects.filter(sample_id=sample_pk)
+                          .order_by('id').values_list('kind', 'amount', 'quantity_after'))
+            self.stdout.write(f"  ledger entries:    {len(ledger)}")
+            if len(ledger) != counts['ok']:
+                problems.append(f"{len(ledger)} ledger entries for {counts['ok']} operations")
+            # Entries are written while the sample row is locked, so id
+            # order is the order the changes were applied in
+            balance = options['initial']
+            for kind, amount, quantity_after in ledger:
+                balance += amount if kind == SampleTransaction.DEPOSIT else -amount
+                if balance != quantity_after or quantity_after < 0:
+                    problems.append('ledger balances do not replay')
+                    break
+            if balance != sample.quantity:
+                problems.append('ledger total does not match the quantity')
+
+        if problems:
+            for problem in problems:
+                self.stdout.write(self.style.ERROR(f'  FAIL: {problem}'))
+            if mode == 'atomic':
+                raise CommandError('Atomic withdrawals produced inconsistent totals.')
+        else:
+            self.stdout.write(self.style.SUCCESS('  OK: totals, status and ledger are consistent'))
@@ -0,0 +1,98 @@
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+
+READ_CHUNK_SIZE = 16 * 1024
+
+
+class Command(BaseCommand):
+    help = ('Send concurrent HTTP requests to a running server and report throughput '
+            'and latency, e.g. to compare uvicorn (ASGI) with a WSGI server')
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='+', help='Absolute URLs, requested round-robin')
+        parser.add_argument('--concurrency', type=int, default=50, help='Requests in flight at once')
+        parser.add_argument('--requests', type=int, default=1000, help='Total number of requests')
+        parser.add_argument('--username', help='Log in as this user (default: first superuser)')
+        parser.add_argument('--anonymous', action='store_true', help='Send no session cookie')
+        parser.add_argument('--timeout', type=float, default=60.0, help='Per-request timeout in seconds')
+        parser.add_argument('--read-rate', type=float, default=0,
+                            help='Read response bodies at this many KB/s, like a slow client (default: unthrottled)')
+
+    def handle(self, *args, **options):
+        headers = {'Accept-Encoding': 'gzip'}
+        if not options['anonymous']:
+            headers['Cookie'] = f'{settings.SESSION_COOKIE_NAME}={self._session_key(options["username"])}'
+
+        urls = options['urls']
+        read_rate = options['read_rate'] * 1024
+        timings = []
+        errors = []
+        lock = threading.Lock()
+
+        def fetch(index):
+            request = urllib.request.Request(urls[index % len(urls)], headers=headers)
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=options['timeout']) as response:
+                    if read_rate:
+                        while response.read(READ_CHUNK_SIZE):
+                            time.sleep(READ_CHUNK_SIZE / read_rate)
+                    else:
+                        response.read()
+                    status = response.status
+            except urllib.error.HTTPError as exc:
+                status = exc.code
+            except OSError as exc:
+                status = type(exc).__name__
+            elapsed = time.perf_counter() - start
+            with lock:
+                if status == 200:
+                    timings.append(elapsed)
+                else:
+                    errors.append(status)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            list(executor.map(fetch, range(options['requests'])))
+        wall = time.perf_counter() - start
+
+        if not timings:
+            raise CommandError(f'No successful requests; first errors: {errors[:5]}')
+        timings.sort()
+
+        def percentile(p):
+            return timings[min(len(timings) - 1, int(len(timings) * p))] * 1000
+
+        self.stdout.write(f'requests:     {len(timings)} ok, {len(errors)} failed '
+                          f'({options["concurrency"]} concurrent)')
+        self.stdout.write(f'throughput:   {len(timings) / wall:.1f} req/s over {wall:.2f}s')
+        self.stdout.write(f'latency ms:   mean {statistics.mean(timings) * 1000:.1f}  p50 {percentile(0.5):.1f}  '
+                          f'p95 {percentile(0.95):.1f}  p99 {percentile(0.99):.1f}')
+        if errors:
+            self.stdout.write(self.style.WARNING(f'errors:       {sorted(set(map(str, errors)))}'))
+
+    def _session_key(self, username):
+        """Create a logged-in session directly, like the test client's force_login"""
+        if username:
+            user = User.objects.filter(username=username).first()
+        else:
+            user = User.objects.filter(is_superuser=True).first()
+        if user is None:
+            raise CommandError('No user to log in as; run create_demo_data or pass --username.')
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = user._meta.pk.value_to_string(user)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.save()
+        return session.session_key
@@ -0,0 +1,138 @@
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from samples.db import apply_sqlite_pragmas
+
+
+# Fallback used when the active settings do not define a tuned profile
+TUNED_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'busy_timeout': 20000,
+    'synchronous': 'NORMAL',
+    'mmap_size': 268435456,
+    'cache_size': -32000,
+    'temp_store': 'MEMORY',
+}
+
+STATUSES = ['AVAILABLE', 'IN_USE', 'DEPLETED', 'RESERVED', 'QUARANTINE']
+
+
+class Command(BaseCommand):
+    help = ('Stress a scratch SQLite database with concurrent readers and writers, '
+            'comparing the stock connection with the tuned PRAGMA profile')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--seconds', type=float, default=5.0)
+        parser.add_argument('--rows', type=int, default=5000)
+        parser.add_argument('--profile', choices=['stock', 'tuned', 'both'], default='both')
+
+    def handle(self, *args, **options):
+        profiles = ['stock', 'tuned'] if options['profile'] == 'both' else [options['profile']]
+        tuned = getattr(settings, 'SQLITE_PRAGMAS', None) or TUNED_PRAGMAS
+
+        self.stdout.write(
+            f"{options['readers']} readers, {options['writers']} writers, "
+            f"{options['seconds']}s per profile, {options['rows']} rows\n"
+        )
+        for profile in profiles:
+            pragmas = tuned if profile == 'tuned' else {}
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, 'stress.sqlite3')
+                self._create_database(path, options['rows'])
+                result = self._run(path, pragmas, options)
+            self._report(profile, result, options['seconds'])
+
+    def _connect(self, path, pragmas):
+        # Django's default SQLite timeout is 5 seconds
+        conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        apply_sqlite_pragmas(conn.cursor(), pragmas)
+        return conn
+
+    def _create_database(self, path, rows):
+        conn = sqlite3.connect(path)
+        conn.execute(
+            'CREATE TABLE sample (id INTEGER PRIMARY KEY, sample_id TEXT UNIQUE, '
+            'status TEXT, quantity REAL, updated_at REAL)'
+        )
+        conn.execute('CREATE INDEX sample_status ON sample (status)')
+        conn.executemany(
+            'INSERT INTO sample (sample_id, status, quantity, updated_at) VALUES (?, ?, ?, ?)',
+            ((f'IPSC-2024-{i:06d}', random.choice(STATUSES), 10.0, time.time())
+             for i in range(rows)),
+        )
+        conn.commit()
+        conn.close()
+
+    def _run(self, path, pragmas, options):
+        stop = threading.Event()
+        lock = threading.Lock()
+        result = {'reads': 0, 'writes': 0, 'locked': 0, 'max_write_latency': 0.0}
+
+        def reader():
+            conn = self._connect(path, pragmas)
+            reads = locked = 0
+            while not stop.is_set():
+                try:
+                    conn.execute(
+                        'SELECT status, COUNT(*), SUM(quantity) FROM sample GROUP BY status'
+                    ).fetchall()
+                    conn.execute(
+                        'SELECT * FROM sample WHERE sample_id = ?',
+                        (f'IPSC-2024-{random.randrange(options["rows"]):06d}',),
+                    ).fetchone()
+                    reads += 1
+                except sqlite3.OperationalError:
+                    locked += 1
+            conn.close()
+            with lock:
+                result['reads'] += reads
+                result['locked'] += locked
+
+        def writer():
+            conn = self._connect(path, pragmas)
+            writes = locked = 0
+            max_latency = 0.0
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    conn.execute(
+                        'UPDATE sample SET quantity = quantity + 1, updated_at = ? WHERE id = ?',
+                        (time.time(), random.randrange(1, options['rows'] + 1)),
+                    )
+                    conn.commit()
+                    writes += 1
+                    max_latency = max(max_latency, time.perf_counter() - start)
+                except sqlite3.OperationalError:
+                    conn.rollback()
+                    locked += 1
+            conn.close()
+            with lock:
+                result['writes'] += writes
+                result['locked'] += locked
+                result['max_write_latency'] = max(result['max_write_latency'], max_latency)
+
+        threads = ([threading.Thread(target=reader) for _ in range(options['readers'])] +
+                   [threading.Thread(target=writer) for _ in range(options['writers'])])
+        for thread in threads:
+            thread.start()
+        time.sleep(options['seconds'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+        return result
+
+    def _report(self, profile, result, seconds):
+        self.stdout.write(self.style.SUCCESS(f'[{profile}]'))
+        self.stdout.write(f"  reads/s:            {result['reads'] / seconds:10.1f}")
+        self.stdout.write(f"  writes/s:           {result['writes'] / seconds:10.1f}")
+        self.stdout.write(f"  'database is locked' errors: {result['locked']}")
+        self.stdout.write(f"  max write latency:  {result['max_write_latency'] * 1000:10.1f} ms")
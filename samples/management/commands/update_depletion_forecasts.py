@@ -0,0 +1,16 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from samples.forecasting import update_forecasts
+
+
+class Command(BaseCommand):
+    help = ('Recompute every sample\'s projected depletion date from its recent quantity '
+            'changes (edits, withdrawals and deposits). Schedule it daily.')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        count = update_forecasts()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(f'Forecast depletion for {count} samples in {elapsed:.2f}s'))
@@ -0,0 +1,224 @@
+"""
+Lightweight Prometheus-style metrics for the resource bank.
+
+Every worker process keeps its counters and histograms in memory and
+periodically dumps them to ``<METRICS_DIR>/metrics_<pid>.json``. The
+``/metrics`` view sums all of those files, so a single scrape sees every
+worker without an external collector. When ``METRICS_DIR`` is empty the
+process only reports its own in-memory values.
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+
+# Default latency buckets (seconds), matching the Prometheus client defaults
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Metric name -> (type, help text, buckets)
+METRICS = {
+    'http_request_duration_seconds': (
+        'histogram', 'Request latency by URL name', DEFAULT_BUCKETS),
+    'db_queries_total': (
+        'counter', 'Database queries executed by URL name', None),
+    'db_query_duration_seconds': (
+        'histogram', 'Total database time per request by URL name', DEFAULT_BUCKETS),
+    'cache_requests_total': (
+        'counter', 'Cache lookups by cache name and result', None),
+    'export_duration_seconds': (
+        'histogram', 'Time spent building sample exports', DEFAULT_BUCKETS),
+    'export_rows_total': (
+        'counter', 'Rows written by sample exports', None),
+    'image_processing_duration_seconds': (
+        'histogram', 'Time spent compressing uploaded images', DEFAULT_BUCKETS),
+    'qc_import_duration_seconds': (
+        'histogram', 'Time spent importing QC result files', DEFAULT_BUCKETS),
+    'qc_import_rows_total': (
+        'counter', 'QC result rows by outcome (updated, unmatched, error)', None),
+    'attachment_upload_bytes_total': (
+        'counter', 'Attachment bytes received in upload chunks', None),
+    'attachment_uploads_total': (
+        'counter', 'Finished attachment uploads by outcome (stored, deduplicated, checksum_mismatch)', None),
+}
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_last_flush = 0.0
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, amount=1, **labels):
+    """Increment a counter"""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name, value, **labels):
+    """Record one observation in a histogram"""
+    buckets = METRICS[name][2]
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            # One slot per bucket, then sum and count
+            hist = _histograms[key] = [0] * len(buckets) + [0.0, 0]
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                hist[i] += 1
+        hist[-2] += value
+        hist[-1] += 1
+
+
+@contextmanager
+def timer(name, **labels):
+    """Observe the wall-clock duration of a block in a histogram"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def record_cache(cache_name, hit):
+    """Count a cache lookup as a hit or a miss"""
+    inc('cache_requests_total', cache=cache_name, result='hit' if hit else 'miss')
+
+
+# Multiprocess support
+
+def _metrics_dir():
+    return getattr(settings, 'METRICS_DIR', '') or ''
+
+
+def _snapshot():
+    with _lock:
+        return {
+            'counters': [[name, list(labels), value]
+                         for (name, labels), value in _counters.items()],
+            'histograms': [[name, list(labels), list(values)]
+                           for (name, labels), values in _histograms.items()],
+        }
+
+
+def flush(force=False):
+    """Write this process's metrics to the shared directory (throttled)"""
+    global _last_flush
+    directory = _metrics_dir()
+    if not directory:
+        return
+    now = time.monotonic()
+    interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)
+    if not force and now - _last_flush < interval:
+        return
+    _last_flush = now
+
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'metrics_{os.getpid()}.json')
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(_snapshot(), f)
+    # Atomic on POSIX and Windows, so readers never see a partial file
+    os.replace(tmp_path, path)
+
+
+def _load_snapshots():
+    """Yield the snapshot of every worker, using live data for this one"""
+    directory = _metrics_dir()
+    own_file = f'metrics_{os.getpid()}.json'
+    if directory and os.path.isdir(directory):
+        for filename in os.listdir(directory):
+            if not filename.endswith('.json') or filename == own_file:
+                continue
+            try:
+                with open(os.path.join(directory, filename)) as f:
+                    yield json.load(f)
+            except (OSError, ValueError):
+                continue  # Worker is mid-write or the file was removed
+    yield _snapshot()
+
+
+def collect():
+    """Aggregate counters and histograms across all worker processes"""
+    counters = {}
+    histograms = {}
+    for snapshot in _load_snapshots():
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, values in snapshot['histograms']:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            total = histograms.setdefault(key, [0] * len(values))
+            for i, value in enumerate(values):
+                total[i] += value
+    return counters, histograms
+
+
+# Exposition
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        '{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for k, v in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render():
+    """Render all metrics in the Prometheus text exposition format"""
+    counters, histograms = collect()
+    lines = []
+
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        else:
+            for (metric, labels), values in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, count in zip(buckets, values):
+                    le = _format_labels(labels, [('le', _format_value(float(bound)))])
+                    lines.append(f'{name}_bucket{le} {count}')
+                inf = _format_labels(labels, [('le', '+Inf')])
+                lines.append(f'{name}_bucket{inf} {values[-1]}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(values[-2])}')
+                lines.append(f'{name}_count{_format_labels(labels)} {values[-1]}')
+
+    # Derived gauge so dashboards can show hit ratios without PromQL
+    lines.append('# HELP cache_hit_ratio Fraction of cache lookups that were hits')
+    lines.append('# TYPE cache_hit_ratio gauge')
+    totals = {}
+    for (metric, labels), value in counters.items():
+        if metric == 'cache_requests_total':
+            label_dict = dict(labels)
+            hits, lookups = totals.get(label_dict['cache'], (0, 0))
+            if label_dict['result'] == 'hit':
+                hits += value
+            totals[label_dict['cache']] = (hits, lookups + value)
+    for cache_name, (hits, lookups) in sorted(totals.items()):
+        ratio = hits / lookups if lookups else 0.0
+        lines.append(f'cache_hit_ratio{_format_labels([("cache", cache_name)])} {ratio!r}')
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,145 @@
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+
+from . import metrics, routers
+
+
+_request_queries = ContextVar('request_queries', default=None)
+
+
+class QueryCounter:
+    """Database execute wrapper that counts queries and their total duration"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+def count_queries(execute, sql, params, many, context):
+    """Execute wrapper that charges a query to the request being served"""
+    queries = _request_queries.get()
+    if queries is None:
+        return execute(sql, params, many, context)
+    return queries(execute, sql, params, many, context)
+
+
+def install_query_counter(sender, connection, **kwargs):
+    """connection_created receiver that adds count_queries to every connection
+
+    Installed per connection rather than per request because async views run
+    their queries on other threads, each with its own connection; the
+    request's QueryCounter follows them there through the context variable.
+    """
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+class MetricsMiddleware:
+    """Record request latency and database usage per URL name"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        queries = QueryCounter()
+        token = _request_queries.set(queries)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_queries.reset(token)
+        self.record(request, time.perf_counter() - start, queries)
+        return response
+
+    async def __acall__(self, request):
+        queries = QueryCounter()
+        token = _request_queries.set(queries)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_queries.reset(token)
+        self.record(request, time.perf_counter() - start, queries)
+        return response
+
+    def record(self, request, elapsed, queries):
+        match = request.resolver_match
+        view = match.url_name if match and match.url_name else 'unresolved'
+        metrics.observe('http_request_duration_seconds', elapsed,
+                        view=view, method=request.method)
+        metrics.inc('db_queries_total', queries.count, view=view)
+        metrics.observe('db_query_duration_seconds', queries.duration, view=view)
+        metrics.flush()
+
+
+class ReplicaRoutingMiddleware:
+    """Serve read-only views from the replica, with read-your-writes stickiness
+
+    After any non-GET request the session is pinned to the primary for
+    REPLICA_STICKY_SECONDS, so a user never sees the replica lag behind
+    their own change.
+    """
+
+    sticky_session_key = '_replica_pinned_until'
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.disable_replica_reads()
+        if self.pins_session(request):
+            self.pin_session(request)
+        return response
+
+    async def __acall__(self, request):
+        try:
+            response = await self.get_response(request)
+        finally:
+            routers.disable_replica_reads()
+        if self.pins_session(request):
+            # Loading the session touches the database, which is sync-only
+            await sync_to_async(self.pin_session)(request)
+        return response
+
+    def pins_session(self, request):
+        return request.method not in ('GET', 'HEAD', 'OPTIONS') and routers.replica_configured()
+
+    def pin_session(self, request):
+        request.session[self.sticky_session_key] = time.time() + settings.REPLICA_STICKY_SECONDS
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Under ASGI Django runs this in a worker thread and copies the
+        # context variable it sets back to the request's context
+        if (routers.replica_configured()
+                and request.method in ('GET', 'HEAD')
+                and request.resolver_match.url_name in settings.REPLICA_READ_VIEWS
+                and request.session.get(self.sticky_session_key, 0) < time.time()):
+            routers.enable_replica_reads()
+        return None
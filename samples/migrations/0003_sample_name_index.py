@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-19 02:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("samples", "0002_historicalsample_sitesettings_and_more"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="sample",
+            index=models.Index(fields=["name"], name="samples_sam_name_8a2ecc_idx"),
+        ),
+    ]
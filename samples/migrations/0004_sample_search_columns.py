@@ -0,0 +1,51 @@
+# Generated by Django 4.2.30 on 2026-10-19 02:32
+
+from django.db import migrations, models
+
+from samples.search import SEARCH_FIELDS, normalize_search
+
+
+def populate_search_columns(apps, schema_editor):
+    Sample = apps.get_model("samples", "Sample")
+    batch = []
+    for sample in Sample.objects.only("id", "search_text", "search_name", *SEARCH_FIELDS).iterator(
+        chunk_size=2000
+    ):
+        sample.search_text = "\n".join(
+            normalize_search(getattr(sample, field)) for field in SEARCH_FIELDS
+        )
+        sample.search_name = normalize_search(sample.name)[:200]
+        batch.append(sample)
+        if len(batch) >= 2000:
+            Sample.objects.bulk_update(batch, ["search_text", "search_name"])
+            batch = []
+    if batch:
+        Sample.objects.bulk_update(batch, ["search_text", "search_name"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("samples", "0003_sample_name_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="sample",
+            name="search_name",
+            field=models.CharField(
+                blank=True, db_index=True, editable=False, max_length=200
+            ),
+        ),
+        migrations.AddField(
+            model_name="sample",
+            name="search_text",
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.RunPython(populate_search_columns, migrations.RunPython.noop),
+        # Name prefix lookups now use the folded, indexed search_name column
+        migrations.RemoveIndex(
+            model_name="sample",
+            name="samples_sam_name_8a2ecc_idx",
+        ),
+    ]
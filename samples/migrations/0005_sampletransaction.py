@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-19 03:05
+
+from django.conf import settings
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('samples', '0004_sample_search_columns'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SampleTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('WITHDRAWAL', 'Withdrawal'), ('DEPOSIT', 'Deposit')], max_length=10, verbose_name='Type')),
+                ('amount', models.FloatField(validators=[django.core.validators.MinValueValidator(0)], verbose_name='Amount (vials)')),
+                ('quantity_after', models.FloatField(verbose_name='Balance (vials)')),
+                ('note', models.CharField(blank=True, max_length=200, verbose_name='Note')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Date')),
+                ('performed_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sample_transactions', to=settings.AUTH_USER_MODEL, verbose_name='Performed By')),
+                ('sample', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transactions', to='samples.sample', verbose_name='Sample')),
+            ],
+            options={
+                'verbose_name': 'Sample Transaction',
+                'verbose_name_plural': 'Sample Transactions',
+                'ordering': ['-created_at', '-id'],
+                'indexes': [models.Index(fields=['sample', '-created_at'], name='samples_sam_sample__0d3190_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-19 03:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('samples', '0005_sampletransaction'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historicalsample',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False, verbose_name='Version'),
+        ),
+        migrations.AddField(
+            model_name='sample',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False, verbose_name='Version'),
+        ),
+    ]
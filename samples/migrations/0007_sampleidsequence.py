@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-19 03:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('samples', '0006_sample_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SampleIdSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sample_type', models.CharField(choices=[('IPSC', 'Induced Pluripotent Stem Cell'), ('ESC', 'Embryonic Stem Cell'), ('MSC', 'Mesenchymal Stem Cell'), ('HSC', 'Hematopoietic Stem Cell'), ('NSC', 'Neural Stem Cell'), ('OTHER', 'Other')], max_length=10, verbose_name='Sample Type')),
+                ('year', models.PositiveSmallIntegerField(verbose_name='Year')),
+                ('last_value', models.PositiveIntegerField(default=0, verbose_name='Last Number')),
+            ],
+            options={
+                'verbose_name': 'Sample ID Sequence',
+                'verbose_name_plural': 'Sample ID Sequences',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='sampleidsequence',
+            constraint=models.UniqueConstraint(fields=('sample_type', 'year'), name='unique_sample_id_sequence'),
+        ),
+    ]
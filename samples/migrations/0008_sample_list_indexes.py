@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-19 03:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('samples', '0007_sampleidsequence'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='sample',
+            name='samples_sam_status_431764_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='sample',
+            name='samples_sam_sample__029233_idx',
+        ),
+        migrations.AddIndex(
+            model_name='sample',
+            index=models.Index(fields=['status', '-created_at'], name='samples_sam_status_efa2e7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sample',
+            index=models.Index(fields=['sample_type', '-created_at'], name='samples_sam_sample__bcc027_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sample',
+            index=models.Index(fields=['-created_at'], name='samples_sam_created_dcd10b_idx'),
+        ),
+    ]
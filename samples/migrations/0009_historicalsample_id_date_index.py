@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-19 03:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('samples', '0008_sample_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='historicalsample',
+            index=models.Index(fields=['id', 'history_date'], name='samples_hist_id_date_idx'),
+        ),
+    ]
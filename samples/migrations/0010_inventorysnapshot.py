@@ -0,0 +1,45 @@
+# Generated by Django 4.2.30 on 2026-10-19 03:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('samples', '0009_historicalsample_id_date_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventorySnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Date')),
+                ('status', models.CharField(choices=[('AVAILABLE', 'Available'), ('IN_USE', 'In Use'), ('DEPLETED', 'Depleted'), ('RESERVED', 'Reserved'), ('QUARANTINE', 'Quarantine')], max_length=20, verbose_name='Status')),
+                ('sample_type', models.CharField(choices=[('IPSC', 'Induced Pluripotent Stem Cell'), ('ESC', 'Embryonic Stem Cell'), ('MSC', 'Mesenchymal Stem Cell'), ('HSC', 'Hematopoietic Stem Cell'), ('NSC', 'Neural Stem Cell'), ('OTHER', 'Other')], max_length=10, verbose_name='Sample Type')),
+                ('sample_count', models.PositiveIntegerField(default=0, verbose_name='Samples')),
+                ('total_quantity', models.FloatField(default=0, verbose_name='Vials')),
+            ],
+            options={
+                'verbose_name': 'Inventory Snapshot',
+                'verbose_name_plural': 'Inventory Snapshots',
+                'ordering': ['date', 'status', 'sample_type'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SnapshotWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_history_id', models.BigIntegerField(default=0, verbose_name='Last History Record')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated At')),
+            ],
+            options={
+                'verbose_name': 'Snapshot Watermark',
+                'verbose_name_plural': 'Snapshot Watermark',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='inventorysnapshot',
+            constraint=models.UniqueConstraint(fields=('date', 'status', 'sample_type'), name='unique_inventory_snapshot'),
+        ),
+    ]
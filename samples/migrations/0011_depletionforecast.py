@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-19 04:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('samples', '0010_inventorysnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DepletionForecast',
+            fields=[
+                ('sample', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='depletion_forecast', serialize=False, to='samples.sample', verbose_name='Sample')),
+                ('daily_usage', models.FloatField(verbose_name='Vials per Day')),
+                ('depletion_date', models.DateField(blank=True, null=True, verbose_name='Projected Depletion')),
+                ('computed_at', models.DateTimeField(verbose_name='Computed At')),
+            ],
+            options={
+                'verbose_name': 'Depletion Forecast',
+                'verbose_name_plural': 'Depletion Forecasts',
+                'ordering': ['depletion_date'],
+                'indexes': [models.Index(fields=['depletion_date'], name='samples_dep_depleti_e9270a_idx')],
+            },
+        ),
+    ]
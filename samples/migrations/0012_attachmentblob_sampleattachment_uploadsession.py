@@ -0,0 +1,71 @@
+# Generated by Django 4.2.30 on 2026-10-19 04:53
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import samples.models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('samples', '0011_depletionforecast'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttachmentBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True, verbose_name='SHA-256')),
+                ('size', models.BigIntegerField(verbose_name='Size (bytes)')),
+                ('file', models.FileField(storage=samples.models.attachment_storage, upload_to='', verbose_name='File')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+            ],
+            options={
+                'verbose_name': 'Attachment Content',
+                'verbose_name_plural': 'Attachment Contents',
+            },
+        ),
+        migrations.CreateModel(
+            name='SampleAttachment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('COA', 'Certificate of Analysis'), ('KARYOTYPE', 'Karyotype'), ('SEQUENCING', 'Sequencing Report'), ('OTHER', 'Other')], default='OTHER', max_length=20, verbose_name='Type')),
+                ('filename', models.CharField(max_length=255, verbose_name='File Name')),
+                ('content_type', models.CharField(blank=True, max_length=100, verbose_name='Content Type')),
+                ('uploaded_at', models.DateTimeField(auto_now_add=True, verbose_name='Uploaded At')),
+                ('blob', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='attachments', to='samples.attachmentblob', verbose_name='Content')),
+                ('sample', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attachments', to='samples.sample', verbose_name='Sample')),
+                ('uploaded_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sample_attachments', to=settings.AUTH_USER_MODEL, verbose_name='Uploaded By')),
+            ],
+            options={
+                'verbose_name': 'Sample Attachment',
+                'verbose_name_plural': 'Sample Attachments',
+                'ordering': ['-uploaded_at', '-id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('COA', 'Certificate of Analysis'), ('KARYOTYPE', 'Karyotype'), ('SEQUENCING', 'Sequencing Report'), ('OTHER', 'Other')], default='OTHER', max_length=20, verbose_name='Type')),
+                ('filename', models.CharField(max_length=255, verbose_name='File Name')),
+                ('content_type', models.CharField(blank=True, max_length=100, verbose_name='Content Type')),
+                ('size', models.BigIntegerField(verbose_name='Size (bytes)')),
+                ('sha256', models.CharField(blank=True, max_length=64, verbose_name='SHA-256')),
+                ('received', models.BigIntegerField(default=0, verbose_name='Received (bytes)')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated At')),
+                ('created_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='upload_sessions', to=settings.AUTH_USER_MODEL, verbose_name='Created By')),
+                ('sample', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to='samples.sample', verbose_name='Sample')),
+            ],
+            options={
+                'verbose_name': 'Upload Session',
+                'verbose_name_plural': 'Upload Sessions',
+                'indexes': [models.Index(fields=['updated_at'], name='samples_upl_updated_595deb_idx')],
+            },
+        ),
+    ]
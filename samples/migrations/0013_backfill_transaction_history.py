@@ -0,0 +1,89 @@
+# Generated by Django 4.2.30 on 2026-10-19 05:20
+
+from django.db import migrations
+
+# Same rounding as samples.inventory
+QUANTITY_TOLERANCE = 0.0005
+KIND_LABELS = {"WITHDRAWAL": "Withdrawal", "DEPOSIT": "Deposit"}
+
+
+def backfill_transaction_history(apps, schema_editor):
+    """Write the history record each withdrawal and deposit made before they wrote one"""
+    Sample = apps.get_model("samples", "Sample")
+    HistoricalSample = apps.get_model("samples", "HistoricalSample")
+    SampleTransaction = apps.get_model("samples", "SampleTransaction")
+    tracked = [
+        field.attname
+        for field in HistoricalSample._meta.concrete_fields
+        if not field.name.startswith("history_")
+    ]
+    sample_ids = (
+        SampleTransaction.objects.order_by("sample_id")
+        .values_list("sample_id", flat=True)
+        .distinct()
+    )
+    batch = []
+    for sample_id in list(sample_ids):
+        records = list(
+            HistoricalSample.objects.filter(id=sample_id)
+            .order_by("history_date", "history_id")
+            .values(*tracked, "history_date")
+        )
+        recorded = {record["history_date"] for record in records}
+        entries = [
+            entry
+            for entry in SampleTransaction.objects.filter(sample_id=sample_id).order_by(
+                "created_at", "id"
+            )
+            if entry.created_at not in recorded
+        ]
+        if not entries:
+            continue
+        # Records first on a tie, so an entry builds on the record of its moment
+        events = sorted(
+            [(record["history_date"], 0, record) for record in records]
+            + [(entry.created_at, 1, entry) for entry in entries],
+            key=lambda event: event[:2],
+        )
+        # A sample created before history was kept starts from its current row
+        previous = records[0] if records else Sample.objects.filter(pk=sample_id).values(*tracked).get()
+        for _when, is_entry, event in events:
+            if not is_entry:
+                previous = event
+                continue
+            status = previous["status"]
+            if event.quantity_after <= QUANTITY_TOLERANCE:
+                status = "DEPLETED"
+            elif event.kind == "DEPOSIT" and status == "DEPLETED":
+                status = "AVAILABLE"
+            previous = {
+                **{name: previous[name] for name in tracked},
+                "quantity": event.quantity_after,
+                "status": status,
+                "version": previous["version"] + 1,
+            }
+            batch.append(
+                HistoricalSample(
+                    **previous,
+                    history_date=event.created_at,
+                    history_type="~",
+                    history_user_id=event.performed_by_id,
+                    history_change_reason=f"{KIND_LABELS[event.kind]} {event.amount:g}",
+                )
+            )
+        if len(batch) >= 2000:
+            HistoricalSample.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        HistoricalSample.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("samples", "0012_attachmentblob_sampleattachment_uploadsession"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_transaction_history, migrations.RunPython.noop),
+    ]
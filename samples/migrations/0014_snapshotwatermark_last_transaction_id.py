@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 05:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('samples', '0013_backfill_transaction_history'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='snapshotwatermark',
+            name='last_transaction_id',
+            field=models.BigIntegerField(default=0, verbose_name='Last Ledger Entry'),
+        ),
+    ]
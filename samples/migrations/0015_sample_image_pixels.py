@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-19 05:36
+
+from django.db import migrations, models
+import samples.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('samples', '0014_snapshotwatermark_last_transaction_id'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='historicalsample',
+            name='image',
+            field=models.TextField(blank=True, max_length=100, null=True, validators=[samples.models.validate_image_pixels], verbose_name='Sample Image'),
+        ),
+        migrations.AlterField(
+            model_name='sample',
+            name='image',
+            field=models.ImageField(blank=True, null=True, upload_to='sample_images/', validators=[samples.models.validate_image_pixels], verbose_name='Sample Image'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.30 on 2026-10-19 05:52
+
+from django.db import migrations
+
+from samples.search import SEARCH_FIELDS, normalize_search
+
+
+def refold_search_columns(apps, schema_editor):
+    """Recompute the folded columns with the complete Traditional -> Simplified table"""
+    Sample = apps.get_model("samples", "Sample")
+    batch = []
+    for sample in Sample.objects.only("id", "search_text", "search_name", *SEARCH_FIELDS).iterator(
+        chunk_size=2000
+    ):
+        sample.search_text = "\n".join(
+            normalize_search(getattr(sample, field)) for field in SEARCH_FIELDS
+        )
+        sample.search_name = normalize_search(sample.name)[:200]
+        batch.append(sample)
+        if len(batch) >= 2000:
+            Sample.objects.bulk_update(batch, ["search_text", "search_name"])
+            batch = []
+    if batch:
+        Sample.objects.bulk_update(batch, ["search_text", "search_name"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("samples", "0015_sample_image_pixels"),
+    ]
+
+    operations = [
+        migrations.RunPython(refold_search_columns, migrations.RunPython.noop),
+    ]
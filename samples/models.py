@@ -1,18 +1,26 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.utils import timezone
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils.translation import gettext_lazy as _
 from simple_history.models import HistoricalRecords
-from PIL import Image
-from io import BytesIO
-from django.core.files.uploadedfile import InMemoryUploadedFile
-import sys
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from . import images, metrics
+from .search import build_search_text, normalize_search
+import os
+import time
+import uuid
 
 
 class SiteSettings(models.Model):
     """Singleton model for site-wide settings like logo"""
     
+    CACHE_KEY = 'samples:site_settings'
+    
     logo = models.ImageField(
         upload_to='site/', 
         blank=True, 
@@ -44,20 +52,59 @@ class SiteSettings(models.Model):
         # Ensure only one instance exists (singleton pattern)
         self.pk = 1
         super().save(*args, **kwargs)
+        cache.set(self.CACHE_KEY, self, None)
     
     def delete(self, *args, **kwargs):
         pass  # Prevent deletion
     
     @classmethod
     def get_settings(cls):
-        """Get or create the singleton settings instance"""
-        obj, created = cls.objects.get_or_create(pk=1)
+        """Get or create the singleton settings instance (cached until saved)"""
+        obj = cache.get(cls.CACHE_KEY)
+        if obj is None:
+            obj, created = cls.objects.get_or_create(pk=1)
+            cache.set(cls.CACHE_KEY, obj, None)
         return obj
     
     def __str__(self):
         return "Site Settings"
 
 
+def validate_image_pixels(image):
+    """Refuse a new upload over IMAGE_MAX_PIXELS from its header, before it is decoded
+
+    Applies to every ModelForm of Sample, the admin's included.
+    """
+    if not image or getattr(image, '_committed', True):
+        return
+    # Set by the form field on a new upload; only the header has been read
+    header = getattr(image.file, 'image', None)
+    if header is not None and header.width * header.height > settings.IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            _("This image is %(megapixels)s megapixels; the limit is %(limit)s megapixels"),
+            params={
+                'megapixels': round(header.width * header.height / 1e6),
+                'limit': round(settings.IMAGE_MAX_PIXELS / 1e6),
+            },
+        )
+
+
+class SampleHistoricalRecords(HistoricalRecords):
+    """HistoricalRecords with an (id, history_date) index on the history table
+
+    Point-in-time queries (see history.py) look up the latest record of each
+    sample before a date; this index answers each lookup with one seek.
+    """
+    
+    def get_meta_options(self, model):
+        meta_fields = super().get_meta_options(model)
+        meta_fields['indexes'] = [
+            *meta_fields.get('indexes', ()),
+            models.Index(fields=['id', 'history_date'], name='samples_hist_id_date_idx'),
+        ]
+        return meta_fields
+
+
 class Sample(models.Model):
     """Model representing a stem cell sample in the resource bank"""
     
@@ -170,6 +217,7 @@ class Sample(models.Model):
         upload_to='sample_images/', 
         blank=True, 
         null=True, 
+        validators=[validate_image_pixels],
         verbose_name=_("Sample Image")
     )
     
@@ -190,8 +238,20 @@ class Sample(models.Model):
         verbose_name=_("Updated At")
     )
     
-    # History tracking
-    history = HistoricalRecords()
+    # Incremented on every save; edits are only saved if it has not moved
+    # since the form was loaded (see concurrency.py)
+    version = models.PositiveIntegerField(
+        default=1,
+        editable=False,
+        verbose_name=_("Version")
+    )
+    
+    # Normalized search columns, maintained in save() (see search.py)
+    search_text = models.TextField(blank=True, editable=False)
+    search_name = models.CharField(max_length=200, blank=True, editable=False, db_index=True)
+    
+    # History tracking (derived search columns are not worth auditing)
+    history = SampleHistoricalRecords(excluded_fields=['search_text', 'search_name'])
     
     class Meta:
         ordering = ['-created_at']
@@ -199,9 +259,12 @@ class Sample(models.Model):
         verbose_name_plural = _("Samples")
         indexes = [
             models.Index(fields=['sample_id']),
-            models.Index(fields=['status']),
-            models.Index(fields=['sample_type']),
+            # Filtered lists in the default order, and the admin's date
+            # drill-down on those lists
+            models.Index(fields=['status', '-created_at']),
+            models.Index(fields=['sample_type', '-created_at']),
             models.Index(fields=['-updated_at']),
+            models.Index(fields=['-created_at']),
         ]
     
     def __str__(self):
@@ -222,42 +285,411 @@ class Sample(models.Model):
         }
         return status_classes.get(self.status, 'secondary')
     
+    def refresh_search_fields(self):
+        """Recompute the normalized search columns from the current values"""
+        self.search_text = build_search_text(self)
+        self.search_name = normalize_search(self.name)[:200]
+    
     def save(self, *args, **kwargs):
-        # Compress image if present
-        if self.image:
+        # Compress a newly uploaded image; a stored one is already compressed
+        if self.image and not self.image._committed:
             self.image = self.compress_image(self.image)
+        self.refresh_search_fields()
+        if not self._state.adding:
+            self.version += 1
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'search_text', 'search_name', 'version'}
         super().save(*args, **kwargs)
     
     def compress_image(self, image, max_size_kb=500, max_dimension=1200):
-        """Compress image to reduce storage usage"""
+        """Compress image to reduce storage usage (see images.py)"""
         if not image:
             return image
         
+        start = time.perf_counter()
         try:
-            img = Image.open(image)
-            
-            # Convert to RGB if necessary (for PNG with transparency)
-            if img.mode in ('RGBA', 'P'):
-                img = img.convert('RGB')
-            
-            # Resize if too large
-            if img.width > max_dimension or img.height > max_dimension:
-                img.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
-            
-            # Save with compression
-            output = BytesIO()
-            img.save(output, format='JPEG', quality=85, optimize=True)
-            output.seek(0)
-            
-            # Create new file
-            return InMemoryUploadedFile(
-                output,
-                'ImageField',
-                f"{image.name.rsplit('.', 1)[0]}.jpg",
-                'image/jpeg',
-                sys.getsizeof(output),
-                None
-            )
+            output = images.compress_image(image, max_dimension, max_size_kb, settings.IMAGE_MAX_PIXELS)
+            return File(output, name=f"{image.name.rsplit('.', 1)[0]}.jpg")
+        except images.ImageTooLarge:
+            # Forms refuse these (validate_image_pixels); never store one
+            raise
         except Exception:
             # If compression fails, return original
             return image
+        finally:
+            metrics.observe('image_processing_duration_seconds', time.perf_counter() - start)
+
+
+class SampleTransaction(models.Model):
+    """One withdrawal or deposit of vials (see inventory.py)
+
+    A compact ledger: unlike a full history row, each entry only records
+    the amount moved and the balance it left.
+    """
+    
+    WITHDRAWAL = 'WITHDRAWAL'
+    DEPOSIT = 'DEPOSIT'
+    KIND_CHOICES = [
+        (WITHDRAWAL, _('Withdrawal')),
+        (DEPOSIT, _('Deposit')),
+    ]
+    
+    sample = models.ForeignKey(
+        Sample,
+        on_delete=models.CASCADE,
+        related_name='transactions',
+        verbose_name=_("Sample")
+    )
+    kind = models.CharField(
+        max_length=10,
+        choices=KIND_CHOICES,
+        verbose_name=_("Type")
+    )
+    amount = models.FloatField(
+        validators=[MinValueValidator(0)],
+        verbose_name=_("Amount (vials)")
+    )
+    quantity_after = models.FloatField(
+        verbose_name=_("Balance (vials)")
+    )
+    note = models.CharField(
+        max_length=200,
+        blank=True,
+        verbose_name=_("Note")
+    )
+    performed_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='sample_transactions',
+        verbose_name=_("Performed By")
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name=_("Date")
+    )
+    
+    class Meta:
+        ordering = ['-created_at', '-id']
+        verbose_name = _("Sample Transaction")
+        verbose_name_plural = _("Sample Transactions")
+        indexes = [
+            models.Index(fields=['sample', '-created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.amount:g}"
+
+
+class SampleIdSequence(models.Model):
+    """Last sample ID number handed out per sample type and year (see sequences.py)"""
+    
+    sample_type = models.CharField(
+        max_length=10,
+        choices=Sample.SAMPLE_TYPE_CHOICES,
+        verbose_name=_("Sample Type")
+    )
+    year = models.PositiveSmallIntegerField(
+        verbose_name=_("Year")
+    )
+    last_value = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_("Last Number")
+    )
+    
+    class Meta:
+        verbose_name = _("Sample ID Sequence")
+        verbose_name_plural = _("Sample ID Sequences")
+        constraints = [
+            models.UniqueConstraint(fields=['sample_type', 'year'], name='unique_sample_id_sequence'),
+        ]
+    
+    def __str__(self):
+        return f"{self.sample_type}-{self.year}: {self.last_value}"
+
+
+class InventorySnapshot(models.Model):
+    """Samples and vials per status and type at the end of one day
+
+    A daily rollup of the sample history for the dashboard's trend charts,
+    maintained by the update_inventory_snapshots command (see snapshots.py).
+    Combinations with no samples on a day have no row.
+    """
+    
+    date = models.DateField(
+        verbose_name=_("Date")
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=Sample.STATUS_CHOICES,
+        verbose_name=_("Status")
+    )
+    sample_type = models.CharField(
+        max_length=10,
+        choices=Sample.SAMPLE_TYPE_CHOICES,
+        verbose_name=_("Sample Type")
+    )
+    sample_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_("Samples")
+    )
+    total_quantity = models.FloatField(
+        default=0,
+        verbose_name=_("Vials")
+    )
+    
+    class Meta:
+        ordering = ['date', 'status', 'sample_type']
+        verbose_name = _("Inventory Snapshot")
+        verbose_name_plural = _("Inventory Snapshots")
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'status', 'sample_type'], name='unique_inventory_snapshot'),
+        ]
+    
+    def __str__(self):
+        return f"{self.date} {self.status} {self.sample_type}: {self.sample_count}"
+
+
+class SnapshotWatermark(models.Model):
+    """Newest history record and ledger entry already folded into the inventory snapshots (one row)"""
+    
+    last_history_id = models.BigIntegerField(
+        default=0,
+        verbose_name=_("Last History Record")
+    )
+    last_transaction_id = models.BigIntegerField(
+        default=0,
+        verbose_name=_("Last Ledger Entry")
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name=_("Updated At")
+    )
+    
+    class Meta:
+        verbose_name = _("Snapshot Watermark")
+        verbose_name_plural = _("Snapshot Watermark")
+    
+    def __str__(self):
+        return f"History #{self.last_history_id}"
+
+
+class DepletionForecast(models.Model):
+    """When a sample is projected to run out at its recent rate of use
+
+    Rebuilt for all samples by the update_depletion_forecasts command (see
+    forecasting.py). Samples that were not used recently have no row.
+    """
+    
+    sample = models.OneToOneField(
+        Sample,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='depletion_forecast',
+        verbose_name=_("Sample")
+    )
+    daily_usage = models.FloatField(
+        verbose_name=_("Vials per Day")
+    )
+    depletion_date = models.DateField(
+        null=True,
+        blank=True,
+        verbose_name=_("Projected Depletion")
+    )
+    computed_at = models.DateTimeField(
+        verbose_name=_("Computed At")
+    )
+    
+    class Meta:
+        ordering = ['depletion_date']
+        verbose_name = _("Depletion Forecast")
+        verbose_name_plural = _("Depletion Forecasts")
+        indexes = [
+            models.Index(fields=['depletion_date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.sample_id}: {self.depletion_date or '-'}"
+
+
+class AttachmentStorage(FileSystemStorage):
+    """Attachments are kept outside MEDIA_ROOT and only served by the download view
+
+    The location is read from ATTACHMENT_ROOT on every use, so it follows
+    override_settings like MEDIA_ROOT does.
+    """
+    
+    @property
+    def base_location(self):
+        return settings.ATTACHMENT_ROOT
+    
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+
+def attachment_storage():
+    return AttachmentStorage()
+
+
+class AttachmentBlob(models.Model):
+    """The content of an attachment, stored once however many samples share it
+
+    Files are named after their SHA-256 (see attachments.py), so uploading
+    the same certificate for a hundred samples keeps one copy on disk.
+    """
+    
+    sha256 = models.CharField(
+        max_length=64,
+        unique=True,
+        verbose_name=_("SHA-256")
+    )
+    size = models.BigIntegerField(
+        verbose_name=_("Size (bytes)")
+    )
+    file = models.FileField(
+        storage=attachment_storage,
+        verbose_name=_("File")
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name=_("Created At")
+    )
+    
+    class Meta:
+        verbose_name = _("Attachment Content")
+        verbose_name_plural = _("Attachment Contents")
+    
+    def __str__(self):
+        return self.sha256
+
+
+class SampleAttachment(models.Model):
+    """A document attached to a sample: certificate of analysis, karyotype, sequencing report"""
+    
+    KIND_CHOICES = [
+        ('COA', _('Certificate of Analysis')),
+        ('KARYOTYPE', _('Karyotype')),
+        ('SEQUENCING', _('Sequencing Report')),
+        ('OTHER', _('Other')),
+    ]
+    
+    sample = models.ForeignKey(
+        Sample,
+        on_delete=models.CASCADE,
+        related_name='attachments',
+        verbose_name=_("Sample")
+    )
+    blob = models.ForeignKey(
+        AttachmentBlob,
+        on_delete=models.PROTECT,
+        related_name='attachments',
+        verbose_name=_("Content")
+    )
+    kind = models.CharField(
+        max_length=20,
+        choices=KIND_CHOICES,
+        default='OTHER',
+        verbose_name=_("Type")
+    )
+    filename = models.CharField(
+        max_length=255,
+        verbose_name=_("File Name")
+    )
+    content_type = models.CharField(
+        max_length=100,
+        blank=True,
+        verbose_name=_("Content Type")
+    )
+    uploaded_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='sample_attachments',
+        verbose_name=_("Uploaded By")
+    )
+    uploaded_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name=_("Uploaded At")
+    )
+    
+    class Meta:
+        ordering = ['-uploaded_at', '-id']
+        verbose_name = _("Sample Attachment")
+        verbose_name_plural = _("Sample Attachments")
+    
+    def __str__(self):
+        return self.filename
+
+
+class UploadSession(models.Model):
+    """An attachment upload in progress, received in chunks (see attachments.py)
+
+    ``received`` is how many bytes of the partial file are confirmed; a
+    client that lost its connection asks for it and resumes from there.
+    """
+    
+    id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False
+    )
+    sample = models.ForeignKey(
+        Sample,
+        on_delete=models.CASCADE,
+        related_name='upload_sessions',
+        verbose_name=_("Sample")
+    )
+    kind = models.CharField(
+        max_length=20,
+        choices=SampleAttachment.KIND_CHOICES,
+        default='OTHER',
+        verbose_name=_("Type")
+    )
+    filename = models.CharField(
+        max_length=255,
+        verbose_name=_("File Name")
+    )
+    content_type = models.CharField(
+        max_length=100,
+        blank=True,
+        verbose_name=_("Content Type")
+    )
+    size = models.BigIntegerField(
+        verbose_name=_("Size (bytes)")
+    )
+    sha256 = models.CharField(
+        max_length=64,
+        blank=True,
+        verbose_name=_("SHA-256")
+    )
+    received = models.BigIntegerField(
+        default=0,
+        verbose_name=_("Received (bytes)")
+    )
+    created_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='upload_sessions',
+        verbose_name=_("Created By")
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name=_("Created At")
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name=_("Updated At")
+    )
+    
+    class Meta:
+        verbose_name = _("Upload Session")
+        verbose_name_plural = _("Upload Sessions")
+        indexes = [
+            models.Index(fields=['updated_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size})"
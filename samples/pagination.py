@@ -0,0 +1,53 @@
+"""
+Pagination for tables too large to count.
+
+Django's admin counts the whole result with ``COUNT(*)`` to number its
+pages, which on a large table reads every row (or index entry) on every
+page view. ``EstimatedCountPaginator`` takes the database's row estimate
+for unfiltered lists and counts filtered lists only up to COUNT_LIMIT, so
+page views cost the same however large the table grows.
+"""
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max
+from django.utils.functional import cached_property
+
+
+def estimate_row_count(model, using):
+    """Approximate number of rows of a model's table, without counting
+
+    PostgreSQL's planner statistics, or the highest primary key elsewhere
+    (one index lookup; deleted rows make it an overestimate). None if there
+    is no estimate.
+    """
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                           [model._meta.db_table])
+            row = cursor.fetchone()
+        # -1 until the table has been vacuumed or analyzed
+        return row[0] if row and row[0] >= 0 else None
+    return model._default_manager.using(using).aggregate(last=Max('pk'))['last']
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that never runs an unbounded COUNT(*)
+
+    Results beyond COUNT_LIMIT rows of a filtered list get no page links;
+    narrow the filters or search to reach them.
+    """
+
+    COUNT_LIMIT = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimate_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > self.COUNT_LIMIT:
+                return estimate
+        # COUNT over a LIMITed subquery stops after COUNT_LIMIT rows. Without
+        # ORDER BY the database can pick the filter's index to find them.
+        return queryset.order_by()[:self.COUNT_LIMIT].count()
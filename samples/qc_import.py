@@ -0,0 +1,223 @@
+"""
+Viability and QC results from cell counter exports.
+
+Counters export a plate at a time as CSV: often a few lines of instrument
+metadata, then a header row and one row per sample. ``read_qc_rows``
+streams such a file line by line. It skips the metadata until a header
+names a sample ID column, guesses the delimiter from that header (comma,
+semicolon or tab), and yields one QCRow per data row.
+
+``import_qc_results`` then updates all matched samples together, instead of
+one form save per sample:
+
+1. Every sample ID is looked up in a few ``IN (...)`` queries (lookup.py).
+2. Viability is set and a dated line is appended to the QC notes. The
+   version moves on, so edit forms opened before the import detect it (see
+   concurrency.py).
+3. One batched UPDATE and one bulk insert of history records, in a single
+   transaction, then one data-version bump. The UPDATE appends the note
+   and increments the version in SQL, so it needs no lock on the rows read
+   in step 1, which SQLite could not give anyway.
+
+IDs with no sample and rows that cannot be read are reported, not applied.
+"""
+
+import csv
+import re
+import time
+
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+from . import metrics
+from .cache import bump_data_version
+from .lookup import fetch_samples_by_sample_id
+from .models import Sample
+
+
+# Header names instruments use, compared lowercased without punctuation
+SAMPLE_ID_COLUMNS = {'sampleid', 'sample', 'samplename', 'id', 'barcode'}
+VIABILITY_COLUMNS = {'viability', 'viabilitypercent', 'viable', 'viablecells', 'percentviable',
+                     'percentviability', 'livecellviability'}
+NOTE_COLUMNS = {'note', 'notes', 'comment', 'comments', 'qcnotes', 'remarks'}
+DELIMITERS = ',;\t'
+# Metadata lines read while looking for the header
+MAX_PREAMBLE_LINES = 50
+UPDATE_BATCH_SIZE = 500
+# Stripped from the end of the QC notes before a line is appended
+NOTE_WHITESPACE = ' \t\r\n'
+
+
+class QCFileError(Exception):
+    """The file has no header row with sample ID and viability columns"""
+
+
+class QCRow:
+    """One data row of an export: line number, sample ID, viability and note"""
+
+    def __init__(self, line, sample_id, viability, note=''):
+        self.line = line
+        self.sample_id = sample_id
+        self.viability = viability
+        self.note = note
+
+
+class QCImportResult:
+    """What an import changed and what it could not apply"""
+
+    def __init__(self):
+        self.updated = []      # sample IDs
+        self.unmatched = []    # (line, sample ID)
+        self.errors = []       # (line, message)
+        self.duration = 0.0
+
+    @property
+    def ok(self):
+        return not self.unmatched and not self.errors
+
+
+def _column_key(name):
+    return re.sub(r'[^a-z]', '', name.lower().replace('%', 'percent'))
+
+
+def _find_column(keys, names):
+    return next((index for index, key in enumerate(keys) if key in names), None)
+
+
+def parse_viability(value):
+    """A viability percentage from '92.5', '92,5' or '92.5 %', or None if unreadable"""
+    value = value.strip().rstrip('%').strip().replace(',', '.')
+    try:
+        viability = float(value)
+    except ValueError:
+        return None
+    if not 0 <= viability <= 100:
+        return None
+    return round(viability, 2)
+
+
+def read_qc_rows(lines, errors):
+    """Yield QCRow for each data row of an export given as an iterable of text lines
+
+    Unreadable rows are appended to errors as (line, message). Raises
+    QCFileError if no header is found.
+    """
+    lines = iter(lines)
+    header = None
+    for number, line in enumerate(lines, start=1):
+        delimiter = max(DELIMITERS, key=line.count)
+        keys = [_column_key(name) for name in next(csv.reader([line], delimiter=delimiter), [])]
+        id_column = _find_column(keys, SAMPLE_ID_COLUMNS)
+        viability_column = _find_column(keys, VIABILITY_COLUMNS)
+        if id_column is not None and viability_column is not None:
+            header = keys
+            break
+        if number >= MAX_PREAMBLE_LINES:
+            break
+    if header is None:
+        raise QCFileError(_('No header row with a sample ID and a viability column was found.'))
+    note_column = _find_column(header, NOTE_COLUMNS)
+
+    reader = csv.reader(lines, delimiter=delimiter)
+    for row in reader:
+        row_number = number + reader.line_num
+        if not any(cell.strip() for cell in row):
+            continue
+        sample_id = row[id_column].strip() if id_column < len(row) else ''
+        if not sample_id:
+            errors.append((row_number, _('No sample ID.')))
+            continue
+        raw = row[viability_column] if viability_column < len(row) else ''
+        viability = parse_viability(raw)
+        if viability is None:
+            errors.append((row_number, _('%(sample_id)s: viability "%(value)s" is not a percentage.')
+                           % {'sample_id': sample_id, 'value': raw.strip()}))
+            continue
+        note = row[note_column].strip() if note_column is not None and note_column < len(row) else ''
+        yield QCRow(row_number, sample_id, viability, note)
+
+
+def _note_line(row, source, today):
+    parts = [f'{today:%Y-%m-%d}', _('QC import')]
+    if source:
+        parts.append(f'({source})')
+    line = ' '.join(parts) + ': ' + _('viability %(viability)s%%') % {'viability': f'{row.viability:g}'}
+    if row.note:
+        line += f' - {row.note}'
+    return line
+
+
+def _write_results(updates, now):
+    """Apply (pk, viability, note line) updates, one UPDATE statement per batch
+
+    The note line is appended and the version incremented by the statement
+    itself, from the row as it is when written rather than as it was read,
+    so an edit or import committed in between is kept, not overwritten.
+    ``bulk_update`` would build a CASE over every row for each column,
+    which costs more than the write itself at plate sizes.
+    """
+    meta = Sample._meta
+    quote = connection.ops.quote_name
+    viability, notes, updated_at, version, pk = (
+        quote(meta.get_field(name).column)
+        for name in ('viability', 'quality_control_notes', 'updated_at', 'version', 'id'))
+    trimmed = f'RTRIM({notes}, %s)'
+    sql = (f'UPDATE {quote(meta.db_table)} SET {viability} = %s, '
+           f'{notes} = CASE WHEN {trimmed} = %s THEN %s ELSE {trimmed} || %s END, '
+           f'{updated_at} = %s, {version} = {version} + 1 WHERE {pk} = %s')
+    moment = connection.ops.adapt_datetimefield_value(now)
+    params = [(value, NOTE_WHITESPACE, '', note, NOTE_WHITESPACE, f'\n{note}', moment, sample_pk)
+              for sample_pk, value, note in updates]
+    with connection.cursor() as cursor:
+        for offset in range(0, len(params), UPDATE_BATCH_SIZE):
+            cursor.executemany(sql, params[offset:offset + UPDATE_BATCH_SIZE])
+
+
+def import_qc_results(lines, user=None, source='', dry_run=False):
+    """Apply an export's viability results to the samples it names; returns a QCImportResult
+
+    lines is any iterable of text lines (an open file, an uploaded file
+    wrapped in a TextIOWrapper). A later row for the same sample wins.
+    With dry_run nothing is written.
+    """
+    start = time.perf_counter()
+    result = QCImportResult()
+    rows = {}
+    for row in read_qc_rows(lines, result.errors):
+        rows[row.sample_id] = row
+
+    now = timezone.now()
+    today = timezone.localdate(now)
+    samples = fetch_samples_by_sample_id(list(rows))
+    updates = []
+    for sample_id, row in rows.items():
+        sample = samples.get(sample_id)
+        if sample is None:
+            result.unmatched.append((row.line, sample_id))
+            continue
+        updates.append((sample.pk, row.viability, _note_line(row, source, today)))
+        result.updated.append(sample.sample_id)
+    if updates and not dry_run:
+        with transaction.atomic():
+            _write_results(updates, now)
+            # The rows as the UPDATE left them; written, they stay locked
+            # (SQLite: the database) until commit
+            changed = []
+            for offset in range(0, len(updates), UPDATE_BATCH_SIZE):
+                batch = [sample_pk for sample_pk, _value, _note in updates[offset:offset + UPDATE_BATCH_SIZE]]
+                changed.extend(Sample.objects.filter(pk__in=batch))
+            Sample.history.bulk_history_create(
+                changed, batch_size=UPDATE_BATCH_SIZE, default_user=user,
+                default_change_reason=_('QC import') + (f': {source}' if source else ''),
+                default_date=now,
+            )
+        # The raw UPDATE sends no post_save
+        bump_data_version()
+    result.duration = time.perf_counter() - start
+    metrics.observe('qc_import_duration_seconds', result.duration)
+    for outcome, count in (('updated', len(result.updated)), ('unmatched', len(result.unmatched)),
+                           ('error', len(result.errors))):
+        if count:
+            metrics.inc('qc_import_rows_total', count, outcome=outcome)
+    return result
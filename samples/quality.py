@@ -0,0 +1,185 @@
+"""
+Viability and passage analytics across the bank.
+
+Samples of one line (the same name, compared the way search compares
+names) are vials frozen at different passages, so a line whose viability
+drops with passage shows up as a negative slope across its samples.
+``analyze_quality`` reads the quality columns of every sample with one
+``values_list`` query into NumPy arrays and computes, without a Python loop
+over samples or lines:
+
+* per type: the distribution of viability (count, mean, quantiles) and the
+  slope of viability against passage;
+* per line: a least-squares fit of viability against passage, from per-line
+  sums gathered with ``np.bincount``; lines losing more than
+  DECLINE_PER_PASSAGE points per passage are flagged;
+* per sample: a robust z-score against its type (median and MAD), flagging
+  values further than OUTLIER_Z from the rest.
+
+The report lists the REPORT_LIMIT worst lines and outliers and counts the rest.
+
+``quality_report`` caches the result under the data version for
+PAGE_CACHE_TIMEOUT, like the page fragments, so it is recomputed after
+samples change or the entry expires. The analyze_quality command warms
+that cache and prints a summary.
+"""
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from .cache import get_data_version
+from .models import Sample
+
+
+QUANTILES = {'p10': 0.1, 'p25': 0.25, 'median': 0.5, 'p75': 0.75, 'p90': 0.9}
+# Samples with a passage number needed to fit a line
+MIN_LINE_SAMPLES = 3
+# Viability percentage points lost per passage that flag a declining line
+DECLINE_PER_PASSAGE = 0.5
+# Robust z-score (0.6745 * deviation / MAD) beyond which a sample is an outlier
+OUTLIER_Z = 3.5
+# Declining lines and outliers listed, worst first; the rest are only counted
+REPORT_LIMIT = 100
+
+
+def load_quality_columns():
+    """Samples with a viability, as NumPy columns
+
+    Names and sample IDs are only looked up for the samples and lines
+    reported (see analyze_quality).
+    """
+    rows = list(Sample.objects.filter(viability__isnull=False).order_by()
+                .values_list('pk', 'search_name', 'sample_type', 'passage_number', 'viability'))
+    pks, lines, sample_types, passages, viabilities = zip(*rows) if rows else ([],) * 5
+    return {
+        'pk': np.array(pks, dtype=np.int64),
+        'line': np.array(lines, dtype=str),
+        'sample_type': np.array(sample_types, dtype=str),
+        # Missing passage numbers become NaN
+        'passage': np.array(passages, dtype=np.float64),
+        'viability': np.array(viabilities, dtype=np.float64),
+    }
+
+
+def group_quantiles(values, groups, group_count, quantiles):
+    """Linearly interpolated quantiles of values per group, shape (groups, quantiles)"""
+    order = np.lexsort((values, groups))
+    ordered = values[order]
+    counts = np.bincount(groups, minlength=group_count)
+    starts = np.cumsum(counts) - counts
+    positions = starts[:, None] + np.asarray(quantiles)[None, :] * np.maximum(counts - 1, 0)[:, None]
+    low = np.floor(positions).astype(np.int64)
+    high = np.ceil(positions).astype(np.int64)
+    result = np.full(positions.shape, np.nan)
+    filled = counts > 0
+    fraction = positions[filled] - low[filled]
+    result[filled] = ordered[low[filled]] * (1 - fraction) + ordered[high[filled]] * fraction
+    return result
+
+
+def group_regression(x, y, groups, group_count):
+    """Least-squares slope, intercept, r² and point count of y against x per group"""
+    count = np.bincount(groups, minlength=group_count).astype(np.float64)
+    sum_x = np.bincount(groups, weights=x, minlength=group_count)
+    sum_y = np.bincount(groups, weights=y, minlength=group_count)
+    sum_xx = np.bincount(groups, weights=x * x, minlength=group_count)
+    sum_yy = np.bincount(groups, weights=y * y, minlength=group_count)
+    sum_xy = np.bincount(groups, weights=x * y, minlength=group_count)
+    var_x = count * sum_xx - sum_x ** 2
+    var_y = count * sum_yy - sum_y ** 2
+    cov = count * sum_xy - sum_x * sum_y
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = cov / var_x
+        intercept = (sum_y - slope * sum_x) / count
+        r_squared = np.where(var_y > 0, cov ** 2 / (var_x * var_y), 1.0)
+    # No spread in passage: no slope
+    slope[var_x <= 0] = np.nan
+    return slope, intercept, r_squared, count
+
+
+def analyze_quality(columns=None):
+    """Distributions per type, declining lines and outliers, as plain data"""
+    columns = load_quality_columns() if columns is None else columns
+    viability, passage = columns['viability'], columns['passage']
+
+    # Per type: distribution, passage trend, and the median and MAD for outliers
+    types, type_of = np.unique(columns['sample_type'], return_inverse=True)
+    type_count = len(types)
+    quantiles = group_quantiles(viability, type_of, type_count, list(QUANTILES.values()))
+    counts = np.bincount(type_of, minlength=type_count)
+    with np.errstate(invalid='ignore'):
+        means = np.bincount(type_of, weights=viability, minlength=type_count) / counts
+    has_passage = ~np.isnan(passage)
+    type_slope, _, _, type_points = group_regression(
+        passage[has_passage], viability[has_passage], type_of[has_passage], type_count)
+    medians = quantiles[:, list(QUANTILES).index('median')]
+    deviation = np.abs(viability - medians[type_of])
+    mad = group_quantiles(deviation, type_of, type_count, [0.5])[:, 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        robust_z = 0.6745 * (viability - medians[type_of]) / mad[type_of]
+    outlier = (mad[type_of] > 0) & (np.abs(robust_z) > OUTLIER_Z)
+
+    # Per line: viability against passage
+    lines, line_of = np.unique(columns['line'][has_passage], return_inverse=True)
+    slope, intercept, r_squared, points = group_regression(
+        passage[has_passage], viability[has_passage], line_of, len(lines))
+    declining = (points >= MIN_LINE_SAMPLES) & (slope <= -DECLINE_PER_PASSAGE)
+    first_of_line = columns['pk'][has_passage][np.unique(line_of, return_index=True)[1]]
+    line_passages = group_quantiles(passage[has_passage], line_of, len(lines), [0, 1])
+    declining_lines = np.flatnonzero(declining)
+    declining_lines = declining_lines[np.argsort(slope[declining_lines], kind='stable')][:REPORT_LIMIT]
+    outliers = np.flatnonzero(outlier)
+    outliers = outliers[np.argsort(-np.abs(robust_z[outliers]), kind='stable')][:REPORT_LIMIT]
+    labels = {
+        pk: (sample_id, name) for pk, sample_id, name in Sample.objects.filter(
+            pk__in=[*first_of_line[declining_lines].tolist(), *columns['pk'][outliers].tolist()],
+        ).values_list('pk', 'sample_id', 'name')
+    }
+
+    return {
+        'sample_count': len(viability),
+        'types': [
+            {
+                'sample_type': str(code), 'count': int(counts[index]), 'mean': float(means[index]),
+                **dict(zip(QUANTILES, quantiles[index].tolist())),
+                'mad': float(mad[index]),
+                'slope': None if np.isnan(type_slope[index]) else float(type_slope[index]),
+                'passage_samples': int(type_points[index]),
+            }
+            for index, code in enumerate(types)
+        ],
+        'declining_count': int(np.count_nonzero(declining)),
+        'declining_lines': [
+            {
+                'name': labels.get(int(first_of_line[index]), ('', ''))[1], 'samples': int(points[index]),
+                'slope': float(slope[index]), 'intercept': float(intercept[index]),
+                'r_squared': float(r_squared[index]),
+                'first_passage': int(line_passages[index, 0]), 'last_passage': int(line_passages[index, 1]),
+            }
+            for index in declining_lines
+        ],
+        'fitted_lines': int(np.count_nonzero(points >= MIN_LINE_SAMPLES)),
+        'outlier_count': int(np.count_nonzero(outlier)),
+        'outliers': [
+            {
+                'pk': int(columns['pk'][index]),
+                'sample_id': labels.get(int(columns['pk'][index]), ('', ''))[0],
+                'name': labels.get(int(columns['pk'][index]), ('', ''))[1],
+                'sample_type': str(columns['sample_type'][index]),
+                'viability': float(viability[index]), 'type_median': float(medians[type_of[index]]),
+                'z': float(robust_z[index]),
+            }
+            for index in outliers
+        ],
+    }
+
+
+def quality_report(refresh=False):
+    """analyze_quality() for the current data, computed once per data version"""
+    key = f'quality:{get_data_version()}'
+    report = None if refresh else cache.get(key)
+    if report is None:
+        report = analyze_quality()
+        cache.set(key, report, settings.PAGE_CACHE_TIMEOUT)
+    return report
@@ -0,0 +1,69 @@
+"""
+Read/write splitting between the primary database and a read replica.
+
+``ReplicaRoutingMiddleware`` turns replica reads on for the read-only views
+listed in ``REPLICA_READ_VIEWS``; everything else, and every write, goes to
+``default``. Only this app's models are routed, so sessions and users are
+always read from the primary.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+
+REPLICA_ALIAS = 'replica'
+
+_use_replica = ContextVar('use_replica', default=False)
+
+
+def replica_configured():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+def enable_replica_reads():
+    """Route reads to the replica for the current request; returns a reset token"""
+    return _use_replica.set(True)
+
+
+def reset_replica_reads(token):
+    _use_replica.reset(token)
+
+
+def disable_replica_reads():
+    """Route reads back to primary (used at the end of each request)"""
+    _use_replica.set(False)
+
+
+@contextmanager
+def replica_reads():
+    """Context manager version of enable_replica_reads, e.g. for scripts"""
+    token = enable_replica_reads()
+    try:
+        yield
+    finally:
+        reset_replica_reads(token)
+
+
+class ReadReplicaRouter:
+    """Send reads to the replica when enabled, and all writes to primary"""
+
+    route_app_labels = {'samples'}
+
+    def db_for_read(self, model, **hints):
+        if (_use_replica.get() and model._meta.app_label in self.route_app_labels
+                and replica_configured()):
+            return REPLICA_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        # Explicit, so instances loaded from the replica are saved to primary
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica is a copy of primary and is never migrated directly
+        return db != REPLICA_ALIAS
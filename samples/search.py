@@ -0,0 +1,58 @@
+"""
+Search normalization shared by the sample list, export, API and admin.
+
+Text is folded so that equivalent spellings compare equal:
+
+* NFKC turns full-width letters and digits (ＩＰＳＣ－００１) into ASCII
+* casefold() removes case differences
+* Traditional Chinese characters are mapped to Simplified (幹細胞 -> 干细胞)
+  with OpenCC's character table (traditional_simplified.txt, about 3,200
+  characters). Characters are mapped one by one; one with several
+  Simplified forms always takes OpenCC's default.
+
+``Sample.save()`` stores the folded text in ``search_text`` (every
+searchable field) and ``search_name`` (name only, indexed for prefix
+lookups), and queries fold the user's input the same way, so one column
+comparison replaces five case-insensitive OR'ed LIKEs. That comparison is
+still a substring match over every row, as the LIKEs were: the folded
+column makes equivalent spellings match, not substring search faster.
+Only prefix lookups on ``search_name`` (autocomplete) use an index.
+"""
+
+import os
+import unicodedata
+
+
+# Traditional -> Simplified characters, generated from OpenCC's complete
+# character table by the build_search_table command
+TRADITIONAL_SIMPLIFIED_FILE = os.path.join(os.path.dirname(__file__), 'traditional_simplified.txt')
+
+
+def read_traditional_simplified(path=TRADITIONAL_SIMPLIFIED_FILE):
+    """{traditional: simplified} from the table file (pairs like 幹干, # comments)"""
+    with open(path, encoding='utf-8') as file:
+        return {
+            pair[0]: pair[1]
+            for line in file if not line.startswith('#')
+            for pair in line.split()
+        }
+
+
+TRADITIONAL_TO_SIMPLIFIED = str.maketrans(read_traditional_simplified())
+
+# Sample fields whose text is searchable from the list, export and API
+SEARCH_FIELDS = ['sample_id', 'name', 'description', 'sample_type', 'storage_location']
+
+
+def normalize_search(text):
+    """Fold width, case and Traditional/Simplified variants of text"""
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFKC', str(text)).casefold()
+    return text.translate(TRADITIONAL_TO_SIMPLIFIED)
+
+
+def build_search_text(sample):
+    """Folded concatenation of a sample's searchable fields"""
+    # Newline separators keep matches from spanning two fields
+    return '\n'.join(normalize_search(getattr(sample, field)) for field in SEARCH_FIELDS)
@@ -0,0 +1,118 @@
+"""
+Sample ID allocation.
+
+IDs look like ``IPSC-2026-001``: sample type, year, then a number counted
+per type and year. The counters live in SampleIdSequence, one row per
+(type, year), and are advanced with a single ``UPDATE ... SET last_value =
+last_value + n ... RETURNING last_value``, so concurrent creates never get
+the same number and a bulk import reserves its whole range in one
+statement. Only the first allocation of a type and year looks at existing
+sample IDs (an index range scan over that prefix), so hand-typed IDs from
+before the counter existed are skipped.
+"""
+
+import re
+
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Sample, SampleIdSequence
+
+
+SAMPLE_ID_PATTERN = re.compile(r'^([A-Z]+)-(\d{4})-(\d+)$')
+
+SAMPLE_TYPES = {value for value, label in Sample.SAMPLE_TYPE_CHOICES}
+
+
+def format_sample_id(sample_type, year, number):
+    return f'{sample_type}-{year}-{number:03d}'
+
+
+def parse_sample_id(sample_id):
+    """(sample_type, year, number) for IDs in the standard format, else None"""
+    match = SAMPLE_ID_PATTERN.match(sample_id or '')
+    if match is None or match.group(1) not in SAMPLE_TYPES:
+        return None
+    return match.group(1), int(match.group(2)), int(match.group(3))
+
+
+def _supports_update_returning(connection):
+    # Django's update() cannot return values; both backends accept
+    # UPDATE ... RETURNING (SQLite since 3.35)
+    return connection.vendor == 'postgresql' or (
+        connection.vendor == 'sqlite' and connection.features.can_return_columns_from_insert)
+
+
+def _increment(db, sample_type, year, count):
+    """Advance an existing counter by count; the new last value, or None"""
+    connection = connections[db]
+    if _supports_update_returning(connection):
+        qn = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {qn(SampleIdSequence._meta.db_table)} '
+                f'SET {qn("last_value")} = {qn("last_value")} + %s '
+                f'WHERE {qn("sample_type")} = %s AND {qn("year")} = %s '
+                f'RETURNING {qn("last_value")}',
+                [count, sample_type, year],
+            )
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    sequences = SampleIdSequence.objects.using(db).filter(sample_type=sample_type, year=year)
+    with transaction.atomic(using=db):
+        if not sequences.update(last_value=F('last_value') + count):
+            return None
+        return sequences.values_list('last_value', flat=True).get()
+
+
+def _highest_existing(db, sample_type, year):
+    """Highest number among existing IDs of a type and year"""
+    prefix = f'{sample_type}-{year}-'
+    sample_ids = Sample.objects.using(db).filter(
+        sample_id__gte=prefix, sample_id__lt=prefix + '\U0010ffff',
+    ).values_list('sample_id', flat=True)
+    numbers = [parsed[2] for parsed in map(parse_sample_id, sample_ids) if parsed]
+    return max(numbers, default=0)
+
+
+def allocate_sample_ids(sample_type, count=1, year=None):
+    """Reserve count consecutive sample IDs of a type; returns them in order"""
+    if sample_type not in SAMPLE_TYPES:
+        raise ValueError(f'Unknown sample type: {sample_type}')
+    if count < 1:
+        raise ValueError('count must be at least 1')
+    year = year or timezone.localdate().year
+    db = router.db_for_write(SampleIdSequence)
+
+    last = _increment(db, sample_type, year, count)
+    if last is None:
+        # First ID of this type and year
+        start = _highest_existing(db, sample_type, year)
+        try:
+            with transaction.atomic(using=db):
+                SampleIdSequence.objects.using(db).create(
+                    sample_type=sample_type, year=year, last_value=start + count)
+            last = start + count
+        except IntegrityError:
+            # Another request created the counter first
+            last = _increment(db, sample_type, year, count)
+    return [format_sample_id(sample_type, year, number) for number in range(last - count + 1, last + 1)]
+
+
+def assign_sample_id(sample):
+    """Give a new sample the next ID of its type, unless one was typed in
+
+    A typed-in ID in the standard format moves its counter past it, so the
+    counter never hands it out again.
+    """
+    if not sample.sample_id:
+        sample.sample_id = allocate_sample_ids(sample.sample_type)[0]
+        return
+    parsed = parse_sample_id(sample.sample_id)
+    if parsed is not None:
+        sample_type, year, number = parsed
+        SampleIdSequence.objects.filter(sample_type=sample_type, year=year).update(
+            last_value=Greatest(F('last_value'), number))
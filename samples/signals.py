@@ -0,0 +1,19 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import bump_data_version
+from .models import Sample, SiteSettings
+
+
+@receiver(post_save, sender=Sample)
+@receiver(post_delete, sender=Sample)
+@receiver(post_save, sender=SiteSettings)
+@receiver(post_delete, sender=SiteSettings)
+def invalidate_page_cache(sender, using, **kwargs):
+    """Any change to inventory or branding invalidates cached pages
+
+    Only once the change commits: bumped inside the transaction, a request
+    in between would cache the old data under the new version.
+    """
+    transaction.on_commit(bump_data_version, using=using)
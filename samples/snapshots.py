@@ -0,0 +1,224 @@
+"""
+Daily inventory snapshots for the dashboard's trend charts.
+
+Rebuilding two years of daily counts from the sample history on every page
+view would read every history record. InventorySnapshot keeps one row per
+day, status and type instead, and ``update_snapshots`` folds in only the
+history records and ledger entries (SampleTransaction) written since its
+last run. Withdrawals and deposits write both, but ledger rows loaded
+without a history record still move the counts; a ledger entry replays as
+the sample's previous state with the entry's balance and status, so
+replaying both for one withdrawal counts it once.
+
+1. Recomputation starts at the day after the last snapshot, or earlier if a
+   history record or ledger entry added since the last run (above its
+   watermark) carries an older date. Days before that are final.
+2. Counters start from the snapshot of the day before. Every sample that
+   changed since then starts from its latest record before that day.
+3. The changes are replayed in order, writing the counters at the end of
+   each day up to today. Today's rows are provisional and replaced by the
+   next run.
+
+Without new history or ledger entries a run writes nothing, so it can be scheduled as often
+as wanted. ``full=True`` rebuilds everything from the first history record.
+The chart then reads one row per day, status and type (``inventory_trend``).
+"""
+
+import heapq
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from itertools import chain
+from operator import itemgetter
+
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+from django.utils import timezone
+
+from .cache import bump_data_version
+from .history import inventory_as_of
+from .inventory import status_after
+from .models import InventorySnapshot, Sample, SampleTransaction, SnapshotWatermark
+
+
+HistoricalSample = Sample.history.model
+
+# Sample ids per "state before" lookup, below every database's parameter limit
+LOOKUP_BATCH_SIZE = 500
+REPLAY_CHUNK_SIZE = 5000
+# Replay order of a history record and a ledger entry at the same moment
+HISTORY, LEDGER = 0, 1
+
+
+def start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def update_snapshots(full=False, today=None):
+    """Bring the snapshots up to date; returns the number of days written"""
+    today = today or timezone.localdate()
+    watermark = SnapshotWatermark.objects.get_or_create(pk=1)[0]
+    last_day = InventorySnapshot.objects.aggregate(last=Max('date'))['last']
+
+    if full or last_day is None:
+        firsts = [HistoricalSample.objects.aggregate(first=Min('history_date'))['first'],
+                  SampleTransaction.objects.aggregate(first=Min('created_at'))['first']]
+        if firsts[0] is None:
+            return 0
+        start, full = timezone.localdate(min(first for first in firsts if first)), True
+    else:
+        start = last_day + timedelta(days=1)
+        # Min() here would make SQLite walk the history_date index past every
+        # old record; reading the new records' dates follows the primary key
+        new_dates = chain(
+            HistoricalSample.objects.filter(history_id__gt=watermark.last_history_id)
+            .order_by().values_list('history_date', flat=True).iterator(chunk_size=REPLAY_CHUNK_SIZE),
+            SampleTransaction.objects.filter(pk__gt=watermark.last_transaction_id)
+            .order_by().values_list('created_at', flat=True).iterator(chunk_size=REPLAY_CHUNK_SIZE),
+        )
+        backdated = min(new_dates, default=None)
+        if backdated is not None:
+            start = min(start, timezone.localdate(backdated))
+    if start > today:
+        return 0
+
+    window_start, window_end = start_of_day(start), start_of_day(today + timedelta(days=1))
+    window = HistoricalSample.objects.filter(history_date__gte=window_start, history_date__lt=window_end)
+    ledger = SampleTransaction.objects.filter(created_at__gte=window_start, created_at__lt=window_end)
+    if full:
+        counters, state = defaultdict(lambda: [0, 0.0]), {}
+    else:
+        counters, state = _state_before(start, window, ledger)
+
+    rows = []
+    last_history_id, last_transaction_id = watermark.last_history_id, watermark.last_transaction_id
+    day = start
+    for when, source, event_id, pk, current in _events(window, ledger, state):
+        event_day = timezone.localdate(when)
+        while day < event_day:
+            rows.extend(_snapshot_rows(day, counters))
+            day += timedelta(days=1)
+        previous = state.get(pk)
+        if previous:
+            counter = counters[previous[:2]]
+            counter[0] -= 1
+            counter[1] -= previous[2]
+        if current:
+            counter = counters[current[:2]]
+            counter[0] += 1
+            counter[1] += current[2]
+        state[pk] = current
+        if source == HISTORY:
+            last_history_id = max(last_history_id, event_id)
+        else:
+            last_transaction_id = max(last_transaction_id, event_id)
+    while day <= today:
+        rows.extend(_snapshot_rows(day, counters))
+        day += timedelta(days=1)
+
+    with transaction.atomic():
+        stale = InventorySnapshot.objects.all() if full else InventorySnapshot.objects.filter(date__gte=start)
+        stale.delete()
+        InventorySnapshot.objects.bulk_create(rows, batch_size=1000)
+        watermark.last_history_id = last_history_id
+        watermark.last_transaction_id = last_transaction_id
+        watermark.save()
+    bump_data_version()
+    return (today - start).days + 1
+
+
+def _events(window, ledger, state):
+    """History records and ledger entries of the window in order, as
+    (time, source, id, sample pk, state after it or None)
+
+    A ledger entry keeps the sample's type and takes its balance and the
+    status it leaves. It changes nothing for a sample the replay does not
+    know, since a sample's creation is always a history record.
+    """
+    records = (window.order_by('history_date', 'history_id')
+               .values_list('history_date', 'history_id', 'id', 'history_type', 'status', 'sample_type', 'quantity')
+               .iterator(chunk_size=REPLAY_CHUNK_SIZE))
+    entries = (ledger.order_by('created_at', 'id')
+               .values_list('created_at', 'id', 'sample_id', 'kind', 'quantity_after')
+               .iterator(chunk_size=REPLAY_CHUNK_SIZE))
+    events = heapq.merge(
+        ((when, HISTORY, history_id, *rest) for when, history_id, *rest in records),
+        ((when, LEDGER, entry_id, *rest) for when, entry_id, *rest in entries),
+        key=itemgetter(0, 1, 2),
+    )
+    for when, source, event_id, pk, *fields in events:
+        if source == HISTORY:
+            history_type, status, sample_type, quantity = fields
+            yield when, source, event_id, pk, None if history_type == '-' else (status, sample_type, quantity or 0)
+        else:
+            kind, quantity_after = fields
+            previous = state.get(pk)
+            yield when, source, event_id, pk, previous and (
+                status_after(kind, previous[0], quantity_after), previous[1], quantity_after)
+
+
+def _state_before(start, window, ledger):
+    """Counters at the end of the day before start, and the state then of the samples changed since"""
+    before = start_of_day(start) - timedelta(microseconds=1)
+    counters = defaultdict(lambda: [0, 0.0])
+    previous = InventorySnapshot.objects.filter(date=start - timedelta(days=1))
+    if previous.exists() or not InventorySnapshot.objects.filter(date__lt=start).exists():
+        for status, sample_type, count, quantity in previous.values_list(
+                'status', 'sample_type', 'sample_count', 'total_quantity'):
+            counters[status, sample_type] = [count, quantity]
+    else:
+        # Backdated history reached past the oldest snapshot
+        totals = (inventory_as_of(before).order_by().values('status', 'sample_type')
+                  .annotate(count=Count('history_id'), quantity=Sum('quantity')))
+        for row in totals:
+            counters[row['status'], row['sample_type']] = [row['count'], row['quantity'] or 0]
+
+    state = {}
+    changed = sorted(set(window.order_by().values_list('id', flat=True).distinct())
+                     | set(ledger.order_by().values_list('sample_id', flat=True).distinct()))
+    for offset in range(0, len(changed), LOOKUP_BATCH_SIZE):
+        batch = changed[offset:offset + LOOKUP_BATCH_SIZE]
+        for pk, status, sample_type, quantity in inventory_as_of(before, batch).values_list(
+                'id', 'status', 'sample_type', 'quantity'):
+            state[pk] = (status, sample_type, quantity or 0)
+    return counters, state
+
+
+def _snapshot_rows(day, counters):
+    return [
+        InventorySnapshot(date=day, status=status, sample_type=sample_type,
+                          sample_count=count, total_quantity=round(quantity, 3))
+        for (status, sample_type), (count, quantity) in counters.items()
+        if count
+    ]
+
+
+def inventory_trend(days):
+    """Daily series of the last days for the dashboard chart
+
+    Dates, sample counts per status and per type, and total vials, read
+    from the snapshots (one row per day, status and type).
+    """
+    since = timezone.localdate() - timedelta(days=days)
+    statuses = dict(Sample.STATUS_CHOICES)
+    sample_types = dict(Sample.SAMPLE_TYPE_CHOICES)
+    dates = []
+    by_status = {code: [] for code in statuses}
+    by_type = {code: [] for code in sample_types}
+    vials = []
+    rows = (InventorySnapshot.objects.filter(date__gte=since)
+            .values_list('date', 'status', 'sample_type', 'sample_count', 'total_quantity'))
+    for date, status, sample_type, count, quantity in rows:
+        if not dates or dates[-1] != date.isoformat():
+            dates.append(date.isoformat())
+            for series in (*by_status.values(), *by_type.values()):
+                series.append(0)
+            vials.append(0)
+        by_status.setdefault(status, [0] * len(dates))[-1] += count
+        by_type.setdefault(sample_type, [0] * len(dates))[-1] += count
+        vials[-1] = round(vials[-1] + quantity, 3)
+    return {
+        'dates': dates,
+        'status': [{'label': str(statuses.get(code, code)), 'data': data} for code, data in by_status.items()],
+        'type': [{'label': str(sample_types.get(code, code)), 'data': data} for code, data in by_type.items()],
+        'vials': vials,
+    }
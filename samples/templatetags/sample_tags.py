@@ -1,6 +1,8 @@
 from django import template
 from django.utils.translation import get_language
 
+from samples.cache import get_cached_page, page_cache_key, set_cached_page
+
 register = template.Library()
 
 
@@ -70,3 +72,42 @@ def localized_date(date_obj):
         weekday = weekdays_en[weekday_idx]
         return date_obj.strftime(f'{weekday}, %B %d, %Y')
 
+
+
+class VersionedCacheNode(template.Node):
+    def __init__(self, nodelist, fragment_name, vary_on):
+        self.nodelist = nodelist
+        self.fragment_name = fragment_name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        request = context['request']
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        key = page_cache_key(request, self.fragment_name, *vary_on)
+        html = get_cached_page(key)
+        if html is None:
+            html = self.nodelist.render(context)
+            set_cached_page(key, html)
+        return html
+
+
+@register.tag('versioned_cache')
+def do_versioned_cache(parser, token):
+    """
+    Cache a fragment until sample data changes.
+
+    Usage: {% versioned_cache "name" [vary_on ...] %}...{% endversioned_cache %}
+
+    The key covers the URL, query string, language, user role and the global
+    data version, plus any extra vary_on values. Context values inside the
+    block are only evaluated on a cache miss, so views should pass lazy
+    querysets.
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' tag requires a fragment name.")
+    nodelist = parser.parse(('endversioned_cache',))
+    parser.delete_first_token()
+    fragment_name = bits[1].strip('"\'')
+    vary_on = [parser.compile_filter(bit) for bit in bits[2:]]
+    return VersionedCacheNode(nodelist, fragment_name, vary_on)
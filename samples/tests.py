@@ -1,3 +1,936 @@
-from django.test import TestCase
+import importlib
+import gzip
+import io
+import json
+import os
+import tempfile
+import time
+import zipfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.conf import settings
+from django.contrib.admin.sites import site
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+import numpy as np
+from PIL import Image
+
+from . import attachments, forecasting, image_import, images, inventory, metrics, qc_import, quality, routers
+from .api import AUTOCOMPLETE_LIMIT, prefix_range, prefix_upper_bound
+from .cache import bump_data_version, get_data_version
+from .concurrency import VersionConflict, base_record, save_if_unchanged, three_way_merge
+from .history import inventory_as_of
+from .management.commands.build_search_table import resolve
+from .image_import import ImageImportResult, match_archive
+from .models import (
+    DepletionForecast, InventorySnapshot, Sample, SampleIdSequence, SampleTransaction, SnapshotWatermark, UploadSession,
+)
+from .search import TRADITIONAL_SIMPLIFIED_FILE, TRADITIONAL_TO_SIMPLIFIED, normalize_search
+from .sequences import allocate_sample_ids, assign_sample_id
+from .snapshots import update_snapshots
+
+
+def make_sample(sample_id='IPSC-2024-001', **fields):
+    return Sample.objects.create(**{
+        'sample_id': sample_id,
+        'name': 'Line A',
+        'sample_type': 'IPSC',
+        'storage_location': 'Freezer 1',
+        'quantity': 5,
+        **fields,
+    })
+
+
+class InventoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('staff')
+
+    def test_withdraw_updates_quantity_version_and_ledger(self):
+        sample = make_sample(quantity=5)
+        entry, status = inventory.withdraw(sample.pk, 2, user=self.user, note='Thawed')
+        sample.refresh_from_db()
+        self.assertEqual(sample.quantity, 3)
+        self.assertEqual(status, 'AVAILABLE')
+        self.assertEqual(sample.version, 2)
+        self.assertEqual((entry.kind, entry.amount, entry.quantity_after, entry.performed_by),
+                         (SampleTransaction.WITHDRAWAL, 2, 3, self.user))
+
+    def test_withdrawal_larger_than_stock_is_refused(self):
+        sample = make_sample(quantity=1)
+        with self.assertRaises(inventory.InsufficientQuantity) as raised:
+            inventory.withdraw(sample.pk, 2)
+        self.assertEqual(raised.exception.available, 1)
+        sample.refresh_from_db()
+        self.assertEqual((sample.quantity, sample.version), (1, 1))
+        self.assertFalse(SampleTransaction.objects.exists())
+
+    def test_fractional_withdrawals_empty_the_sample(self):
+        sample = make_sample(quantity=0.3)
+        inventory.withdraw(sample.pk, 0.1)
+        inventory.withdraw(sample.pk, 0.1)
+        entry, status = inventory.withdraw(sample.pk, 0.1)
+        sample.refresh_from_db()
+        self.assertEqual(sample.quantity, 0)
+        self.assertEqual(entry.quantity_after, 0)
+        self.assertEqual((status, sample.status), ('DEPLETED', 'DEPLETED'))
+
+    def test_withdrawal_within_rounding_of_stock_is_allowed(self):
+        # A balance left by float arithmetic before quantities were rounded
+        sample = make_sample(quantity=0.3 - 0.1 - 0.1)
+        entry, status = inventory.withdraw(sample.pk, 0.1)
+        self.assertEqual((entry.quantity_after, status), (0, 'DEPLETED'))
+
+    def test_deposit_makes_a_depleted_sample_available(self):
+        sample = make_sample(quantity=0, status='DEPLETED')
+        entry, status = inventory.deposit(sample.pk, 0.2)
+        inventory.deposit(sample.pk, 0.1)
+        sample.refresh_from_db()
+        self.assertEqual(status, 'AVAILABLE')
+        self.assertEqual(sample.quantity, 0.3)
+
+    def test_amount_must_be_positive(self):
+        sample = make_sample()
+        with self.assertRaises(ValueError):
+            inventory.withdraw(sample.pk, 0)
+        with self.assertRaises(ValueError):
+            inventory.deposit(sample.pk, -1)
+
+    def test_missing_sample(self):
+        with self.assertRaises(Sample.DoesNotExist):
+            inventory.withdraw(12345, 1)
+
+    def test_withdrawals_and_deposits_are_recorded_in_the_history(self):
+        sample = make_sample(quantity=2)
+        entry, status = inventory.withdraw(sample.pk, 2, user=self.user)
+        record = sample.history.first()
+        self.assertEqual((record.history_type, record.quantity, record.status, record.version),
+                         ('~', 0, 'DEPLETED', 2))
+        self.assertEqual(record.history_user, self.user)
+        self.assertEqual(record.history_date, entry.created_at)
+        self.assertEqual(record.history_change_reason, str(entry))
+        inventory.deposit(sample.pk, 1)
+        self.assertEqual(list(sample.history.values_list('quantity', 'status')),
+                         [(1, 'AVAILABLE'), (0, 'DEPLETED'), (2, 'AVAILABLE')])
+
+
+class InventoryAsOfTests(TestCase):
+    def test_withdrawals_show_in_the_inventory_as_of_a_date(self):
+        sample = make_sample(quantity=2)
+        before = timezone.now()
+        inventory.withdraw(sample.pk, 2)
+        self.assertEqual(list(inventory_as_of(before).values_list('quantity', 'status')), [(2, 'AVAILABLE')])
+        self.assertEqual(list(inventory_as_of(timezone.now()).values_list('quantity', 'status')), [(0, 'DEPLETED')])
+        self.assertEqual(inventory_as_of(timezone.now()).filter(status='DEPLETED').count(), 1)
+
+    def test_backfill_records_ledger_entries_without_history(self):
+        sample = make_sample(quantity=3, status='DEPLETED')
+        created_at = timezone.now() - timedelta(hours=1)
+        sample.history.update(history_date=created_at)
+        # Entries as withdrawals and deposits wrote them before they wrote history
+        for minutes, kind, amount, after in [(10, 'DEPOSIT', 2, 5), (20, 'WITHDRAWAL', 5, 0)]:
+            entry = SampleTransaction.objects.create(sample=sample, kind=kind, amount=amount, quantity_after=after)
+            SampleTransaction.objects.filter(pk=entry.pk).update(created_at=created_at + timedelta(minutes=minutes))
+        Sample.objects.filter(pk=sample.pk).update(quantity=0, version=3)
+        inventory.deposit(sample.pk, 1)
+
+        migration = importlib.import_module('samples.migrations.0013_backfill_transaction_history')
+        migration.backfill_transaction_history(apps, None)
+        records = sample.history.order_by('history_date')
+        self.assertEqual(list(records.values_list('quantity', 'status', 'version')),
+                         [(3, 'DEPLETED', 1), (5, 'AVAILABLE', 2), (0, 'DEPLETED', 3), (1, 'AVAILABLE', 4)])
+        self.assertEqual(records[1].history_change_reason, 'Deposit 2')
+        self.assertEqual(
+            inventory_as_of(created_at + timedelta(minutes=15)).values_list('quantity', flat=True).get(), 5)
+        # A second run finds nothing left to record
+        migration.backfill_transaction_history(apps, None)
+        self.assertEqual(records.count(), 4)
+
+
+class SnapshotTests(TestCase):
+    def totals(self):
+        return set(InventorySnapshot.objects.filter(date=timezone.localdate())
+                   .values_list('status', 'sample_count', 'total_quantity'))
+
+    def test_withdrawals_move_the_snapshot_counts(self):
+        sample = make_sample(quantity=3)
+        update_snapshots()
+        self.assertEqual(self.totals(), {('AVAILABLE', 1, 3)})
+        inventory.withdraw(sample.pk, 1)
+        update_snapshots()
+        self.assertEqual(self.totals(), {('AVAILABLE', 1, 2)})
+        inventory.withdraw(sample.pk, 2)
+        update_snapshots()
+        self.assertEqual(self.totals(), {('DEPLETED', 1, 0)})
+        update_snapshots(full=True)
+        self.assertEqual(self.totals(), {('DEPLETED', 1, 0)})
+
+    def test_ledger_entries_without_history_are_replayed(self):
+        sample = make_sample(quantity=3)
+        other = make_sample('IPSC-2024-002', quantity=1)
+        update_snapshots()
+        # Loaded straight into the ledger, as withdrawals wrote it before they wrote history
+        entry = SampleTransaction.objects.create(sample=sample, kind='WITHDRAWAL', amount=3, quantity_after=0)
+        SampleTransaction.objects.create(sample=other, kind='DEPOSIT', amount=1, quantity_after=2)
+        update_snapshots()
+        self.assertEqual(self.totals(), {('DEPLETED', 1, 0), ('AVAILABLE', 1, 2)})
+        self.assertEqual(SnapshotWatermark.objects.get().last_transaction_id, entry.pk + 1)
+        self.assertEqual(update_snapshots(), 0)
+        self.assertEqual(self.totals(), {('DEPLETED', 1, 0), ('AVAILABLE', 1, 2)})
+
+
+class PageCacheTests(TestCase):
+    def test_saving_a_sample_bumps_the_data_version_after_commit(self):
+        version = get_data_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            sample = make_sample()
+            self.assertEqual(get_data_version(), version)
+        self.assertGreater(get_data_version(), version)
+        version = get_data_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            sample.delete()
+        self.assertGreater(get_data_version(), version)
+
+
+class ImageArchiveTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.archive_path = os.path.join(directory.name, 'session.zip')
+        # Two megabytes of zeros deflate to a few kilobytes
+        with zipfile.ZipFile(self.archive_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('IPSC-2024-001.tif', bytes(2 * 2**20))
+
+    @override_settings(IMAGE_IMPORT_MAX_FILE_SIZE=2**20)
+    def test_members_over_the_size_limit_are_refused_unread(self):
+        make_sample()
+        result = ImageImportResult()
+        self.assertEqual(match_archive(self.archive_path, result), {})
+        self.assertEqual(result.errors, [('IPSC-2024-001.tif', 'The file is larger than 1 MB uncompressed.')])
+
+    def test_extraction_stops_at_the_size_limit(self):
+        name, data, error, _seconds = images.compress_archive_member(
+            self.archive_path, 'IPSC-2024-001.tif', max_bytes=2**20)
+        self.assertIsNone(data)
+        self.assertEqual(error, 'the file is over the limit of 1 MB uncompressed')
+
+
+class ImageImportTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.media_root = os.path.join(directory.name, 'media')
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.archive_path = os.path.join(directory.name, 'session.zip')
+        output = io.BytesIO()
+        Image.new('RGB', (40, 30), 'white').save(output, 'JPEG')
+        with zipfile.ZipFile(self.archive_path, 'w') as archive:
+            archive.writestr('IPSC-2024-001.jpg', output.getvalue())
+
+    def import_after(self, change):
+        """Import the archive, committing change just before the import writes to the samples
+
+        That is after the import has looked its samples up, and after any
+        read of them that a read-then-write update would make.
+        """
+        pending = [change]
+
+        def change_before_the_first_update(execute, sql, params, many, context):
+            if pending and sql.startswith('UPDATE'):
+                pending.pop()()
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(change_before_the_first_update):
+            return image_import.import_image_archive(self.archive_path, workers=1)
+
+    def test_a_change_committed_after_the_lookup_is_kept(self):
+        sample = make_sample()
+        result = self.import_after(lambda: Sample.objects.filter(pk=sample.pk).update(
+            quantity=2, quality_control_notes='Edited meanwhile', version=5))
+        self.assertEqual(result.attached, ['IPSC-2024-001'])
+        sample.refresh_from_db()
+        self.assertEqual((sample.version, sample.quantity), (6, 2))
+        self.assertEqual(sample.quality_control_notes, 'Edited meanwhile')
+        self.assertTrue(sample.image.name.endswith('.jpg'))
+        record = sample.history.first()
+        self.assertEqual((record.version, record.quantity, record.quality_control_notes, record.image),
+                         (6, 2, 'Edited meanwhile', sample.image.name))
+        self.assertEqual(record.history_change_reason, 'Image import')
+
+    def test_the_image_of_a_sample_deleted_meanwhile_is_removed(self):
+        sample = make_sample()
+        result = self.import_after(lambda: Sample.objects.filter(pk=sample.pk).delete())
+        self.assertEqual(result.attached, [])
+        stored = [name for _root, _dirs, names in os.walk(self.media_root) for name in names]
+        self.assertEqual(stored, [])
+
+
+@override_settings(IMAGE_MAX_PIXELS=1_000_000)
+class ImageLimitTests(TestCase):
+    def upload(self):
+        output = io.BytesIO()
+        Image.new('RGB', (1500, 1000)).save(output, 'PNG')
+        return SimpleUploadedFile('large.png', output.getvalue(), content_type='image/png')
+
+    def test_admin_form_refuses_images_over_the_pixel_limit(self):
+        sample = make_sample()
+        admin = site._registry[Sample]
+        request = type('Request', (), {'user': User.objects.create_superuser('admin')})()
+        Form = admin.get_form(request, sample)
+        data = {field: value for field, value in Sample.objects.filter(pk=sample.pk).values()[0].items()
+                if value is not None}
+        form = Form(data, {'image': self.upload()}, instance=sample)
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors['image'], ['This image is 2 megapixels; the limit is 1 megapixels'])
+
+    def test_saving_an_image_over_the_limit_raises(self):
+        sample = make_sample()
+        sample.image = self.upload()
+        with self.assertRaises(images.ImageTooLarge):
+            sample.save()
+
+
+class AdminSearchTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin'))
+        make_sample(source='Queen Mary Hospital')
+        make_sample('MSC-2024-001', sample_type='MSC', name='Ｌｉｎｅ Ｂ', source='Donor clinic')
+
+    def search(self, url, term):
+        response = self.client.get(url, {'q': term})
+        return sorted({row.sample_id for row in response.context['cl'].result_list})
+
+    def test_sample_search_matches_the_folded_fields_and_source(self):
+        url = '/admin/samples/sample/'
+        self.assertEqual(self.search(url, 'queen mary'), ['IPSC-2024-001'])
+        self.assertEqual(self.search(url, 'line b'), ['MSC-2024-001'])
+        self.assertEqual(self.search(url, 'freezer'), ['IPSC-2024-001', 'MSC-2024-001'])
+
+    def test_history_search_matches_source(self):
+        self.assertEqual(self.search('/admin/samples/historicalsample/', 'donor clinic'), ['MSC-2024-001'])
+
+
+class SampleIdTests(TestCase):
+    def test_ids_are_numbered_per_type_and_year(self):
+        self.assertEqual(allocate_sample_ids('IPSC', year=2024), ['IPSC-2024-001'])
+        self.assertEqual(allocate_sample_ids('IPSC', 3, year=2024), ['IPSC-2024-002', 'IPSC-2024-003', 'IPSC-2024-004'])
+        self.assertEqual(allocate_sample_ids('MSC', year=2024), ['MSC-2024-001'])
+        self.assertEqual(allocate_sample_ids('IPSC', year=2025), ['IPSC-2025-001'])
+
+    def test_first_allocation_skips_existing_ids(self):
+        make_sample('IPSC-2024-007')
+        make_sample('IPSC-2024-custom')
+        self.assertEqual(allocate_sample_ids('IPSC', year=2024), ['IPSC-2024-008'])
+
+    def test_typed_in_ids_move_the_counter_past_them(self):
+        allocate_sample_ids('IPSC', year=2024)
+        assign_sample_id(Sample(sample_id='IPSC-2024-050', sample_type='IPSC'))
+        assign_sample_id(Sample(sample_id='IPSC-2024-020', sample_type='IPSC'))
+        self.assertEqual(SampleIdSequence.objects.get(sample_type='IPSC', year=2024).last_value, 50)
+        self.assertEqual(allocate_sample_ids('IPSC', year=2024), ['IPSC-2024-051'])
+
+    def test_invalid_requests(self):
+        with self.assertRaises(ValueError):
+            allocate_sample_ids('UNKNOWN')
+        with self.assertRaises(ValueError):
+            allocate_sample_ids('IPSC', 0)
+
+    def test_admin_assigns_the_next_id_when_left_blank(self):
+        self.client.force_login(User.objects.create_superuser('admin'))
+        response = self.client.post('/admin/samples/sample/add/', {
+            'sample_id': '', 'name': 'Line A', 'sample_type': 'IPSC', 'storage_location': 'Freezer 1',
+            'status': 'AVAILABLE', 'quantity': 5, 'storage_date': '2024-06-30', 'research_use_only': 'on',
+        })
+        self.assertEqual(response.status_code, 302)
+        year = timezone.localdate().year
+        self.assertEqual(Sample.objects.get().sample_id, f'IPSC-{year}-001')
+
+
+class VersionCheckTests(TestCase):
+    def test_save_at_the_expected_version(self):
+        sample = make_sample()
+        sample.name = 'Line A2'
+        save_if_unchanged(sample, 1)
+        sample.refresh_from_db()
+        self.assertEqual((sample.name, sample.version), ('Line A2', 2))
+        self.assertEqual(sample.history.first().version, 2)
+
+    def test_stale_version_is_refused(self):
+        sample = make_sample()
+        opened = Sample.objects.get(pk=sample.pk)
+        sample.name = 'Line A2'
+        save_if_unchanged(sample, 1)
+        opened.name = 'Line A3'
+        with self.assertRaises(VersionConflict):
+            save_if_unchanged(opened, 1)
+        sample.refresh_from_db()
+        self.assertEqual((sample.name, sample.version), ('Line A2', 2))
+
+    def test_withdrawal_since_the_form_opened_is_a_conflict(self):
+        sample = make_sample(quantity=5)
+        inventory.withdraw(sample.pk, 2)
+        with self.assertRaises(VersionConflict):
+            save_if_unchanged(sample, 1)
+        sample.refresh_from_db()
+        self.assertEqual(sample.quantity, 3)
+
+    def test_base_record_is_the_version_the_edit_started_from(self):
+        sample = make_sample()
+        sample.name = 'Line A2'
+        save_if_unchanged(sample, 1)
+        self.assertEqual(base_record(sample.pk, 1).name, 'Line A')
+        self.assertEqual(base_record(sample.pk, 2).name, 'Line A2')
+
+    def test_three_way_merge(self):
+        base = {'name': 'A', 'quantity': 5, 'status': 'AVAILABLE'}
+        mine = {'name': 'B', 'quantity': 5, 'status': 'IN_USE'}
+        theirs = {'name': 'A', 'quantity': 3, 'status': 'RESERVED'}
+        merged, changes = three_way_merge(base, mine, theirs, ['name', 'quantity', 'status'])
+        self.assertEqual(merged, {'name': 'B', 'quantity': 3, 'status': 'IN_USE'})
+        self.assertEqual({change['field']: change['conflict'] for change in changes},
+                         {'name': False, 'quantity': False, 'status': True})
+
+    def test_edit_form_shows_the_merge_on_conflict(self):
+        self.client.force_login(User.objects.create_superuser('admin'))
+        sample = make_sample(quantity=5)
+        inventory.withdraw(sample.pk, 2)
+        data = {field: value for field, value in Sample.objects.filter(pk=sample.pk).values()[0].items()
+                if value is not None}
+        response = self.client.post(f'/samples/{sample.pk}/edit/', {
+            **data, 'name': 'Line A2', 'quantity': 5, 'version': 1,
+        })
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.context['form'].initial['quantity'], 3)
+        self.assertEqual(response.context['form'].initial['name'], 'Line A2')
+        sample.refresh_from_db()
+        self.assertEqual((sample.name, sample.quantity), ('Line A', 3))
+
+
+class UploadTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        root = override_settings(ATTACHMENT_ROOT=directory.name)
+        root.enable()
+        self.addCleanup(root.disable)
+        self.sample = make_sample()
+
+    def test_chunks_are_appended_and_the_file_stored_once(self):
+        _attachment, session = attachments.start_upload(self.sample, None, 'report.txt', 10)
+        attachments.receive_chunk(session, 0, 6, io.BytesIO(b'hello '))
+        attachments.receive_chunk(session, 6, 10, io.BytesIO(b'labs'))
+        attachment = attachments.complete_upload(session)
+        with attachment.blob.file.open('rb') as file:
+            self.assertEqual(file.read(), b'hello labs')
+        again, session = attachments.start_upload(self.sample, None, 'copy.txt', 10, attachment.blob.sha256)
+        self.assertIsNone(session)
+        self.assertEqual(again.blob, attachment.blob)
+
+    def test_an_offset_can_only_be_claimed_once(self):
+        _attachment, session = attachments.start_upload(self.sample, None, 'report.txt', 10)
+        # Two requests for the same chunk, both read the session before either wrote
+        stale = UploadSession.objects.get(pk=session.pk)
+        attachments.receive_chunk(session, 0, 5, io.BytesIO(b'first'))
+        with self.assertRaises(attachments.OffsetMismatch) as raised:
+            attachments.receive_chunk(stale, 0, 5, io.BytesIO(b'other'))
+        self.assertEqual(raised.exception.offset, 5)
+        with open(attachments.partial_path(session), 'rb') as partial:
+            self.assertEqual(partial.read(), b'first')
+        self.assertEqual(UploadSession.objects.get(pk=session.pk).received, 5)
+
+    def test_chunk_out_of_order_or_past_the_end(self):
+        _attachment, session = attachments.start_upload(self.sample, None, 'report.txt', 10)
+        with self.assertRaises(attachments.OffsetMismatch):
+            attachments.receive_chunk(session, 5, 10, io.BytesIO(b'later'))
+        with self.assertRaises(attachments.InvalidChunk):
+            attachments.receive_chunk(session, 0, 11, io.BytesIO(bytes(11)))
+        with self.assertRaises(attachments.InvalidChunk):
+            attachments.receive_chunk(session, 0, 5, io.BytesIO(b'shor'))
+        self.assertEqual(UploadSession.objects.get(pk=session.pk).received, 0)
+
+    def test_checksum_mismatch_discards_the_upload(self):
+        _attachment, session = attachments.start_upload(self.sample, None, 'report.txt', 5, sha256='0' * 64)
+        attachments.receive_chunk(session, 0, 5, io.BytesIO(b'hello'))
+        with self.assertRaises(attachments.ChecksumMismatch):
+            attachments.complete_upload(session)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(os.path.exists(attachments.partial_path(session)))
+
+
+class QCImportTests(TestCase):
+    export = ['Instrument: Counter 2', 'Sample ID,Viability (%),Notes', 'IPSC-2024-001,92.5,Clumps',
+              'IPSC-2024-999,80,']
+
+    def test_viability_and_notes_are_applied(self):
+        sample = make_sample(quality_control_notes='Mycoplasma negative\n')
+        result = qc_import.import_qc_results(self.export, source='plate1.csv')
+        self.assertEqual(result.updated, ['IPSC-2024-001'])
+        self.assertEqual(result.unmatched, [(4, 'IPSC-2024-999')])
+        sample.refresh_from_db()
+        self.assertEqual(sample.viability, 92.5)
+        self.assertEqual(sample.version, 2)
+        self.assertEqual(sample.quality_control_notes.split('\n'), [
+            'Mycoplasma negative',
+            f'{timezone.localdate():%Y-%m-%d} QC import (plate1.csv): viability 92.5% - Clumps',
+        ])
+        record = sample.history.first()
+        self.assertEqual((record.version, record.quality_control_notes), (2, sample.quality_control_notes))
+
+    def test_a_change_committed_after_the_lookup_is_kept(self):
+        sample = make_sample()
+        lookup = qc_import.fetch_samples_by_sample_id
+
+        def lookup_then_edit(sample_ids):
+            samples = lookup(sample_ids)
+            Sample.objects.filter(pk=sample.pk).update(quality_control_notes='Edited meanwhile', version=5)
+            return samples
+
+        with mock.patch.object(qc_import, 'fetch_samples_by_sample_id', lookup_then_edit):
+            qc_import.import_qc_results(self.export)
+        sample.refresh_from_db()
+        self.assertEqual(sample.version, 6)
+        self.assertTrue(sample.quality_control_notes.startswith('Edited meanwhile\n'))
+
+    def test_dry_run_writes_nothing(self):
+        sample = make_sample()
+        result = qc_import.import_qc_results(self.export, dry_run=True)
+        self.assertEqual(result.updated, ['IPSC-2024-001'])
+        sample.refresh_from_db()
+        self.assertEqual((sample.viability, sample.version), (None, 1))
+
+
+class ConditionalGetTests(TestCase):
+    def test_etag_changes_with_the_csrf_cookie(self):
+        self.client.force_login(User.objects.create_superuser('admin'))
+        make_sample()
+        self.client.cookies[settings.CSRF_COOKIE_NAME] = 'a' * 32
+        etag = self.client.get('/samples/')['ETag']
+        self.assertEqual(self.client.get('/samples/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # As after logging in again, which rotates the token
+        self.client.cookies[settings.CSRF_COOKIE_NAME] = 'b' * 32
+        response = self.client.get('/samples/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class SearchFoldingTests(TestCase):
+    def test_traditional_width_and_case_fold_to_one_spelling(self):
+        self.assertEqual(normalize_search('ＩＰＳＣ 幹細胞 臍帶血'), 'ipsc 干细胞 脐带血')
+        self.assertEqual(normalize_search('顯微鏡 鑰匙 罈'), '显微镜 钥匙 坛')
+
+    def test_table_lists_each_character_once_and_folds_once(self):
+        with open(TRADITIONAL_SIMPLIFIED_FILE, encoding='utf-8') as file:
+            keys = [pair[0] for line in file if not line.startswith('#') for pair in line.split()]
+        self.assertEqual(len(keys), len(set(keys)))
+        self.assertGreater(len(keys), 3000)
+        targets = ''.join(TRADITIONAL_TO_SIMPLIFIED.values())
+        self.assertEqual(targets.translate(TRADITIONAL_TO_SIMPLIFIED), targets)
+
+    def test_table_builder_follows_chains(self):
+        self.assertEqual(resolve({'甲': '乙', '乙': '丙', '丁': '丁'}), {'甲': '丙', '乙': '丙'})
+
+    def test_list_search_matches_either_script(self):
+        self.client.force_login(User.objects.create_superuser('admin'))
+        make_sample(name='臍帶血幹細胞')
+        response = self.client.get('/samples/', {'search': '脐带血'})
+        self.assertEqual([sample.sample_id for sample in response.context['samples']], ['IPSC-2024-001'])
+
+
+class ForecastTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('staff')
+        self.now = timezone.now()
+
+    def fit(self, points, current):
+        """fit_depletion for one sample (pk 1) with (day, quantity) points and its current quantity"""
+        days, quantities = (np.array(values, dtype=np.float64) for values in zip(*points))
+        return forecasting.fit_depletion(np.ones(len(points), dtype=np.int64), days, quantities,
+                                         np.array([1]), np.array([current], dtype=np.float64))
+
+    def backdate(self, sample, days):
+        """Move the sample's last change (its ledger entry, if any, and history record) days back"""
+        record = sample.history.first()
+        when = self.now - timedelta(days=days)
+        SampleTransaction.objects.filter(sample=sample, created_at=record.history_date).update(created_at=when)
+        Sample.history.filter(history_id=record.history_id).update(history_date=when)
+
+    def test_steady_withdrawals_give_the_rate_and_depletion_date(self):
+        sample = make_sample(quantity=12.55)
+        self.backdate(sample, 30)
+        for days in (20, 10, 0):
+            inventory.withdraw(sample.pk, 1, user=self.user)
+            self.backdate(sample, days)
+        self.assertEqual(forecasting.update_forecasts(self.now), 1)
+        forecast = DepletionForecast.objects.get(sample=sample)
+        # 9.55 vials left at 0.1 a day
+        self.assertAlmostEqual(forecast.daily_usage, 0.1)
+        self.assertEqual(forecast.depletion_date, timezone.localdate(self.now) + timedelta(days=96))
+
+    def test_a_withdrawal_is_counted_once(self):
+        sample = make_sample(quantity=5)
+        self.backdate(sample, 2)
+        inventory.withdraw(sample.pk, 1, user=self.user)
+        self.backdate(sample, 1)
+        # Both the ledger and the history hold the withdrawal
+        self.assertEqual(SampleTransaction.objects.count(), 1)
+        self.assertEqual(sample.history.count(), 2)
+        pks, days, quantities = forecasting.load_quantity_series(self.now, 30)
+        self.assertEqual(pks.tolist(), [sample.pk, sample.pk])
+        self.assertEqual(quantities.tolist(), [5, 4])
+        np.testing.assert_allclose(days, [-2, -1])
+
+    def test_deposits_count_as_no_use(self):
+        points = [(-30, 10), (-20, 9), (-10, 15), (-5, 14)]
+        pks, rates, days_left = self.fit(points, 14)
+        # Consumed: 0, 1, 1 (the deposit), 2, and 2 again now
+        expected = np.polyfit([-30, -20, -10, -5, 0], [0, 1, 1, 2, 2], 1)[0]
+        self.assertEqual(pks.tolist(), [1])
+        self.assertAlmostEqual(rates[0], expected)
+        self.assertAlmostEqual(days_left[0], 14 / expected)
+
+    def test_too_few_points_or_no_use_give_no_forecast(self):
+        self.assertEqual(forecasting.MIN_POINTS, 3)
+        # One point and the current quantity
+        self.assertEqual(len(self.fit([(-10, 6)], 5)[0]), 0)
+        self.assertEqual(len(self.fit([(-20, 5), (-10, 5)], 5)[0]), 0)
+        self.assertEqual(len(self.fit([(-20, 5), (-10, 6)], 6)[0]), 0)
+
+    def test_depletion_beyond_the_horizon_has_no_date(self):
+        pks, rates, days_left = self.fit([(-20, 100.2), (-10, 100.1)], 100)
+        self.assertAlmostEqual(rates[0], 0.01)
+        self.assertGreater(100 / rates[0], forecasting.MAX_FORECAST_DAYS)
+        self.assertEqual(days_left.tolist(), [float('inf')])
+        sample = make_sample(quantity=100.2)
+        self.backdate(sample, 20)
+        for days in (10, 0):
+            inventory.withdraw(sample.pk, 0.1, user=self.user)
+            self.backdate(sample, days)
+        forecasting.update_forecasts(self.now)
+        self.assertIsNone(DepletionForecast.objects.get(sample=sample).depletion_date)
+
+
+class QualityTests(TestCase):
+    def setUp(self):
+        # One declining IPSC line, and MSC samples of separate lines with one outlier
+        self.ipsc = [(1, 95), (2, 90), (3, 85), (4, 80), (5, 70)]
+        self.msc = [60, 88, 89, 90, 91, 92]
+        for passage, viability in self.ipsc:
+            make_sample(f'IPSC-2024-{passage:03d}', passage_number=passage, viability=viability)
+        for number, viability in enumerate(self.msc, start=1):
+            make_sample(f'MSC-2024-{number:03d}', name=f'MSC line {number}', sample_type='MSC',
+                        viability=viability)
+
+    def test_quantiles_and_slopes_match_numpy(self):
+        report = quality.analyze_quality()
+        types = {row['sample_type']: row for row in report['types']}
+        passages, viabilities = zip(*self.ipsc)
+        for sample_type, values in (('IPSC', viabilities), ('MSC', self.msc)):
+            expected = np.quantile(values, list(quality.QUANTILES.values()))
+            self.assertEqual(types[sample_type]['count'], len(values))
+            np.testing.assert_allclose([types[sample_type][name] for name in quality.QUANTILES], expected)
+        self.assertAlmostEqual(types['IPSC']['slope'], np.polyfit(passages, viabilities, 1)[0])
+        # No passage numbers recorded
+        self.assertIsNone(types['MSC']['slope'])
+        [line] = report['declining_lines']
+        self.assertEqual((line['name'], line['samples']), ('Line A', 5))
+        self.assertAlmostEqual(line['slope'], np.polyfit(passages, viabilities, 1)[0])
+
+    def test_group_functions_match_numpy_and_allow_empty_groups(self):
+        rng = np.random.default_rng(0)
+        x, y = rng.uniform(0, 20, 40), rng.uniform(50, 100, 40)
+        groups = np.repeat([0, 2], 20)
+        quantiles = quality.group_quantiles(y, groups, 3, [0.1, 0.5, 0.9])
+        slope, intercept, _r_squared, count = quality.group_regression(x, y, groups, 3)
+        for group in (0, 2):
+            members = groups == group
+            np.testing.assert_allclose(quantiles[group], np.quantile(y[members], [0.1, 0.5, 0.9]))
+            np.testing.assert_allclose([slope[group], intercept[group]], np.polyfit(x[members], y[members], 1))
+        self.assertTrue(np.isnan(quantiles[1]).all())
+        self.assertTrue(np.isnan(slope[1]))
+        self.assertEqual(count.tolist(), [20, 0, 20])
+
+    def test_outliers_are_flagged_by_robust_z(self):
+        report = quality.analyze_quality()
+        self.assertEqual(report['outlier_count'], 1)
+        [outlier] = report['outliers']
+        # Median 89.5, median absolute deviation 1.5
+        self.assertEqual((outlier['sample_id'], outlier['type_median']), ('MSC-2024-001', 89.5))
+        self.assertAlmostEqual(outlier['z'], 0.6745 * (60 - 89.5) / 1.5)
+
+    def test_an_empty_bank_renders_the_page(self):
+        Sample.objects.all().delete()
+        report = quality.analyze_quality()
+        self.assertEqual((report['sample_count'], report['types'], report['outliers']), (0, [], []))
+        self.client.force_login(User.objects.create_superuser('admin'))
+        response = self.client.get('/analytics/quality/')
+        self.assertContains(response, 'No samples with a recorded viability')
+
+    def test_report_is_recomputed_after_a_change_or_the_timeout(self):
+        runs = [{'run': number} for number in range(1, 4)]
+        with mock.patch.object(quality, 'analyze_quality', side_effect=runs):
+            self.assertEqual(quality.quality_report(refresh=True), {'run': 1})
+            self.assertEqual(quality.quality_report(), {'run': 1})
+            bump_data_version()
+            self.assertEqual(quality.quality_report(), {'run': 2})
+            self.assertEqual(quality.quality_report(), {'run': 2})
+            expired = time.time() + settings.PAGE_CACHE_TIMEOUT + 1
+            with mock.patch('time.time', return_value=expired):
+                self.assertEqual(quality.quality_report(), {'run': 3})
+
+
+class SampleApiTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin'))
+
+    def test_sparse_fields(self):
+        make_sample()
+        response = self.client.get('/api/v1/samples/', {'fields': 'sample_id,name'})
+        self.assertEqual(response.json()['results'], [{'sample_id': 'IPSC-2024-001', 'name': 'Line A'}])
+        response = self.client.get('/api/v1/samples/', {'fields': 'sample_id,donor_secret'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'Unknown fields: donor_secret')
+        self.assertIn('donor_info', response.json()['allowed'])
+
+    def test_cursor_walks_to_the_end(self):
+        sample_ids = [make_sample(f'IPSC-2024-{number:03d}').sample_id for number in range(1, 6)]
+        seen = []
+        params = {'fields': 'sample_id', 'limit': 2}
+        while True:
+            page = self.client.get('/api/v1/samples/', params).json()
+            seen += [row['sample_id'] for row in page['results']]
+            if page['next_cursor'] is None:
+                break
+            params['cursor'] = page['next_cursor']
+        self.assertEqual(seen, sample_ids)
+        self.assertIsNone(page['next'])
+        # Not base64, and the base64 of a non-number ("abc")
+        for cursor in ('!!!', 'YWJj'):
+            response = self.client.get('/api/v1/samples/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()['error'], 'Invalid cursor.')
+
+    def test_post_with_a_blank_id_is_assigned_one(self):
+        response = self.client.post('/api/v1/samples/', json.dumps({
+            'sample_id': '', 'name': 'Line B', 'sample_type': 'MSC', 'storage_location': 'Freezer 2',
+            'status': 'AVAILABLE', 'quantity': 3, 'storage_date': '2024-06-30', 'research_use_only': True,
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        year = timezone.localdate().year
+        self.assertEqual(response.json()['sample_id'], f'MSC-{year}-001')
+
+    def test_patch_merges_into_the_current_values(self):
+        sample = make_sample(storage_date='2024-06-30')
+        response = self.client.patch(f'/api/v1/samples/{sample.pk}/', json.dumps({'name': 'Line A2'}),
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        row = response.json()
+        self.assertEqual((row['name'], row['storage_location'], row['quantity'], row['version']),
+                         ('Line A2', 'Freezer 1', 5, 2))
+
+    def test_stale_version_is_a_conflict(self):
+        sample = make_sample(storage_date='2024-06-30')
+        inventory.withdraw(sample.pk, 1)
+        data = {'sample_id': 'IPSC-2024-001', 'name': 'Line A2', 'sample_type': 'IPSC',
+                'storage_location': 'Freezer 1', 'status': 'AVAILABLE', 'quantity': 5,
+                'storage_date': '2024-06-30', 'version': 1}
+        for method in (self.client.put, self.client.patch):
+            response = method(f'/api/v1/samples/{sample.pk}/', json.dumps(data), content_type='application/json')
+            self.assertEqual(response.status_code, 409)
+            self.assertEqual(response.json()['version'], 2)
+        sample.refresh_from_db()
+        self.assertEqual((sample.name, sample.quantity), ('Line A', 4))
+
+    def test_responses_are_gzipped_when_accepted(self):
+        for number in range(1, 4):
+            make_sample(f'IPSC-2024-{number:03d}')
+        response = self.client.get('/api/v1/samples/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(json.loads(gzip.decompress(response.content))['count'], 3)
+        response = self.client.get('/api/v1/samples/')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.json()['count'], 3)
+
+
+class SampleLookupTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin'))
+        for number in range(1, 4):
+            make_sample(f'IPSC-2024-{number:03d}')
+
+    def lookup(self, data):
+        return self.client.post('/api/v1/samples/lookup/', json.dumps(data), content_type='application/json')
+
+    def test_found_missing_and_duplicate_ids(self):
+        response = self.lookup({'sample_ids': ['IPSC-2024-003', ' IPSC-2024-001', 'IPSC-2024-999',
+                                               'IPSC-2024-003']})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([row['sample_id'] for row in data['found']], ['IPSC-2024-003', 'IPSC-2024-001'])
+        self.assertEqual(data['found'][0]['storage_location'], 'Freezer 1')
+        self.assertEqual(data['missing'], ['IPSC-2024-999'])
+        self.assertEqual(data['duplicates'], ['IPSC-2024-003'])
+
+    def test_barcodes_key(self):
+        data = self.lookup({'barcodes': ['IPSC-2024-002']}).json()
+        self.assertEqual([row['sample_id'] for row in data['found']], ['IPSC-2024-002'])
+
+    @mock.patch('samples.api.MAX_LOOKUP_IDS', 3)
+    def test_too_many_ids_are_refused(self):
+        response = self.lookup({'sample_ids': ['IPSC-2024-001'] * 4})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'At most 3 IDs per request.')
+
+    def test_ids_must_be_strings(self):
+        for sample_ids in ([None, 5], ['IPSC-2024-001', {'id': 1}], 'IPSC-2024-001'):
+            response = self.lookup({'sample_ids': sample_ids})
+            self.assertEqual(response.status_code, 400)
+
+
+class AutocompleteTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin'))
+        # Saves bump the version on commit, which never comes in a TestCase;
+        # a new version keeps answers cached by other tests out
+        bump_data_version()
+
+    def suggest(self, query):
+        response = self.client.get('/api/v1/samples/autocomplete/', {'q': query})
+        return [row['sample_id'] for row in response.json()['results']]
+
+    def test_ids_match_in_either_case_and_names_in_either_script(self):
+        make_sample('IPSC-2024-001', name='臍帶血幹細胞')
+        make_sample('MSC-2024-001', name='Ｂone marrow')
+        self.assertEqual(self.suggest('ipsc-2024'), ['IPSC-2024-001'])
+        self.assertEqual(self.suggest('脐带'), ['IPSC-2024-001'])
+        self.assertEqual(self.suggest('BONE'), ['MSC-2024-001'])
+        # A prefix, not a substring
+        self.assertEqual(self.suggest('2024'), [])
+        self.assertEqual(self.suggest('干细胞'), [])
+
+    def test_upper_bound_after_the_highest_character(self):
+        self.assertEqual(prefix_upper_bound('ab'), 'ac')
+        self.assertEqual(prefix_upper_bound('a\U0010ffff'), 'b')
+        self.assertEqual(prefix_upper_bound('a\ud7ff'), 'a\ue000')
+        self.assertIsNone(prefix_upper_bound('\U0010ffff'))
+        for sample_id in ('A\U0010ffff', 'A\U0010ffffB', 'B', '\U0010ffff\U0010ffff'):
+            make_sample(sample_id)
+        rows = Sample.objects.all()
+        self.assertEqual([row['sample_id'] for row in prefix_range(rows, 'sample_id', 'A', 10)],
+                         ['A\U0010ffff', 'A\U0010ffffB'])
+        self.assertEqual([row['sample_id'] for row in prefix_range(rows, 'sample_id', '\U0010ffff', 10)],
+                         ['\U0010ffff\U0010ffff'])
+
+    def test_results_are_limited(self):
+        for number in range(1, AUTOCOMPLETE_LIMIT + 3):
+            make_sample(f'IPSC-2024-{number:03d}', name=f'IPSC line {number}')
+        self.assertEqual(len(prefix_range(Sample.objects.all(), 'sample_id', 'IPSC', 3)), 3)
+        self.assertEqual(self.suggest('IPSC'), [f'IPSC-2024-{number:03d}' for number in range(1, 11)])
+
+    def test_cached_answer_is_replaced_when_the_data_version_changes(self):
+        make_sample()
+        self.assertEqual(self.suggest('IPSC'), ['IPSC-2024-001'])
+        # update() sends no signal, so the cached answer is still served
+        Sample.objects.update(sample_id='MSC-2024-001')
+        self.assertEqual(self.suggest('IPSC'), ['IPSC-2024-001'])
+        bump_data_version()
+        self.assertEqual(self.suggest('IPSC'), [])
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        shared = override_settings(METRICS_DIR=self.directory)
+        shared.enable()
+        self.addCleanup(shared.disable)
+        # Start from empty metrics in this process
+        for patcher in (mock.patch.object(metrics, '_counters', {}), mock.patch.object(metrics, '_histograms', {})):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def flush_as(self, pid, rows, duration, hit):
+        """Record metrics as worker pid and write its file, leaving nothing in this process"""
+        with mock.patch.object(metrics, '_counters', {}), mock.patch.object(metrics, '_histograms', {}), \
+                mock.patch('os.getpid', return_value=pid):
+            metrics.inc('export_rows_total', rows)
+            metrics.observe('export_duration_seconds', duration)
+            metrics.record_cache('sample_list', hit)
+            metrics.flush(force=True)
+
+    def test_workers_are_summed(self):
+        self.flush_as(101, 5, 0.02, hit=True)
+        self.flush_as(102, 7, 3.0, hit=False)
+        self.assertEqual(sorted(os.listdir(self.directory)), ['metrics_101.json', 'metrics_102.json'])
+        # This process's own values are read live, not from its file
+        metrics.inc('export_rows_total', 1)
+        lines = metrics.render().splitlines()
+        self.assertIn('export_rows_total 13', lines)
+        self.assertIn('export_duration_seconds_bucket{le="0.025"} 1', lines)
+        self.assertIn('export_duration_seconds_bucket{le="5"} 2', lines)
+        self.assertIn('export_duration_seconds_bucket{le="+Inf"} 2', lines)
+        self.assertIn('export_duration_seconds_sum 3.02', lines)
+        self.assertIn('export_duration_seconds_count 2', lines)
+        self.assertIn('cache_requests_total{cache="sample_list",result="hit"} 1', lines)
+        self.assertIn('cache_hit_ratio{cache="sample_list"} 0.5', lines)
+
+    def test_only_admins_and_allowed_addresses_may_scrape(self):
+        outside = {'REMOTE_ADDR': '192.0.2.10'}
+        self.assertEqual(self.client.get('/metrics', **outside).status_code, 403)
+        self.client.force_login(User.objects.create_user('staff'))
+        self.assertEqual(self.client.get('/metrics', **outside).status_code, 403)
+        self.client.force_login(User.objects.create_superuser('admin'))
+        response = self.client.get('/metrics', **outside)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('# TYPE export_rows_total counter', response.content.decode())
+        self.client.logout()
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='127.0.0.1').status_code, 200)
+
+
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin'))
+        self.sample = make_sample()
+        # A replica is configured, but reads only record where they would go:
+        # the test database has no second connection
+        self.routes = []
+        db_for_read = routers.ReadReplicaRouter.db_for_read
+
+        def record_route(router, model, **hints):
+            self.routes.append(db_for_read(router, model, **hints))
+            return None
+
+        for patcher in (mock.patch.object(routers, 'replica_configured', return_value=True),
+                        mock.patch.object(routers.ReadReplicaRouter, 'db_for_read', record_route)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def read_routes(self):
+        """Where the sample list reads samples from, rendered afresh"""
+        bump_data_version()
+        self.routes = []
+        self.assertEqual(self.client.get('/samples/').status_code, 200)
+        return set(self.routes)
+
+    def test_reads_go_to_the_replica_except_just_after_a_write(self):
+        self.assertIn('replica', self.read_routes())
+        response = self.client.patch(f'/api/v1/samples/{self.sample.pk}/', json.dumps({'name': 'Line A2'}),
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.read_routes(), {None})
+        later = time.time() + settings.REPLICA_STICKY_SECONDS + 1
+        with mock.patch('time.time', return_value=later):
+            self.assertIn('replica', self.read_routes())
+
+    def test_views_not_listed_read_from_the_primary(self):
+        # The edit form must start from the current version
+        self.assertEqual(self.client.get(f'/samples/{self.sample.pk}/edit/').status_code, 200)
+        self.assertTrue(self.routes)
+        self.assertEqual(set(self.routes), {None})
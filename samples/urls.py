@@ -1,6 +1,6 @@
 from django.urls import path
 from django.views.i18n import set_language
-from . import views
+from . import views, async_views, api
 
 urlpatterns = [
     # Authentication
@@ -8,7 +8,8 @@ urlpatterns = [
     path('logout/', views.logout_view, name='logout'),
     
     # Dashboard (home)
-    path('dashboard/', views.home, name='home'),
+    path('dashboard/', async_views.home, name='home'),
+    path('dashboard/events/', async_views.dashboard_events, name='dashboard_events'),
     
     # Sample management
     path('samples/', views.sample_list, name='sample_list'),
@@ -16,13 +17,36 @@ urlpatterns = [
     path('samples/create/', views.sample_create, name='sample_create'),
     path('samples/<int:pk>/edit/', views.sample_update, name='sample_update'),
     path('samples/<int:pk>/delete/', views.sample_delete, name='sample_delete'),
+    path('samples/<int:pk>/transactions/', views.sample_transaction, name='sample_transaction'),
+    path('samples/<int:pk>/attachments/<int:attachment_pk>/', views.attachment_download, name='attachment_download'),
+    path('samples/<int:pk>/attachments/<int:attachment_pk>/delete/', views.attachment_delete,
+         name='attachment_delete'),
+    path('samples/qc-import/', views.qc_import, name='qc_import'),
+    path('samples/image-import/', views.image_import, name='image_import'),
     
     # Export
     path('samples/export/', views.export_samples, name='export_samples'),
+    path('samples/export/csv/', async_views.export_samples_csv, name='export_samples_csv'),
+    
+    # Analytics
+    path('analytics/quality/', views.quality_analytics, name='quality_analytics'),
     
     # Site settings
     path('settings/', views.site_settings_view, name='site_settings'),
     
+    # JSON API
+    path('api/v1/samples/', api.sample_collection, name='api_sample_list'),
+    path('api/v1/samples/<int:pk>/', api.sample_resource, name='api_sample_detail'),
+    path('api/v1/samples/<int:pk>/transactions/', api.sample_transactions, name='api_sample_transactions'),
+    path('api/v1/samples/<int:pk>/attachments/', api.sample_attachments, name='api_sample_attachments'),
+    path('api/v1/uploads/<uuid:upload_id>/', api.attachment_upload, name='api_attachment_upload'),
+    path('api/v1/sample-ids/', api.reserve_sample_ids, name='api_reserve_sample_ids'),
+    path('api/v1/samples/lookup/', api.sample_lookup, name='api_sample_lookup'),
+    path('api/v1/samples/autocomplete/', api.sample_autocomplete, name='api_sample_autocomplete'),
+    
+    # Runtime metrics (Prometheus format)
+    path('metrics', views.metrics_view, name='metrics'),
+    
     # Language switching (using Django's built-in view)
     path('i18n/setlang/', set_language, name='set_language'),
 ]
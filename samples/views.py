@@ -3,15 +3,35 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib import messages
-from django.db.models import Q, Count
-from django.http import HttpResponse
-from django.utils.translation import gettext as _
+from django.db.models import Q, Count, Max
+from django.http import FileResponse, HttpResponse, HttpResponseForbidden, StreamingHttpResponse
+from django.conf import settings as django_settings
+from django.utils.translation import gettext as _, get_language
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_POST
 from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+from django.utils.http import content_disposition_header
 from datetime import timedelta
+import hashlib
+import io
+import time
 from openpyxl import Workbook
 from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-from .models import Sample, SiteSettings
-from .forms import SampleForm, SiteSettingsForm
+from .models import DepletionForecast, Sample, SampleAttachment, SampleTransaction, SiteSettings
+from .forms import AttachmentUploadForm, ImageImportForm, QCImportForm, SampleForm, SampleTransactionForm, SiteSettingsForm
+from . import inventory, metrics
+from .concurrency import VersionConflict, base_record, save_if_unchanged, three_way_merge
+from .sequences import assign_sample_id
+from .cache import get_data_version
+from .search import SEARCH_FIELDS, normalize_search
+from .history import inventory_as_of, parse_as_of
+from .snapshots import inventory_trend
+from .forecasting import running_out
+from . import quality
+from .qc_import import QCFileError, import_qc_results
+from .image_import import import_image_archive, uploaded_archive
+from . import attachments
 
 
 # Permission checking functions
@@ -25,6 +45,94 @@ def is_admin(user):
     return user.is_authenticated and user.is_superuser
 
 
+def filter_samples(samples, params):
+    """Apply the sample list search/type/status filters from query parameters
+
+    Shared by the list view, the Excel export and the JSON API so all three
+    always select the same rows.
+    """
+    # Matches sample ID, name, description, type and location, ignoring case,
+    # full/half width and Traditional/Simplified differences
+    search = params.get('search', '').strip()
+    search_query = normalize_search(search)
+    if search_query and samples.model is Sample:
+        samples = samples.filter(search_text__contains=search_query)
+    elif search_query:
+        # History records have no folded search column; match the text as
+        # typed and folded, ignoring case only
+        match = Q()
+        for field in SEARCH_FIELDS:
+            match |= Q(**{f'{field}__icontains': search}) | Q(**{f'{field}__icontains': search_query})
+        samples = samples.filter(match)
+    
+    sample_type = params.get('type', '')
+    if sample_type:
+        samples = samples.filter(sample_type=sample_type)
+    
+    status = params.get('status', '')
+    if status:
+        samples = samples.filter(status=status)
+    
+    return samples
+
+
+# Conditional GET helpers (ETag / Last-Modified)
+HistoricalSample = Sample.history.model
+
+
+def _make_etag(request, *parts):
+    """Hash the given parts with everything else the rendered page depends on
+
+    That includes the CSRF cookie: pages embed forms with a token derived
+    from it, and it changes on login, so a page cached before would post a
+    stale token.
+    """
+    key = '|'.join(str(part) for part in (
+        *parts, SiteSettings.get_settings().updated_at, request.user.pk, get_language(), request.get_full_path(),
+        request.COOKIES.get(django_settings.CSRF_COOKIE_NAME, ''),
+    ))
+    return hashlib.md5(key.encode()).hexdigest()
+
+
+def _has_pending_messages(request):
+    # len() does not mark messages as read, unlike iterating them
+    return len(messages.get_messages(request)) > 0
+
+
+def sample_list_etag(request):
+    if _has_pending_messages(request):
+        return None
+    return _make_etag(request, 'sample_list', get_data_version())
+
+
+def sample_detail_etag(request, pk):
+    if _has_pending_messages(request):
+        return None
+    updated_at = sample_detail_last_modified(request, pk)
+    if updated_at is None:
+        return None  # Let the view return its 404
+    latest_history = HistoricalSample.objects.filter(id=pk).aggregate(
+        latest=Max('history_id'))['latest']
+    # Attachments are added and removed without saving the sample
+    attached = SampleAttachment.objects.filter(sample_id=pk).aggregate(count=Count('id'), latest=Max('id'))
+    return _make_etag(request, 'sample_detail', pk, updated_at.isoformat(), latest_history,
+                      attached['count'], attached['latest'])
+
+
+def sample_detail_last_modified(request, pk):
+    # The page also shows the depletion forecast, recomputed without saving
+    # the sample, and the attachments
+    row = Sample.objects.filter(pk=pk).annotate(latest_attachment=Max('attachments__uploaded_at')).values_list(
+        'updated_at', 'depletion_forecast__computed_at', 'latest_attachment').first()
+    if row is None:
+        return None
+    return max(moment for moment in row if moment is not None)
+
+
+def export_samples_etag(request):
+    return _make_etag(request, 'export_samples', get_data_version())
+
+
 # Authentication views
 def login_view(request):
     """Login view - main entry point"""
@@ -63,21 +171,21 @@ def logout_view(request):
     return redirect('login')
 
 
-# Dashboard - Home view (requires login)
-@login_required
-def home(request):
-    """Dashboard home page - shows summary statistics"""
-    today = timezone.now().date()
+# Dashboard data (rendered by the async home view in async_views.py)
+def dashboard_context(today):
+    """Template context for the dashboard; every value is lazy"""
     seven_days_ago = today - timedelta(days=7)
-    thirty_days_ago = today - timedelta(days=30)
     
-    # Get statistics
-    total_samples = Sample.objects.count()
-    available_samples = Sample.objects.filter(status='AVAILABLE').count()
-    in_use_samples = Sample.objects.filter(status='IN_USE').count()
-    depleted_samples = Sample.objects.filter(status='DEPLETED').count()
-    reserved_samples = Sample.objects.filter(status='RESERVED').count()
-    quarantine_samples = Sample.objects.filter(status='QUARANTINE').count()
+    # Statistics are evaluated lazily, so nothing runs when the dashboard
+    # fragment is served from the page cache
+    stats = SimpleLazyObject(lambda: Sample.objects.aggregate(
+        total=Count('id'),
+        available=Count('id', filter=Q(status='AVAILABLE')),
+        in_use=Count('id', filter=Q(status='IN_USE')),
+        depleted=Count('id', filter=Q(status='DEPLETED')),
+        reserved=Count('id', filter=Q(status='RESERVED')),
+        quarantine=Count('id', filter=Q(status='QUARANTINE')),
+    ))
     
     # Samples by type
     samples_by_type = Sample.objects.values('sample_type').annotate(
@@ -102,56 +210,50 @@ def home(request):
         quantity__gt=0
     ).order_by('quantity')[:5]
     
-    context = {
+    # Samples projected to run out soon (update_depletion_forecasts)
+    running_out_soon = running_out(today, django_settings.DEPLETION_FORECAST_HORIZON_DAYS)[:5]
+    
+    # Daily totals for the trend chart, from the snapshot table
+    trend = SimpleLazyObject(lambda: inventory_trend(django_settings.INVENTORY_TREND_DAYS))
+    
+    return {
         'today': today,
-        'total_samples': total_samples,
-        'available_samples': available_samples,
-        'in_use_samples': in_use_samples,
-        'depleted_samples': depleted_samples,
-        'reserved_samples': reserved_samples,
-        'quarantine_samples': quarantine_samples,
+        'stats': stats,
         'samples_by_type': samples_by_type,
         'recent_samples': recent_samples,
         'expiring_soon': expiring_soon,
         'low_stock': low_stock,
+        'running_out': running_out_soon,
+        'inventory_trend': trend,
         'sample_types': dict(Sample.SAMPLE_TYPE_CHOICES),
     }
-    return render(request, 'samples/home.html', context)
 
 
 # Sample management views - require authentication
 @login_required
 @user_passes_test(is_staff_or_admin, login_url='login')
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=sample_list_etag)
 def sample_list(request):
-    """List all samples - for lab staff and admins"""
-    samples = Sample.objects.select_related('created_by').all()
-    
-    # Search functionality
-    search_query = request.GET.get('search', '')
-    if search_query:
-        samples = samples.filter(
-            Q(sample_id__icontains=search_query) |
-            Q(name__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(sample_type__icontains=search_query) |
-            Q(storage_location__icontains=search_query)
-        )
-    
-    # Filter by type
-    sample_type = request.GET.get('type', '')
-    if sample_type:
-        samples = samples.filter(sample_type=sample_type)
-    
-    # Filter by status
-    status = request.GET.get('status', '')
-    if status:
-        samples = samples.filter(status=status)
+    """List all samples - for lab staff and admins
+
+    With ``?as_of=<date>`` the list shows the inventory as it was at the end
+    of that day, deleted samples included (see history.py).
+    """
+    as_of = parse_as_of(request.GET.get('as_of'))
+    if as_of:
+        records = filter_samples(inventory_as_of(as_of), request.GET)
+        # Sample objects for the template; built only if the page is not cached
+        samples = SimpleLazyObject(lambda: list(records.as_instances()))
+    else:
+        samples = filter_samples(Sample.objects.select_related('created_by').all(), request.GET)
     
     context = {
         'samples': samples,
-        'search_query': search_query,
-        'selected_type': sample_type,
-        'selected_status': status,
+        'as_of': as_of,
+        'search_query': request.GET.get('search', ''),
+        'selected_type': request.GET.get('type', ''),
+        'selected_status': request.GET.get('status', ''),
         'sample_types': Sample.SAMPLE_TYPE_CHOICES,
         'status_choices': Sample.STATUS_CHOICES,
     }
@@ -160,16 +262,26 @@ def sample_list(request):
 
 @login_required
 @user_passes_test(is_staff_or_admin, login_url='login')
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=sample_detail_etag, last_modified_func=sample_detail_last_modified)
 def sample_detail(request, pk):
     """View sample details - for lab staff and admins"""
     sample = get_object_or_404(Sample, pk=pk)
     
     # Get history for this sample
     history = sample.history.all()[:20]  # Last 20 changes
+    transactions = sample.transactions.select_related('performed_by')[:20]
+    forecast = DepletionForecast.objects.filter(sample=sample).first()
+    sample_attachments = sample.attachments.select_related('blob', 'uploaded_by')
     
     return render(request, 'samples/sample_detail.html', {
         'sample': sample,
         'history': history,
+        'transactions': transactions,
+        'forecast': forecast,
+        'attachments': sample_attachments,
+        'transaction_form': SampleTransactionForm(),
+        'attachment_form': AttachmentUploadForm(),
     })
 
 
@@ -182,6 +294,7 @@ def sample_create(request):
         if form.is_valid():
             sample = form.save(commit=False)
             sample.created_by = request.user
+            assign_sample_id(sample)
             sample.save()
             messages.success(request, _('Sample %(sample_id)s created successfully!') % {'sample_id': sample.sample_id})
             return redirect('sample_detail', pk=sample.pk)
@@ -204,7 +317,13 @@ def sample_update(request, pk):
     if request.method == 'POST':
         form = SampleForm(request.POST, request.FILES, instance=sample)
         if form.is_valid():
-            form.save()
+            expected_version = form.cleaned_data['version']
+            if expected_version is None:
+                expected_version = sample.version
+            try:
+                save_if_unchanged(form.save(commit=False), expected_version)
+            except VersionConflict:
+                return sample_conflict(request, pk, form, expected_version)
             messages.success(request, _('Sample %(sample_id)s updated successfully!') % {'sample_id': sample.sample_id})
             return redirect('sample_detail', pk=sample.pk)
     else:
@@ -218,6 +337,52 @@ def sample_update(request, pk):
     })
 
 
+def display_value(field, value):
+    """Human-readable form of a merge value for the conflict table"""
+    if value is None or value == '':
+        return '-'
+    if isinstance(value, bool):
+        return _('Yes') if value else _('No')
+    choices = getattr(field, 'choices', None)
+    if choices:
+        return dict(choices).get(value, value)
+    return value
+
+
+def sample_conflict(request, pk, form, expected_version):
+    """Edit page prefilled with a three-way merge after a version conflict"""
+    current = get_object_or_404(Sample, pk=pk)
+    fields = [name for name in SampleForm.Meta.fields if name != 'image']
+    base = base_record(pk, expected_version)
+    merged, changes = three_way_merge(
+        {name: getattr(base, name) for name in fields} if base else {},
+        {name: form.cleaned_data.get(name) for name in fields},
+        {name: getattr(current, name) for name in fields},
+        fields,
+    )
+    for change in changes:
+        field = form.fields[change['field']]
+        change['label'] = field.label
+        for side in ('base', 'mine', 'theirs', 'merged'):
+            change[side] = display_value(field, change[side])
+    
+    # Unbound, so the merged values are shown and the new version is carried
+    merged_form = SampleForm(initial=merged, instance=current)
+    latest = current.history.select_related('history_user').first()
+    return render(request, 'samples/sample_form.html', {
+        'form': merged_form,
+        'sample': current,
+        'title': _('Edit Sample: %(sample_id)s') % {'sample_id': current.sample_id},
+        'button_text': _('Update Sample'),
+        'conflict': {
+            'changes': changes,
+            'latest': latest,
+            'has_conflicts': any(change['conflict'] for change in changes),
+            'image_dropped': 'image' in request.FILES,
+        },
+    }, status=409)
+
+
 @login_required
 @user_passes_test(is_staff_or_admin, login_url='login')
 def sample_delete(request, pk):
@@ -233,50 +398,97 @@ def sample_delete(request, pk):
     return render(request, 'samples/sample_confirm_delete.html', {'sample': sample})
 
 
-# Export functionality
+def attachment_etag(request, pk, attachment_pk):
+    # Content-addressed, so the checksum identifies the bytes exactly
+    return SampleAttachment.objects.filter(pk=attachment_pk, sample_id=pk).values_list(
+        'blob__sha256', flat=True).first()
+
+
 @login_required
 @user_passes_test(is_staff_or_admin, login_url='login')
-def export_samples(request):
-    """Export samples to Excel file"""
-    # Get selected sample IDs and columns from request
-    sample_ids = request.GET.getlist('samples')
-    columns = request.GET.getlist('columns')
-    
-    # Default columns if none selected
-    if not columns:
-        columns = ['sample_id', 'name', 'sample_type', 'status', 'quantity', 
-                   'storage_location', 'viability', 'collection_date', 'expiration_date']
-    
-    # Get samples (filtered if IDs provided)
-    if sample_ids:
-        samples = Sample.objects.filter(pk__in=sample_ids)
+@cache_control(private=True)
+@condition(etag_func=attachment_etag)
+def attachment_download(request, pk, attachment_pk):
+    """Download an attachment, or one byte range of it (Range header) to resume"""
+    attachment = get_object_or_404(SampleAttachment.objects.select_related('blob'), pk=attachment_pk, sample_id=pk)
+    blob = attachment.blob
+    byte_range = None
+    requested = request.headers.get('Range')
+    # If-Range: only send part of the file if it is still the version the client has
+    if requested and request.headers.get('If-Range', f'"{blob.sha256}"') == f'"{blob.sha256}"':
+        try:
+            byte_range = attachments.parse_range(requested, blob.size)
+        except attachments.RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{blob.size}'
+            return response
+    
+    file = blob.file.storage.open(blob.file.name, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, as_attachment=True, filename=attachment.filename,
+                                content_type=attachment.content_type or None)
     else:
-        # Apply same filters as list view
-        samples = Sample.objects.all()
-        
-        search_query = request.GET.get('search', '')
-        if search_query:
-            samples = samples.filter(
-                Q(sample_id__icontains=search_query) |
-                Q(name__icontains=search_query) |
-                Q(description__icontains=search_query)
-            )
-        
-        sample_type = request.GET.get('type', '')
-        if sample_type:
-            samples = samples.filter(sample_type=sample_type)
-        
-        status = request.GET.get('status', '')
-        if status:
-            samples = samples.filter(status=status)
-    
-    # Create workbook
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Samples"
-    
-    # Column definitions with display names
-    column_names = {
+        start, end = byte_range
+        response = StreamingHttpResponse(attachments.read_range(file, start, end), status=206,
+                                         content_type=attachment.content_type or 'application/octet-stream')
+        response['Content-Range'] = f'bytes {start}-{end - 1}/{blob.size}'
+        response['Content-Length'] = end - start
+        response['Content-Disposition'] = content_disposition_header(True, attachment.filename)
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+@login_required
+@user_passes_test(is_staff_or_admin, login_url='login')
+@require_POST
+def attachment_delete(request, pk, attachment_pk):
+    """Remove an attachment from a sample"""
+    attachment = get_object_or_404(SampleAttachment, pk=attachment_pk, sample_id=pk)
+    attachments.remove_attachment(attachment)
+    messages.success(request, _('Attachment %(filename)s deleted.') % {'filename': attachment.filename})
+    return redirect('sample_detail', pk=pk)
+
+
+@login_required
+@user_passes_test(is_staff_or_admin, login_url='login')
+@require_POST
+def sample_transaction(request, pk):
+    """Withdraw or deposit vials without editing the whole sample"""
+    sample = get_object_or_404(Sample, pk=pk)
+    form = SampleTransactionForm(request.POST)
+    if not form.is_valid():
+        for errors in form.errors.values():
+            messages.error(request, errors[0])
+        return redirect('sample_detail', pk=sample.pk)
+    
+    kind = form.cleaned_data['kind']
+    amount = form.cleaned_data['amount']
+    apply = inventory.withdraw if kind == SampleTransaction.WITHDRAWAL else inventory.deposit
+    try:
+        entry, status = apply(sample.pk, amount, user=request.user, note=form.cleaned_data['note'])
+    except inventory.InsufficientQuantity as exc:
+        messages.error(request, str(exc))
+        return redirect('sample_detail', pk=sample.pk)
+    
+    if kind == SampleTransaction.WITHDRAWAL:
+        messages.success(request, _('Withdrew %(amount)s vials from %(sample_id)s; %(quantity)s left.') % {
+            'amount': f'{amount:g}', 'sample_id': sample.sample_id, 'quantity': f'{entry.quantity_after:g}'})
+    else:
+        messages.success(request, _('Deposited %(amount)s vials into %(sample_id)s; %(quantity)s in stock.') % {
+            'amount': f'{amount:g}', 'sample_id': sample.sample_id, 'quantity': f'{entry.quantity_after:g}'})
+    if status == 'DEPLETED':
+        messages.warning(request, _('Sample %(sample_id)s is now depleted.') % {'sample_id': sample.sample_id})
+    return redirect('sample_detail', pk=sample.pk)
+
+
+# Export functionality
+EXPORT_DEFAULT_COLUMNS = ['sample_id', 'name', 'sample_type', 'status', 'quantity',
+                          'storage_location', 'viability', 'collection_date', 'expiration_date']
+
+
+def export_column_names():
+    """Column headers in the active language"""
+    return {
         'sample_id': _('Sample ID'),
         'name': _('Sample Name'),
         'sample_type': _('Sample Type'),
@@ -297,6 +509,72 @@ def export_samples(request):
         'created_at': _('Created At'),
         'updated_at': _('Updated At'),
     }
+
+
+def export_request(params):
+    """Columns and samples selected by the export form's query parameters"""
+    # Default columns if none selected
+    columns = params.getlist('columns') or EXPORT_DEFAULT_COLUMNS
+    
+    # Inventory at a past moment, as history records with the same fields
+    as_of = parse_as_of(params.get('as_of'))
+    samples = inventory_as_of(as_of) if as_of else Sample.objects.all()
+    
+    # Get samples (filtered if IDs provided)
+    sample_ids = params.getlist('samples')
+    if sample_ids:
+        samples = samples.filter(id__in=sample_ids)
+    else:
+        # Apply same filters as list view
+        samples = filter_samples(samples, params)
+    if 'created_by' in columns:
+        samples = samples.select_related('created_by')
+    return columns, samples
+
+
+def export_labels():
+    """Translated display values, resolved once per export instead of per cell"""
+    return {
+        'sample_type': {value: str(label) for value, label in Sample.SAMPLE_TYPE_CHOICES},
+        'status': {value: str(label) for value, label in Sample.STATUS_CHOICES},
+        'research_use_only': {True: _('Yes'), False: _('No')},
+    }
+
+
+def export_value(sample, col_key, labels):
+    """Display value of one export cell"""
+    value = getattr(sample, col_key, '')
+    
+    # Handle special fields
+    if col_key in labels:
+        value = labels[col_key].get(value, value)
+    elif col_key == 'created_by':
+        value = sample.created_by.username if sample.created_by else ''
+    elif hasattr(value, 'strftime'):
+        value = value.strftime('%Y-%m-%d')
+    elif hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    
+    return str(value) if value else ''
+
+
+@login_required
+@user_passes_test(is_staff_or_admin, login_url='login')
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=export_samples_etag)
+def export_samples(request):
+    """Export samples to Excel file"""
+    start = time.perf_counter()
+    columns, samples = export_request(request.GET)
+    
+    # Create workbook
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Samples"
+    
+    # Column definitions with display names
+    column_names = export_column_names()
+    labels = export_labels()
     
     # Style definitions
     header_font = Font(bold=True, color='FFFFFF')
@@ -318,25 +596,11 @@ def export_samples(request):
         cell.border = thin_border
     
     # Write data
+    row_count = 0
     for row_idx, sample in enumerate(samples, 2):
+        row_count += 1
         for col_idx, col_key in enumerate(columns, 1):
-            value = getattr(sample, col_key, '')
-            
-            # Handle special fields
-            if col_key == 'sample_type':
-                value = sample.get_sample_type_display()
-            elif col_key == 'status':
-                value = sample.get_status_display()
-            elif col_key == 'created_by':
-                value = sample.created_by.username if sample.created_by else ''
-            elif col_key == 'research_use_only':
-                value = _('Yes') if value else _('No')
-            elif hasattr(value, 'strftime'):
-                value = value.strftime('%Y-%m-%d')
-            elif hasattr(value, 'isoformat'):
-                value = value.isoformat()
-            
-            cell = ws.cell(row=row_idx, column=col_idx, value=str(value) if value else '')
+            cell = ws.cell(row=row_idx, column=col_idx, value=export_value(sample, col_key, labels))
             cell.border = thin_border
     
     # Adjust column widths
@@ -350,9 +614,77 @@ def export_samples(request):
     response['Content-Disposition'] = f'attachment; filename=samples_export_{timezone.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
     
     wb.save(response)
+    metrics.observe('export_duration_seconds', time.perf_counter() - start, format='xlsx')
+    metrics.inc('export_rows_total', row_count, format='xlsx')
     return response
 
 
+@login_required
+@user_passes_test(is_staff_or_admin, login_url='login')
+def qc_import(request):
+    """Apply viability results from a cell counter export to many samples at once"""
+    result = None
+    if request.method == 'POST':
+        form = QCImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            dry_run = form.cleaned_data['dry_run']
+            # Read the upload line by line; utf-8-sig drops a BOM from Excel
+            lines = io.TextIOWrapper(upload.file, encoding='utf-8-sig', errors='replace', newline='')
+            try:
+                result = import_qc_results(lines, user=request.user, source=upload.name, dry_run=dry_run)
+            except QCFileError as e:
+                form.add_error('file', str(e))
+            else:
+                if dry_run:
+                    messages.info(request, _('%(count)d samples would be updated.') % {'count': len(result.updated)})
+                else:
+                    messages.success(request, _('%(count)d samples updated.') % {'count': len(result.updated)})
+    else:
+        form = QCImportForm()
+    
+    return render(request, 'samples/qc_import.html', {
+        'form': form,
+        'result': result,
+    })
+
+
+@login_required
+@user_passes_test(is_staff_or_admin, login_url='login')
+def image_import(request):
+    """Attach a ZIP of images named by sample ID to their samples"""
+    result = None
+    if request.method == 'POST':
+        form = ImageImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['archive']
+            with uploaded_archive(upload) as path:
+                result = import_image_archive(path, user=request.user, source=upload.name)
+            messages.success(request, _('%(count)d images attached.') % {'count': len(result.attached)})
+    else:
+        form = ImageImportForm()
+    
+    return render(request, 'samples/image_import.html', {
+        'form': form,
+        'result': result,
+    })
+
+
+@login_required
+@user_passes_test(is_staff_or_admin, login_url='login')
+def quality_analytics(request):
+    """Viability and passage analytics - for lab staff and admins"""
+    # Lazy, so nothing is computed when the page fragment is cached
+    report = SimpleLazyObject(quality.quality_report)
+    return render(request, 'samples/quality.html', {
+        'report': report,
+        'sample_types': dict(Sample.SAMPLE_TYPE_CHOICES),
+        'min_line_samples': quality.MIN_LINE_SAMPLES,
+        'decline_per_passage': quality.DECLINE_PER_PASSAGE,
+        'outlier_z': quality.OUTLIER_Z,
+    })
+
+
 # Site settings view (admin only)
 @login_required
 @user_passes_test(is_admin, login_url='login')
@@ -373,3 +705,12 @@ def site_settings_view(request):
         'form': form,
         'settings': settings,
     })
+
+
+# Metrics endpoint (admins or localhost scrapers)
+def metrics_view(request):
+    """Expose runtime metrics in the Prometheus text format"""
+    remote_addr = request.META.get('REMOTE_ADDR')
+    if not (is_admin(request.user) or remote_addr in django_settings.METRICS_ALLOWED_IPS):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')